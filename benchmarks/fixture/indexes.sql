@@ -0,0 +1,80 @@
+/**
+  Keys and indexes of the synthetic Chado fixture, created by generate_fixture.py after
+  the data has been loaded.
+ */
+alter table organism add primary key (organism_id);
+alter table db add primary key (db_id);
+alter table dbxref add primary key (dbxref_id);
+alter table cv add primary key (cv_id);
+alter table cvterm add primary key (cvterm_id);
+alter table cvterm_dbxref add primary key (cvterm_dbxref_id);
+alter table cvtermprop add primary key (cvtermprop_id);
+alter table dbxrefprop add primary key (dbxrefprop_id);
+alter table pub add primary key (pub_id);
+alter table pubprop add primary key (pubprop_id);
+alter table feature add primary key (feature_id);
+alter table featureloc add primary key (featureloc_id);
+alter table featureprop add primary key (featureprop_id);
+alter table feature_pub add primary key (feature_pub_id);
+alter table feature_cvterm add primary key (feature_cvterm_id);
+alter table feature_cvtermprop add primary key (feature_cvtermprop_id);
+alter table synonym add primary key (synonym_id);
+alter table feature_synonym add primary key (feature_synonym_id);
+alter table feature_relationship add primary key (feature_relationship_id);
+alter table feature_relationshipprop add primary key (feature_relationshipprop_id);
+alter table feature_dbxref add primary key (feature_dbxref_id);
+alter table grp add primary key (grp_id);
+alter table grpmember add primary key (grpmember_id);
+alter table grpmemberprop add primary key (grpmemberprop_id);
+alter table feature_grpmember add primary key (feature_grpmember_id);
+alter table feature_grpmember_pub add primary key (feature_grpmember_pub_id);
+alter table grp_cvterm add primary key (grp_cvterm_id);
+alter table grp_synonym add primary key (grp_synonym_id);
+alter table grp_pub add primary key (grp_pub_id);
+alter table genotype add primary key (genotype_id);
+alter table stock add primary key (stock_id);
+alter table stock_genotype add primary key (stock_genotype_id);
+alter table strain add primary key (strain_id);
+alter table strain_synonym add primary key (strain_synonym_id);
+alter table strain_pub add primary key (strain_pub_id);
+alter table cell_line add primary key (cell_line_id);
+alter table cell_line_synonym add primary key (cell_line_synonym_id);
+alter table cell_line_pub add primary key (cell_line_pub_id);
+alter table humanhealth add primary key (humanhealth_id);
+alter table humanhealth_synonym add primary key (humanhealth_synonym_id);
+alter table humanhealth_pub add primary key (humanhealth_pub_id);
+alter table library add primary key (library_id);
+alter table library_synonym add primary key (library_synonym_id);
+alter table library_pub add primary key (library_pub_id);
+alter table library_feature add primary key (library_feature_id);
+alter table library_featureprop add primary key (library_featureprop_id);
+create unique index db_name_key on db (name);
+create unique index cv_name_key on cv (name);
+create unique index pub_uniquename_key on pub (uniquename);
+create index dbxref_idx2 on dbxref (accession);
+create index cvterm_idx_name on cvterm (name);
+create unique index feature_c1 on feature (organism_id, uniquename, type_id);
+create index feature_idx_uniquename on feature (uniquename);
+create index feature_name_ind1 on feature (name);
+create index featureloc_idx1 on featureloc (feature_id);
+create index featureloc_idx2 on featureloc (srcfeature_id);
+create index featureprop_idx1 on featureprop (feature_id);
+create index feature_pub_idx1 on feature_pub (feature_id);
+create index feature_cvterm_idx1 on feature_cvterm (feature_id);
+create index feature_cvtermprop_idx1 on feature_cvtermprop (feature_cvterm_id);
+create index feature_synonym_idx1 on feature_synonym (feature_id);
+create index feature_relationship_idx1 on feature_relationship (subject_id);
+create index feature_relationship_idx2 on feature_relationship (object_id);
+create index feature_relationshipprop_idx1 on feature_relationshipprop (feature_relationship_id);
+create index feature_dbxref_idx1 on feature_dbxref (feature_id);
+create index feature_dbxref_idx2 on feature_dbxref (dbxref_id);
+create index binloc_boxrange on featureloc using gist (boxrange(fmin, fmax));
+create index feature_synonym_idx2 on feature_synonym (synonym_id);
+create index feature_pub_idx2 on feature_pub (pub_id);
+create index feature_cvterm_idx2 on feature_cvterm (cvterm_id);
+create index featureprop_idx2 on featureprop (type_id);
+create index dbxrefprop_idx1 on dbxrefprop (dbxref_id);
+create index grp_idx1 on grp (uniquename);
+create index grpmember_idx1 on grpmember (grp_id);
+create index feature_grpmember_idx1 on feature_grpmember (feature_id);
+create index feature_grpmember_idx2 on feature_grpmember (grpmember_id);
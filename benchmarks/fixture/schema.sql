@@ -0,0 +1,358 @@
+/**
+  Tables of the synthetic Chado fixture used by the benchmark suite (see generate_fixture.py).
+
+  This is the subset of the GMOD Chado schema used by the scripts and functions in this
+  repository.  Primary keys, indexes, and the featureloc_slice index are created by
+  indexes.sql after the data has been loaded, and foreign keys are left out, so that COPY
+  does not have to maintain them row by row.
+ */
+create table organism (
+    organism_id serial,
+    abbreviation varchar(255),
+    genus varchar(255) not null,
+    species varchar(255) not null,
+    common_name varchar(255),
+    comment text
+);
+create table db (
+    db_id serial,
+    name varchar(255) not null,
+    description varchar(255),
+    urlprefix varchar(255),
+    url varchar(255)
+);
+create table dbxref (
+    dbxref_id serial,
+    db_id int not null,
+    accession varchar(1024) not null,
+    version varchar(255) not null default '',
+    description text
+);
+create table cv (
+    cv_id serial,
+    name varchar(255) not null,
+    definition text
+);
+create table cvterm (
+    cvterm_id serial,
+    cv_id int not null,
+    name varchar(1024) not null,
+    definition text,
+    dbxref_id int,
+    is_obsolete int not null default 0,
+    is_relationshiptype int not null default 0
+);
+create table cvterm_dbxref (
+    cvterm_dbxref_id serial,
+    cvterm_id int not null,
+    dbxref_id int not null,
+    is_for_definition int not null default 0
+);
+create table cvtermprop (
+    cvtermprop_id serial,
+    cvterm_id int not null,
+    type_id int not null,
+    value text not null default '',
+    rank int not null default 0
+);
+create table dbxrefprop (
+    dbxrefprop_id serial,
+    dbxref_id int not null,
+    type_id int not null,
+    value text not null default '',
+    rank int not null default 0
+);
+create table pub (
+    pub_id serial,
+    title text,
+    volumetitle text,
+    volume varchar(255),
+    series_name varchar(255),
+    issue varchar(255),
+    pyear varchar(255),
+    pages varchar(255),
+    miniref varchar(255),
+    uniquename text not null,
+    type_id int not null,
+    is_obsolete boolean default false,
+    publisher varchar(255),
+    pubplace varchar(255)
+);
+create table pubprop (
+    pubprop_id serial,
+    pub_id int not null,
+    type_id int not null,
+    value text not null,
+    rank int
+);
+create table feature (
+    feature_id serial,
+    dbxref_id int,
+    organism_id int not null,
+    name varchar(255),
+    uniquename text not null,
+    residues text,
+    seqlen int,
+    md5checksum char(32),
+    type_id int not null,
+    is_analysis boolean not null default false,
+    is_obsolete boolean not null default false,
+    timeaccessioned timestamp not null default now(),
+    timelastmodified timestamp not null default now()
+);
+create table featureloc (
+    featureloc_id serial,
+    feature_id int not null,
+    srcfeature_id int,
+    fmin int,
+    is_fmin_partial boolean not null default false,
+    fmax int,
+    is_fmax_partial boolean not null default false,
+    strand smallint,
+    phase int,
+    residue_info text,
+    locgroup int not null default 0,
+    rank int not null default 0
+);
+create table featureprop (
+    featureprop_id serial,
+    feature_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+create table feature_pub (
+    feature_pub_id serial,
+    feature_id int not null,
+    pub_id int not null
+);
+create table feature_cvterm (
+    feature_cvterm_id serial,
+    feature_id int not null,
+    cvterm_id int not null,
+    pub_id int not null,
+    is_not boolean not null default false,
+    rank int not null default 0
+);
+create table feature_cvtermprop (
+    feature_cvtermprop_id serial,
+    feature_cvterm_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+create table synonym (
+    synonym_id serial,
+    name varchar(255) not null,
+    type_id int not null,
+    synonym_sgml varchar(255) not null
+);
+create table feature_synonym (
+    feature_synonym_id serial,
+    synonym_id int not null,
+    feature_id int not null,
+    pub_id int not null,
+    is_current boolean not null default false,
+    is_internal boolean not null default false
+);
+create table feature_relationship (
+    feature_relationship_id serial,
+    subject_id int not null,
+    object_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+create table feature_relationshipprop (
+    feature_relationshipprop_id serial,
+    feature_relationship_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+create table feature_dbxref (
+    feature_dbxref_id serial,
+    feature_id int not null,
+    dbxref_id int not null,
+    is_current boolean not null default true
+);
+create table grp (
+    grp_id serial,
+    name varchar(255),
+    uniquename text not null,
+    type_id int not null,
+    is_analysis boolean not null default false,
+    is_obsolete boolean not null default false
+);
+create table grpmember (
+    grpmember_id serial,
+    rank int not null default 0,
+    grp_id int not null,
+    type_id int not null
+);
+create table grpmemberprop (
+    grpmemberprop_id serial,
+    grpmember_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+create table feature_grpmember (
+    feature_grpmember_id serial,
+    grpmember_id int not null,
+    feature_id int not null
+);
+create table feature_grpmember_pub (
+    feature_grpmember_pub_id serial,
+    feature_grpmember_id int not null,
+    pub_id int not null
+);
+create table grp_cvterm (
+    grp_cvterm_id serial,
+    is_not boolean not null default false,
+    rank int not null default 0,
+    cvterm_id int not null,
+    grp_id int not null,
+    pub_id int not null
+);
+create table grp_synonym (
+    grp_synonym_id serial,
+    synonym_id int not null,
+    grp_id int not null,
+    pub_id int not null,
+    is_current boolean not null default false,
+    is_internal boolean not null default false
+);
+create table grp_pub (
+    grp_pub_id serial,
+    grp_id int not null,
+    pub_id int not null
+);
+create table genotype (
+    genotype_id serial,
+    name text,
+    uniquename text not null,
+    description varchar(255),
+    type_id int
+);
+create table stock (
+    stock_id serial,
+    dbxref_id int,
+    organism_id int,
+    name varchar(255),
+    uniquename text not null,
+    description text,
+    type_id int not null,
+    is_obsolete boolean not null default false
+);
+create table stock_genotype (
+    stock_genotype_id serial,
+    stock_id int not null,
+    genotype_id int not null
+);
+create table strain (
+    strain_id serial,
+    name varchar(255),
+    uniquename text not null,
+    organism_id int not null,
+    dbxref_id int,
+    is_obsolete boolean not null default false
+);
+create table strain_synonym (
+    strain_synonym_id serial,
+    strain_id int not null,
+    synonym_id int not null,
+    pub_id int not null,
+    is_current boolean not null default false,
+    is_internal boolean not null default false
+);
+create table strain_pub (
+    strain_pub_id serial,
+    strain_id int not null,
+    pub_id int not null
+);
+create table cell_line (
+    cell_line_id serial,
+    name varchar(255),
+    uniquename varchar(255) not null,
+    organism_id int not null,
+    timeaccessioned timestamp not null default now(),
+    timelastmodified timestamp not null default now()
+);
+create table cell_line_synonym (
+    cell_line_synonym_id serial,
+    cell_line_id int not null,
+    synonym_id int not null,
+    pub_id int not null,
+    is_current boolean not null default false,
+    is_internal boolean not null default false
+);
+create table cell_line_pub (
+    cell_line_pub_id serial,
+    cell_line_id int not null,
+    pub_id int not null
+);
+create table humanhealth (
+    humanhealth_id serial,
+    name varchar(255),
+    uniquename text not null,
+    organism_id int not null,
+    dbxref_id int,
+    is_obsolete boolean not null default false
+);
+create table humanhealth_synonym (
+    humanhealth_synonym_id serial,
+    humanhealth_id int not null,
+    synonym_id int not null,
+    pub_id int not null,
+    is_current boolean not null default false,
+    is_internal boolean not null default false
+);
+create table humanhealth_pub (
+    humanhealth_pub_id serial,
+    humanhealth_id int not null,
+    pub_id int not null
+);
+create table library (
+    library_id serial,
+    organism_id int not null,
+    name varchar(255),
+    uniquename text not null,
+    type_id int not null,
+    is_obsolete boolean not null default false,
+    timeaccessioned timestamp not null default now(),
+    timelastmodified timestamp not null default now()
+);
+create table library_synonym (
+    library_synonym_id serial,
+    synonym_id int not null,
+    library_id int not null,
+    pub_id int not null,
+    is_current boolean not null default true,
+    is_internal boolean not null default false
+);
+create table library_pub (
+    library_pub_id serial,
+    library_id int not null,
+    pub_id int not null
+);
+create table library_feature (
+    library_feature_id serial,
+    library_id int not null,
+    feature_id int not null
+);
+create table library_featureprop (
+    library_featureprop_id serial,
+    library_feature_id int not null,
+    type_id int not null,
+    value text,
+    rank int not null default 0
+);
+
+-- Chado featureloc_slice range search functions.
+create or replace function boxrange(int, int) returns box as
+  'select box(point(0, $1), point($2, 500000000))' language sql immutable;
+create or replace function boxquery(int, int) returns box as
+  'select box(point($1, $2), point($1, $2))' language sql immutable;
+create or replace function featureloc_slice(integer, integer, integer) returns setof featureloc as
+  'select * from featureloc where srcfeature_id = $1 and boxquery($2, $3) <@ boxrange(fmin, fmax)' language sql stable;
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Program: generate_fixture.py
+Description:
+
+Generates a synthetic Chado database for the benchmark suite (see run_benchmarks.py).
+
+The tables in fixture/schema.sql are filled with random but reproducible (--seed) data:
+genes with transcripts, alleles, orthologs, scaffold locations, synonyms, GO annotations,
+publications, summaries, secondary IDs, gene groups, and a few objects of the non feature
+data classes (strains, cell lines, human health models, and libraries).
+
+The size is set with --features, the approximate number of rows in the feature table
+(10k to 10M).  Rows are generated in batches of genes and loaded with COPY, so memory use
+does not grow with the size of the database.  Keys and indexes (fixture/indexes.sql) are
+created after the load and the FlyBase functions are then installed from
+schema/apply-flybase-schema.sql.
+
+Usage:
+./generate_fixture.py --host localhost -U postgres -d chado_fixture --features 100000
+
+# Replace an existing fixture.
+./generate_fixture.py --host localhost -U postgres -d chado_fixture --features 1000000 --reset
+"""
+import argparse
+import io
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+import psycopg2
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SQL = os.path.join(BENCHMARKS_DIR, 'fixture', 'schema.sql')
+INDEXES_SQL = os.path.join(BENCHMARKS_DIR, 'fixture', 'indexes.sql')
+FLYBASE_SCHEMA_SQL = os.path.join(BENCHMARKS_DIR, '..', 'schema', 'apply-flybase-schema.sql')
+
+# Schemas created by the fixture and the FlyBase schema files, dropped by --reset.
+FIXTURE_SCHEMAS = ('flybase', 'gene', 'gene_group', 'humanhealth', 'dataclass', 'dataclass_relationship',
+                   'dataclass_staging', 'dataclass_relationship_staging')
+
+# Expected number of features generated for each gene: the gene, 2 transcripts, 1 allele, and 5 orthologs.
+FEATURES_PER_GENE = 9
+
+# Columns loaded for each table.
+COLUMNS = {
+    'organism': 'organism_id, genus, species',
+    'db': 'db_id, name',
+    'cv': 'cv_id, name',
+    'dbxref': 'dbxref_id, db_id, accession',
+    'cvterm': 'cvterm_id, cv_id, name, dbxref_id',
+    'pub': 'pub_id, uniquename, type_id, is_obsolete, miniref',
+    'feature': 'feature_id, organism_id, name, uniquename, type_id, is_analysis, is_obsolete',
+    'synonym': 'synonym_id, name, type_id, synonym_sgml',
+    'feature_synonym': 'feature_synonym_id, synonym_id, feature_id, pub_id, is_current, is_internal',
+    'featureloc': 'featureloc_id, feature_id, srcfeature_id, fmin, fmax, strand',
+    'feature_cvterm': 'feature_cvterm_id, feature_id, cvterm_id, pub_id, rank',
+    'feature_cvtermprop': 'feature_cvtermprop_id, feature_cvterm_id, type_id, value',
+    'feature_relationship': 'feature_relationship_id, subject_id, object_id, type_id',
+    'feature_relationshipprop': 'feature_relationshipprop_id, feature_relationship_id, type_id, value',
+    'feature_pub': 'feature_pub_id, feature_id, pub_id',
+    'featureprop': 'featureprop_id, feature_id, type_id, value',
+    'dbxrefprop': 'dbxrefprop_id, dbxref_id, type_id, value',
+    'feature_dbxref': 'feature_dbxref_id, feature_id, dbxref_id, is_current',
+    'grp': 'grp_id, name, uniquename, type_id, is_analysis, is_obsolete',
+    'grp_cvterm': 'grp_cvterm_id, cvterm_id, grp_id, pub_id',
+    'grp_synonym': 'grp_synonym_id, synonym_id, grp_id, pub_id, is_current, is_internal',
+    'grp_pub': 'grp_pub_id, grp_id, pub_id',
+    'grpmember': 'grpmember_id, grp_id, type_id',
+    'feature_grpmember': 'feature_grpmember_id, grpmember_id, feature_id',
+    'strain': 'strain_id, name, uniquename, organism_id, is_obsolete',
+    'strain_synonym': 'strain_synonym_id, strain_id, synonym_id, pub_id, is_current, is_internal',
+    'strain_pub': 'strain_pub_id, strain_id, pub_id',
+    'cell_line': 'cell_line_id, name, uniquename, organism_id',
+    'cell_line_synonym': 'cell_line_synonym_id, cell_line_id, synonym_id, pub_id, is_current, is_internal',
+    'cell_line_pub': 'cell_line_pub_id, cell_line_id, pub_id',
+    'humanhealth': 'humanhealth_id, name, uniquename, organism_id, is_obsolete',
+    'humanhealth_synonym': 'humanhealth_synonym_id, humanhealth_id, synonym_id, pub_id, is_current, is_internal',
+    'humanhealth_pub': 'humanhealth_pub_id, humanhealth_id, pub_id',
+    'library': 'library_id, organism_id, name, uniquename, type_id, is_obsolete',
+    'library_synonym': 'library_synonym_id, synonym_id, library_id, pub_id, is_current, is_internal',
+    'library_pub': 'library_pub_id, library_id, pub_id',
+}
+
+ORGANISMS = [('Drosophila', 'melanogaster'), ('Homo', 'sapiens'), ('Mus', 'musculus'), ('Rattus', 'norvegicus'),
+             ('Danio', 'rerio'), ('Xenopus', 'tropicalis'), ('Caenorhabditis', 'elegans'),
+             ('Saccharomyces', 'cerevisiae'), ('Schizosaccharomyces', 'pombe'), ('Arabidopsis', 'thaliana')]
+DBS = ['FlyBase', 'UniProt/Swiss-Prot', 'InteractiveFly', 'FBcv', 'GO']
+CVTERMS = {
+    'SO': ['gene', 'mRNA', 'miRNA', 'golden_path', 'allele', 'protein', 'ortholog'],
+    'property type': ['evidence_code', 'NOT', 'gene_summary_text', 'uniprot_function_comment', 'if_summary', 'DIOPT'],
+    'synonym type': ['symbol', 'fullname'],
+    'relationship type': ['orthologous_to', 'alleleof', 'associated_with'],
+    'pub type': ['paper', 'review', 'personal communication to FlyBase'],
+    'grpmember type': ['grpmember_feature'],
+    'FlyBase miscellaneous CV': [],
+    'library type': ['cDNA library'],
+}
+GO_ASPECTS = ['biological_process', 'molecular_function', 'cellular_component']
+GO_TERMS_PER_ASPECT = 30
+EVIDENCE_CODES = ['inferred from direct assay', 'inferred from mutant phenotype', 'inferred from electronic annotation',
+                  'inferred from high throughput direct assay', 'inferred from sequence similarity']
+# Scaffold names and lengths.
+SCAFFOLDS = [('2L', 23_000_000), ('2R', 25_000_000), ('3L', 28_000_000), ('3R', 32_000_000), ('X', 23_000_000)]
+# Non feature data classes: table, ID prefix, and whether the table has an is_obsolete column to load.
+OTHER_CLASSES = [('strain', 'FBsn', True), ('cell_line', 'FBtc', False), ('humanhealth', 'FBhh', True),
+                 ('library', 'FBlc', None)]
+
+
+def format_value(value):
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if value is None:
+        return '\\N'
+    return str(value)
+
+
+def read_psql_script(path: str):
+    """
+    Reads a psql script, replacing each \\ir include with the contents of the included file.
+
+    :param path: Path to the psql script.
+    :return: The SQL of the script and all included files.
+    """
+    sql = []
+    with open(path, 'r') as fh:
+        for line in fh:
+            match = re.match(r'^\\ir\s+(\S+)\s*$', line)
+            if match:
+                sql.append(read_psql_script(os.path.join(os.path.dirname(path), match.group(1))))
+            else:
+                sql.append(line)
+    return ''.join(sql) + '\n'
+
+
+class FixtureLoader:
+    """
+    Buffers generated rows by table and loads them with COPY.
+    """
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.buffers = {}
+        self.ids = Counter()
+        self.counts = Counter()
+
+    def next_id(self, table: str):
+        self.ids[table] += 1
+        return self.ids[table]
+
+    def add(self, table: str, *values):
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            buffer = self.buffers[table] = io.StringIO()
+        buffer.write('\t'.join(map(format_value, values)) + '\n')
+        self.counts[table] += 1
+
+    def insert(self, table: str, *values):
+        """
+        Adds a row with the next primary key of the table.
+
+        :return: The primary key of the row.
+        """
+        row_id = self.next_id(table)
+        self.add(table, row_id, *values)
+        return row_id
+
+    def flush(self):
+        """
+        Loads all buffered rows.
+        """
+        for table, buffer in self.buffers.items():
+            buffer.seek(0)
+            self.cur.copy_expert(f'copy {table} ({COLUMNS[table]}) from stdin', buffer)
+        self.buffers = {}
+
+    def set_sequences(self):
+        """
+        Moves the serial sequences past the generated primary keys.
+        """
+        for table, last_id in self.ids.items():
+            if table in COLUMNS:
+                self.cur.execute(f"select setval(pg_get_serial_sequence('{table}', '{table}_id'), %s)", (last_id,))
+
+
+class FixtureGenerator:
+    """
+    Generates the synthetic Chado data.
+    """
+
+    def __init__(self, loader: FixtureLoader, genes: int, seed: int = 42):
+        self.loader = loader
+        self.num_genes = genes
+        self.rnd = random.Random(seed)
+        self.organisms = {}
+        self.dbs = {}
+        self.cvs = {}
+        self.terms = {}
+        self.go_terms = {}
+        self.pubs = []
+        self.scaffolds = []
+        self.genes = []
+
+    def cvterm(self, cv: str, name: str, dbxref_id: int = None):
+        self.terms[name] = self.loader.insert('cvterm', self.cvs[cv], name, dbxref_id)
+        return self.terms[name]
+
+    def vocabularies(self):
+        insert = self.loader.insert
+        for genus, species in ORGANISMS:
+            self.organisms[species] = insert('organism', genus, species)
+        for name in DBS:
+            self.dbs[name] = insert('db', name)
+        for cv in CVTERMS:
+            self.cvs[cv] = insert('cv', cv)
+        for aspect in GO_ASPECTS:
+            self.cvs[aspect] = insert('cv', aspect)
+        for cv, names in CVTERMS.items():
+            for name in names:
+                self.cvterm(cv, name)
+        for aspect in GO_ASPECTS:
+            self.go_terms[aspect] = []
+            for i in range(GO_TERMS_PER_ASPECT):
+                dbxref_id = insert('dbxref', self.dbs['GO'], f'{GO_ASPECTS.index(aspect)}{i:06d}')
+                self.go_terms[aspect].append(self.cvterm(aspect, f'{aspect} term {i}', dbxref_id))
+        # Gene group types, FBcv:0007034 is pathway.
+        self.cvterm('FlyBase miscellaneous CV', 'pathway', insert('dbxref', self.dbs['FBcv'], '0007034'))
+        self.cvterm('FlyBase miscellaneous CV', 'gene group', insert('dbxref', self.dbs['FBcv'], '0007035'))
+
+    def publications(self, num_pubs: int):
+        rnd = self.rnd
+        paper, review = self.terms['paper'], self.terms['review']
+        for _ in range(num_pubs):
+            pub_id = self.loader.next_id('pub')
+            self.loader.add('pub', pub_id, f'FBrf{pub_id:07d}', paper if rnd.random() < 0.67 else review,
+                            rnd.random() < 0.02, f'Author, A., {pub_id}, J. Fly {pub_id % 100}: {pub_id % 1000}')
+            self.pubs.append(pub_id)
+        # Pubs without an FBrf ID are not counted by the pub count functions.
+        self.multipub = self.loader.insert('pub', 'multipub_1', paper, False, None)
+
+    def feature(self, species: str, uniquename: str, type_name: str, name: str = None, obsolete: bool = False):
+        return self.loader.insert('feature', self.organisms[species], name or uniquename, uniquename,
+                                  self.terms[type_name], False, obsolete)
+
+    def synonym(self, linker: str, object_id: int, text: str, type_name: str = 'symbol', current: bool = True):
+        synonym_id = self.loader.insert('synonym', text, self.terms[type_name], text)
+        # The linker tables do not agree on the order of the object and synonym columns.
+        if linker in ('feature_synonym', 'grp_synonym', 'library_synonym'):
+            self.loader.insert(linker, synonym_id, object_id, self.pubs[0], current, False)
+        else:
+            self.loader.insert(linker, object_id, synonym_id, self.pubs[0], current, False)
+        return synonym_id
+
+    def gene(self, number: int):
+        """
+        Generates a gene and its transcripts, alleles, orthologs, annotations, and summaries.
+
+        :param number: The gene number, from 1.
+        """
+        rnd = self.rnd
+        insert = self.loader.insert
+        terms = self.terms
+        gene_id = self.feature('melanogaster', f'FBgn{number:07d}', 'gene', obsolete=rnd.random() < 0.03)
+        self.genes.append(gene_id)
+        self.synonym('feature_synonym', gene_id, f'gene{number}')
+        if rnd.random() < 0.3:
+            self.synonym('feature_synonym', gene_id, f'oldgene{number}', current=False)
+        self.synonym('feature_synonym', gene_id, f'gene name {number}', 'fullname')
+
+        # Location and transcripts.
+        scaffold_id, scaffold_length = rnd.choice(self.scaffolds)
+        start = rnd.randrange(0, scaffold_length - 100000)
+        if rnd.random() < 0.95:
+            insert('featureloc', gene_id, scaffold_id, start, start + rnd.randrange(500, 50000), 1)
+        for t in range(rnd.randrange(1, 4)):
+            transcript_type = 'miRNA' if rnd.random() < 0.1 else 'mRNA'
+            transcript_id = self.feature('melanogaster', f'FBtr{self.loader.next_id("fbtr"):07d}', transcript_type,
+                                         obsolete=rnd.random() < 0.02)
+            self.synonym('feature_synonym', transcript_id, f'gene{number}-R{chr(65 + t)}')
+            transcript_start = start + rnd.randrange(0, 5000)
+            insert('featureloc', transcript_id, scaffold_id, transcript_start,
+                   transcript_start + rnd.randrange(200, 20000), 1)
+
+        # Alleles.
+        for a in range(rnd.randrange(0, 3)):
+            allele_id = self.feature('melanogaster', f'FBal{self.loader.next_id("fbal"):07d}', 'allele')
+            self.synonym('feature_synonym', allele_id, f'gene{number}<sup>{a + 1}</sup>')
+            insert('feature_relationship', allele_id, gene_id, terms['alleleof'])
+            for pub_id in rnd.sample(self.pubs, min(len(self.pubs), rnd.randrange(0, 4))):
+                insert('feature_pub', allele_id, pub_id)
+
+        # GO annotations.
+        for aspect, go_terms in self.go_terms.items():
+            for _ in range(rnd.choice([0, 0, 1, 2, 3])):
+                feature_cvterm_id = self.loader.next_id('feature_cvterm')
+                self.loader.add('feature_cvterm', feature_cvterm_id, gene_id, rnd.choice(go_terms),
+                                rnd.choice(self.pubs), feature_cvterm_id)
+                insert('feature_cvtermprop', feature_cvterm_id, terms['evidence_code'], rnd.choice(EVIDENCE_CODES))
+                if rnd.random() < 0.1:
+                    insert('feature_cvtermprop', feature_cvterm_id, terms['NOT'], '')
+
+        # Orthologs.
+        species = [s for s in self.organisms if s != 'melanogaster']
+        for ortholog_species in rnd.sample(species, rnd.choice([0, 2, 5, 9, 9])):
+            ortholog_id = self.feature(ortholog_species, f'FBog{self.loader.next_id("fbog"):010d}', 'ortholog')
+            relationship_id = insert('feature_relationship', ortholog_id, gene_id, terms['orthologous_to'])
+            insert('feature_relationshipprop', relationship_id, terms['DIOPT'], 'DIOPT')
+
+        # Publications.
+        for pub_id in rnd.sample(self.pubs, min(len(self.pubs), rnd.randrange(0, 6))):
+            insert('feature_pub', gene_id, pub_id)
+        insert('feature_pub', gene_id, self.multipub)
+
+        # Summaries.
+        if rnd.random() < 0.4:
+            insert('featureprop', gene_id, terms['gene_summary_text'], 'snapshot')
+        if rnd.random() < 0.5:
+            dbxref_id = insert('dbxref', self.dbs['UniProt/Swiss-Prot'], f'P{number:07d}')
+            insert('feature_dbxref', gene_id, dbxref_id, True)
+            insert('dbxrefprop', dbxref_id, terms['uniprot_function_comment'], 'function')
+        if rnd.random() < 0.2:
+            dbxref_id = insert('dbxref', self.dbs['InteractiveFly'], f'if{number}')
+            insert('feature_dbxref', gene_id, dbxref_id, True)
+            insert('dbxrefprop', dbxref_id, terms['if_summary'], 'if')
+
+        # Secondary IDs from merges, some of them split between this gene and the previous one.
+        if len(self.genes) > 1 and rnd.random() < 0.05:
+            dbxref_id = insert('dbxref', self.dbs['FlyBase'], f'FBgn{self.num_genes + number:07d}')
+            insert('feature_dbxref', gene_id, dbxref_id, False)
+            if rnd.random() < 0.3:
+                insert('feature_dbxref', self.genes[-2], dbxref_id, False)
+
+    def gene_groups(self):
+        rnd = self.rnd
+        insert = self.loader.insert
+        for g in range(max(self.num_genes // 50, 2)):
+            grp_id = self.loader.next_id('grp')
+            self.loader.add('grp', grp_id, f'group {g}', f'FBgg{grp_id:07d}', self.terms['gene'], False, False)
+            insert('grp_cvterm', self.terms['pathway' if g % 2 else 'gene group'], grp_id, self.pubs[0])
+            self.synonym('grp_synonym', grp_id, f'GG{g}')
+            self.synonym('grp_synonym', grp_id, f'gene group {g}', 'fullname')
+            insert('grp_pub', grp_id, rnd.choice(self.pubs))
+            for gene_id in rnd.sample(self.genes, min(len(self.genes), 10)):
+                grpmember_id = insert('grpmember', grp_id, self.terms['grpmember_feature'])
+                insert('feature_grpmember', grpmember_id, gene_id)
+
+    def other_classes(self):
+        """
+        Generates strains, cell lines, human health models, and libraries with symbols and pubs.
+        """
+        rnd = self.rnd
+        insert = self.loader.insert
+        organism_id = self.organisms['melanogaster']
+        for table, prefix, has_obsolete in OTHER_CLASSES:
+            for i in range(max(self.num_genes // 100, 5)):
+                object_id = self.loader.next_id(table)
+                uniquename = f'{prefix}{object_id:07d}'
+                if table == 'library':
+                    self.loader.add(table, object_id, organism_id, uniquename, uniquename,
+                                    self.terms['cDNA library'], False)
+                elif has_obsolete:
+                    self.loader.add(table, object_id, uniquename, uniquename, organism_id, False)
+                else:
+                    self.loader.add(table, object_id, uniquename, uniquename, organism_id)
+                self.synonym(f'{table}_synonym', object_id, f'{table}{i}')
+                for pub_id in rnd.sample(self.pubs, min(len(self.pubs), rnd.randrange(0, 4))):
+                    insert(f'{table}_pub', object_id, pub_id)
+
+    def generate(self, batch_size: int = 10000, log=sys.stderr):
+        """
+        Generates and loads all of the data.
+
+        :param batch_size: The number of genes to generate between loads.
+        :param log: File handle for progress messages.
+        """
+        self.vocabularies()
+        self.publications(max(self.num_genes // 2, 10))
+        for name, length in SCAFFOLDS:
+            self.scaffolds.append((self.feature('melanogaster', name, 'golden_path'), length))
+        self.loader.flush()
+
+        for number in range(1, self.num_genes + 1):
+            self.gene(number)
+            if number % batch_size == 0:
+                self.loader.flush()
+                print(f"{number} genes, {self.loader.counts['feature']} features", file=log)
+        self.gene_groups()
+        self.other_classes()
+        self.loader.flush()
+        self.loader.set_sequences()
+
+
+def reset_database(cur):
+    """
+    Drops the fixture tables and the schemas created by the FlyBase schema files.
+    """
+    for schema in FIXTURE_SCHEMAS:
+        cur.execute(f'drop schema if exists {schema} cascade')
+    cur.execute('drop schema if exists public cascade')
+    cur.execute('create schema public')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Chado database for benchmarking.')
+    parser.add_argument("--host", help="Chado database hostname.", default="localhost")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="postgres")
+    parser.add_argument("-W", "--password", help="Chado database password.", default="")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="chado")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("--features", help="Approximate number of features to generate. default: 10000",
+                        default=10000, type=int)
+    parser.add_argument("--seed", help="Random seed. default: 42", default=42, type=int)
+    parser.add_argument("--batch-size", help="Number of genes per COPY batch. default: 10000", default=10000, type=int)
+    parser.add_argument("--reset", action="store_true",
+                        help="Drop the public schema and the FlyBase schemas before generating.")
+    parser.add_argument("--no-flybase-schema", action="store_true",
+                        help="Do not install schema/apply-flybase-schema.sql after loading.")
+    args = parser.parse_args()
+
+    if args.features < FEATURES_PER_GENE:
+        parser.error(f'--features must be at least {FEATURES_PER_GENE}.')
+
+    conn = psycopg2.connect(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                            port=args.port)
+    conn.autocommit = True
+    start = time.time()
+    try:
+        with conn.cursor() as cur:
+            if args.reset:
+                reset_database(cur)
+            with open(SCHEMA_SQL, 'r') as fh:
+                cur.execute(fh.read())
+
+            loader = FixtureLoader(cur)
+            generator = FixtureGenerator(loader, args.features // FEATURES_PER_GENE, args.seed)
+            generator.generate(args.batch_size)
+            print(f"Loaded {sum(loader.counts.values())} rows in {time.time() - start:.1f}s", file=sys.stderr)
+
+            with open(INDEXES_SQL, 'r') as fh:
+                cur.execute(fh.read())
+            cur.execute('analyze')
+            if not args.no_flybase_schema:
+                cur.execute(read_psql_script(FLYBASE_SCHEMA_SQL))
+                cur.execute('analyze')
+    finally:
+        conn.close()
+
+    for table in sorted(loader.counts):
+        print(f"{table}\t{loader.counts[table]}")
+    print(f"Generated the fixture in {time.time() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Program: go_counts.py
+Description:
+
+Benchmark harness that compares the per gene and grouped GO term count methods of
+misc/conserved_darkened_genes.py against a locally loaded Chado database.
+
+Each method is run one or more times, the wall time of each run is reported, and the
+resulting DataFrames are checked to be identical.
+
+Usage:
+./go_counts.py --host localhost -U postgres -d chado_fixture --runs 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+from conserved_darkened_genes import fetch_go_counts  # noqa: E402
+
+METHODS = ('per_gene', 'grouped')
+
+
+def time_method(engine, method: str, runs: int = 1):
+    """
+    Runs fetch_go_counts with the given method and times each run.
+
+    :param engine: SQLAlchemy engine for the Chado database.
+    :param method: The fetch_go_counts method to run.
+    :param runs: The number of times to run the method.
+    :return: Tuple of the list of run times in seconds and the DataFrame from the last run.
+    """
+    timings = []
+    df = None
+    with engine.connect() as conn:
+        for _ in range(runs):
+            start = time.perf_counter()
+            df = fetch_go_counts(conn, method=method)
+            timings.append(time.perf_counter() - start)
+    return timings, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare GO count methods on a local Chado database.')
+    parser.add_argument("--host", help="Chado database hostname.", default="localhost")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="postgres")
+    parser.add_argument("-W", "--password", help="Chado database password.", default="")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="chado")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("--runs", help="Number of runs per method.", default=3, type=int)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(args.username, args.password, args.host, args.port, args.dbname),
+        client_encoding='utf8')
+
+    results = {}
+    for method in METHODS:
+        timings, df = time_method(engine, method, args.runs)
+        results[method] = df
+        print("{:<10} rows={:<8} best={:.3f}s mean={:.3f}s".format(
+            method, len(df), min(timings), sum(timings) / len(timings)))
+
+    # Row order is not defined by either query, so compare after sorting.
+    expected, actual = (results[m].sort_values(list(results[m].columns)).sort_index(kind='mergesort') for m in METHODS)
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+    print("Results match.")
+
+
+if __name__ == "__main__":
+    main()
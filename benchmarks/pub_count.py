@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Program: pub_count.py
+Description:
+
+Benchmark harness that compares the per ID flybase.pub_count / flybase.pub_count_by_type
+functions with the set based flybase.pub_counts / flybase.pub_counts_by_type functions
+(see schema/FBrf/main.sql) against a locally loaded Chado database.
+
+The IDs of every current object of a data class are counted with each method.  The wall
+time of each run is reported and the counts are checked to be identical.
+
+Usage:
+./pub_count.py --host localhost -U postgres -d chado_fixture --data-class FBgn --pub-type paper --runs 3
+"""
+import argparse
+import time
+
+import psycopg2
+
+data_class_ids_query = """
+select id from flybase.data_class_pub_counts(%s)
+"""
+
+METHODS = {
+    'per_id': """
+        select i.id, flybase.pub_count(i.id)
+            from unnest(%(ids)s::text[]) as i(id)
+    """,
+    'per_id_by_type': """
+        select i.id, flybase.pub_count_by_type(i.id, %(pub_type)s)
+            from unnest(%(ids)s::text[]) as i(id)
+    """,
+    'set_based': """
+        select id, pub_count
+            from flybase.pub_counts(%(ids)s::text[])
+    """,
+    'set_based_by_type': """
+        select id, pub_count
+            from flybase.pub_counts_by_type(%(ids)s::text[], %(pub_type)s)
+    """,
+}
+
+# Pairs of methods that must return the same counts.
+COMPARISONS = (('per_id', 'set_based'), ('per_id_by_type', 'set_based_by_type'))
+
+
+def time_method(conn, method: str, params: dict, runs: int = 1):
+    """
+    Runs a pub count method and times each run.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param method: The METHODS key to run.
+    :param params: The query parameters.
+    :param runs: The number of times to run the method.
+    :return: Tuple of the list of run times in seconds and the counts from the last run.
+    """
+    timings = []
+    counts = None
+    with conn.cursor() as cur:
+        for _ in range(runs):
+            start = time.perf_counter()
+            cur.execute(METHODS[method], params)
+            counts = dict(cur.fetchall())
+            timings.append(time.perf_counter() - start)
+    return timings, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per ID and set based pub counts on a local Chado database.')
+    parser.add_argument("--host", help="Chado database hostname.", default="localhost")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="postgres")
+    parser.add_argument("-W", "--password", help="Chado database password.", default="")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="chado")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("--data-class", help="Data class of the IDs to count. default: FBgn", default="FBgn")
+    parser.add_argument("--pub-type", help="Pub type for the by type methods. default: paper", default="paper")
+    parser.add_argument("--runs", help="Number of runs per method.", default=3, type=int)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                            port=args.port)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(data_class_ids_query, (args.data_class,))
+            ids = [row[0] for row in cur]
+        params = {'ids': ids, 'pub_type': args.pub_type}
+        print(f"{len(ids)} {args.data_class} IDs")
+
+        results = {}
+        for method in METHODS:
+            timings, counts = time_method(conn, method, params, args.runs)
+            results[method] = counts
+            print("{:<18} rows={:<8} best={:.3f}s mean={:.3f}s".format(
+                method, len(counts), min(timings), sum(timings) / len(timings)))
+    finally:
+        conn.close()
+
+    for expected, actual in COMPARISONS:
+        if results[expected] != results[actual]:
+            raise AssertionError(f"{expected} and {actual} counts differ.")
+    print("Results match.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Program: run_benchmarks.py
+Description:
+
+Runs timed scenarios for the scripts in misc/ and statistics/ and the key functions in
+schema/ against a local Chado database, usually a synthetic one from generate_fixture.py,
+and writes the timings as JSON so that runs can be compared across commits.
+
+Scripts are run as separate processes with their normal command line, except for
+find_overlapping_miRNA_mRNA.py, which is always connected to the public FlyBase database,
+so its lookup functions are called directly.  Schema functions are run from a single
+connection.  The per ID and set based variants of a function are run over the same sample
+of IDs (--ids).
+
+Every scenario is run --runs times.  The results record the commit, the database and
+fixture size, and the time of every run.  A scenario that fails is recorded with its
+error and does not stop the other scenarios.
+
+The scripts build SQLAlchemy URLs from --host, so use a TCP host name rather than a Unix
+socket directory.
+
+Usage:
+./generate_fixture.py --host localhost -U postgres -d chado_fixture --features 100000
+./run_benchmarks.py --host localhost -U postgres -d chado_fixture -o before.json
+git checkout my-branch
+./run_benchmarks.py --host localhost -U postgres -d chado_fixture -o after.json --compare before.json
+
+# Run only the schema function scenarios.
+./run_benchmarks.py -d chado_fixture --scenario 'schema/*'
+
+# Compare two result files without running anything.
+./run_benchmarks.py --compare before.json after.json
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import psycopg2
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MISC_DIR = os.path.join(REPO_DIR, 'misc')
+STATISTICS_DIR = os.path.join(REPO_DIR, 'statistics')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, MISC_DIR)
+
+# Tables counted in the results to describe the size of the fixture.
+FIXTURE_TABLES = ('feature', 'featureloc', 'feature_cvterm', 'feature_synonym', 'feature_relationship', 'pub')
+
+gene_ids_query = """
+select uniquename
+    from feature
+    where uniquename ~ '^FBgn[0-9]+$'
+        and is_obsolete = false
+        and is_analysis = false
+    order by uniquename
+"""
+
+secondary_ids_query = """
+select distinct dbx.accession
+    from feature_dbxref fdbx join dbxref dbx on fdbx.dbxref_id = dbx.dbxref_id
+                             join db on dbx.db_id = db.db_id
+    where db.name = 'FlyBase'
+        and fdbx.is_current = false
+        and dbx.accession ~ '^FBgn[0-9]+$'
+"""
+
+gene_locations_query = """
+select src.name, fl.fmin, fl.fmax
+    from featureloc fl join feature f on fl.feature_id = f.feature_id
+                       join feature src on fl.srcfeature_id = src.feature_id
+    where f.uniquename ~ '^FBgn[0-9]+$'
+        and f.is_obsolete = false
+    order by f.uniquename
+"""
+
+scaffold_ids_query = """
+select src.feature_id, fl.fmin, fl.fmax
+    from featureloc fl join feature f on fl.feature_id = f.feature_id
+                       join feature src on fl.srcfeature_id = src.feature_id
+    where f.uniquename = any(%s)
+"""
+
+
+class BenchmarkContext:
+    """
+    Connection details, inputs, and helpers shared by the scenarios.
+    """
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.conn = psycopg2.connect(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                                     port=args.port)
+        self.conn.autocommit = True
+        self.rnd = None
+        self.inputs = {}
+
+    @property
+    def db_args(self):
+        """
+        Connection arguments for the scripts.
+        """
+        return ['--host', self.args.host, '-U', self.args.username, '-W', self.args.password,
+                '-d', self.args.dbname, '-p', str(self.args.port)]
+
+    def path(self, name: str):
+        return os.path.join(self.workdir, name)
+
+    def run_script(self, script: str, *script_args, stdout: str = None):
+        """
+        Runs a script from the repository in the work directory.
+
+        :param script: Path of the script relative to the repository.
+        :param script_args: Arguments for the script.
+        :param stdout: File name in the work directory for the output. default: discarded
+        """
+        script_path = os.path.join(REPO_DIR, script)
+        command = [sys.executable, script_path] if script.endswith('.py') else [script_path]
+        with open(self.path(stdout) if stdout else os.devnull, 'w') as out:
+            result = subprocess.run(command + list(script_args), cwd=self.workdir, stdout=out,
+                                    stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()
+            raise RuntimeError(f"{script} exited with {result.returncode}: {error[-1] if error else ''}")
+
+    def query(self, sql: str, params=None):
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def input(self, name: str):
+        """
+        Returns an input, creating it on first use with the matching make_* function.  Each input
+        is generated from its own seeded random state, so it does not depend on the scenarios run.
+        """
+        if name not in self.inputs:
+            self.rnd = random.Random(f'{self.args.seed}:{name}')
+            self.inputs[name] = INPUTS[name](self)
+        return self.inputs[name]
+
+    def close(self):
+        self.conn.close()
+
+
+def make_gene_ids(ctx):
+    """
+    A random sample of --ids current gene IDs.
+    """
+    ids = [row[0] for row in ctx.query(gene_ids_query)]
+    return sorted(ctx.rnd.sample(ids, min(len(ids), ctx.args.ids)))
+
+
+def make_all_gene_ids(ctx):
+    return [row[0] for row in ctx.query(gene_ids_query)]
+
+
+def make_id_file(ctx):
+    """
+    A file of current, secondary, and unknown gene IDs for update_ids.
+    """
+    secondary = [row[0] for row in ctx.query(secondary_ids_query)]
+    ids = ctx.input('all_gene_ids') + secondary + [f'FBgn9{n:06d}' for n in range(len(secondary))]
+    ctx.rnd.shuffle(ids)
+    with open(ctx.path('ids.txt'), 'w') as fh:
+        fh.write('\n'.join(ids) + '\n')
+    return ctx.path('ids.txt')
+
+
+def make_location_file(ctx):
+    """
+    A file of --ids scaffold locations around gene locations, in the format of find_overlapping_miRNA_mRNA.py.
+    """
+    locations = ctx.query(gene_locations_query)
+    locations = ctx.rnd.sample(locations, min(len(locations), ctx.args.ids))
+    with open(ctx.path('locations.txt'), 'w') as fh:
+        for scaffold, fmin, fmax in locations:
+            fh.write(f'{scaffold}:{fmin}..{fmin + min(fmax - fmin, 3000)}\n')
+    return ctx.path('locations.txt')
+
+
+def make_slice_locations(ctx):
+    """
+    The scaffold feature ID, fmin, and fmax of the sampled genes for featureloc_slice.
+    """
+    return ctx.query(scaffold_ids_query, (ctx.input('gene_ids'),))
+
+
+def make_alliance_file(ctx):
+    """
+    An Alliance gene description file with descriptions for about half of the genes.
+    """
+    with open(ctx.path('alliance_summaries.tsv'), 'w') as fh:
+        fh.write('# Alliance gene descriptions\n')
+        for fbgn in ctx.input('all_gene_ids'):
+            summary = 'Is involved in something.' if ctx.rnd.random() < 0.5 else 'No description available'
+            fh.write(f'FB:{fbgn}\tsymbol\t{summary}\n')
+    return ctx.path('alliance_summaries.tsv')
+
+
+def make_chado_stats_file(ctx):
+    """
+    The output of gene_summary_stats.sql, as written by psql.
+    """
+    with open(os.path.join(STATISTICS_DIR, 'gene_summary_stats.sql'), 'r') as fh:
+        sql = fh.read()
+    with ctx.conn.cursor() as cur, open(ctx.path('gene_summary_chado_stats.tsv'), 'w') as out:
+        cur.copy_expert(sql.strip().rstrip(';'), out)
+    return ctx.path('gene_summary_chado_stats.tsv')
+
+
+def make_ga_files(ctx):
+    """
+    Google Analytics CSV exports with hits on RedFly and other feature report pages, and the RedFly ID file.
+
+    :return: Tuple of the GA file glob and the RedFly ID file.
+    """
+    ga_dir = ctx.path('ga')
+    os.makedirs(ga_dir, exist_ok=True)
+    redfly_ids = [f'FBsf{n:010d}' for n in range(1, 5001)]
+    with open(ctx.path('redfly_ids.txt'), 'w') as fh:
+        fh.write('\n'.join(redfly_ids) + '\n')
+    rows_per_file = max(ctx.args.ids * 10, 1000)
+    for day in range(10):
+        with open(os.path.join(ga_dir, f'day{day}.csv'), 'w', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(['Page', 'Pageviews', 'Unique Pageviews'])
+            for _ in range(rows_per_file):
+                fbsf = f'FBsf{ctx.rnd.randrange(1, 10001):010d}'
+                writer.writerow([f'/reports/{fbsf}', ctx.rnd.randrange(1, 50), ctx.rnd.randrange(1, 10)])
+    return os.path.join(ga_dir, '*.csv'), ctx.path('redfly_ids.txt')
+
+
+INPUTS = {
+    'gene_ids': make_gene_ids,
+    'all_gene_ids': make_all_gene_ids,
+    'id_file': make_id_file,
+    'location_file': make_location_file,
+    'slice_locations': make_slice_locations,
+    'alliance_file': make_alliance_file,
+    'chado_stats_file': make_chado_stats_file,
+    'ga_files': make_ga_files,
+}
+
+
+def print_overlaps(ctx, mode: str):
+    """
+    Runs the find_overlapping_miRNA_mRNA.py lookup for the location file with output to a file.
+    """
+    import find_overlapping_miRNA_mRNA as overlaps
+    from chadolib.query import ChadoSession
+
+    session = ChadoSession(ctx.conn)
+    with open(ctx.input('location_file'), 'r') as fh, open(ctx.path(f'overlaps_{mode}.tsv'), 'w') as out, \
+            contextlib.redirect_stdout(out):
+        if mode == 'batch':
+            overlaps.print_overlaps_batch(session, fh)
+        else:
+            overlaps.print_overlaps(session, fh)
+
+
+def print_overlaps_snapshot(ctx):
+    import find_overlapping_miRNA_mRNA as overlaps
+    from transcript_index import TranscriptIndex, export_snapshot
+
+    snapshot = ctx.path('transcript_snapshot')
+    shutil.rmtree(snapshot, ignore_errors=True)
+    export_snapshot(ctx.conn, snapshot)
+    with open(ctx.input('location_file'), 'r') as fh, open(ctx.path('overlaps_snapshot.tsv'), 'w') as out, \
+            contextlib.redirect_stdout(out):
+        overlaps.print_overlaps_snapshot(TranscriptIndex.load(snapshot), fh)
+
+
+def per_id(ctx, sql: str, *params):
+    """
+    Runs a query once for each sampled gene ID.
+    """
+    with ctx.conn.cursor() as cur:
+        for gene_id in ctx.input('gene_ids'):
+            cur.execute(sql, (gene_id,) + params)
+            cur.fetchall()
+
+
+def run_data_class_counts(ctx):
+    if subprocess.run(['perl', '-MDBI', '-MDBD::Pg', '-e', '1'], capture_output=True).returncode != 0:
+        raise RuntimeError("Perl with DBI and DBD::Pg is required.")
+    ctx.run_script('statistics/data_class_counts.pl', '--hostname', ctx.args.host, '--username', ctx.args.username,
+                   '--password', ctx.args.password, '--port', str(ctx.args.port), '--database', ctx.args.dbname,
+                   stdout='data_class_counts.tsv')
+
+
+def run_redfly_stats(ctx, *script_args):
+    ga_glob, redfly_file = ctx.input('ga_files')
+    ctx.run_script('statistics/redfly_stats.py', *script_args, '-r', redfly_file, ga_glob, stdout='redfly_stats.tsv')
+
+
+# Scenarios in the order they are run.  Each is a name and a function that takes the
+# BenchmarkContext.  The data class build must run before the scenarios that read the
+# dataclass tables.
+SCENARIOS = [
+    # Schema functions.
+    ('schema/data_classes/build.py', lambda ctx: ctx.run_script(
+        'schema/data_classes/build.py', *ctx.db_args, '-j', str(ctx.args.jobs))),
+    ('schema/refresh_gene_annotation_counts', lambda ctx: ctx.query(
+        'select * from flybase.refresh_gene_annotation_counts(true)')),
+    ('schema/current_symbol', lambda ctx: per_id(ctx, 'select flybase.current_symbol(%s)')),
+    ('schema/current_symbols', lambda ctx: ctx.query(
+        'select * from flybase.current_symbols(%s)', (ctx.input('gene_ids'),))),
+    ('schema/update_ids', lambda ctx: per_id(ctx, 'select * from flybase.update_ids(%s::text)')),
+    ('schema/update_ids_array', lambda ctx: ctx.query(
+        'select * from flybase.update_ids(%s::text[])', (ctx.input('gene_ids'),))),
+    ('schema/pub_count', lambda ctx: per_id(ctx, 'select flybase.pub_count(%s)')),
+    ('schema/pub_counts', lambda ctx: ctx.query(
+        'select * from flybase.pub_counts(%s)', (ctx.input('gene_ids'),))),
+    ('schema/get_featureprop', lambda ctx: per_id(
+        ctx, 'select * from flybase.get_featureprop(%s, %s)', 'gene_summary_text')),
+    ('schema/count_featureprops', lambda ctx: ctx.query(
+        'select * from flybase.count_featureprops(%s, %s)', (ctx.input('gene_ids'), 'gene_summary_text'))),
+    ('schema/get_feature_relationship', lambda ctx: per_id(
+        ctx, "select * from flybase.get_feature_relationship(%s::text, 'orthologous_to', 'FBog', 'object')")),
+    ('schema/get_feature_relationship_array', lambda ctx: ctx.query(
+        "select * from flybase.get_feature_relationship(%s::text[], 'orthologous_to', 'FBog', 'object')",
+        (ctx.input('gene_ids'),))),
+    ('schema/get_gene_ontology_terms', lambda ctx: per_id(
+        ctx, "select * from flybase.get_gene_ontology_terms(%s, 'biological_process')")),
+    ('schema/featureloc_slice', lambda ctx: [ctx.query('select * from featureloc_slice(%s, %s, %s)', location)
+                                             for location in ctx.input('slice_locations')]),
+    # misc/
+    ('misc/conserved_darkened_genes.py', lambda ctx: ctx.run_script(
+        'misc/conserved_darkened_genes.py', *ctx.db_args)),
+    ('misc/conserved_darkened_genes.py --stream', lambda ctx: ctx.run_script(
+        'misc/conserved_darkened_genes.py', *ctx.db_args, '--stream')),
+    ('misc/conserved_darkened_genes.py --parallel', lambda ctx: ctx.run_script(
+        'misc/conserved_darkened_genes.py', *ctx.db_args, '--parallel')),
+    ('misc/conserved_darkened_genes.py --summary-tables', lambda ctx: ctx.run_script(
+        'misc/conserved_darkened_genes.py', *ctx.db_args, '--summary-tables')),
+    ('misc/conserved_darkened_genes.py --format parquet', lambda ctx: ctx.run_script(
+        'misc/conserved_darkened_genes.py', *ctx.db_args, '--format', 'parquet')),
+    ('misc/find_overlapping_miRNA_mRNA.py', lambda ctx: print_overlaps(ctx, 'single')),
+    ('misc/find_overlapping_miRNA_mRNA.py --batch', lambda ctx: print_overlaps(ctx, 'batch')),
+    ('misc/find_overlapping_miRNA_mRNA.py --snapshot', print_overlaps_snapshot),
+    ('misc/update_ids.py', lambda ctx: ctx.run_script(
+        'misc/update_ids.py', *ctx.db_args, ctx.input('id_file'), stdout='update_ids.tsv')),
+    ('misc/update_ids.py --format parquet', lambda ctx: ctx.run_script(
+        'misc/update_ids.py', *ctx.db_args, ctx.input('id_file'), '--format', 'parquet', '-o', 'update_ids.parquet')),
+    # statistics/
+    ('statistics/gene_summary_stats.sql', make_chado_stats_file),
+    ('statistics/merge_chado_alliance_gene_summary_counts.py', lambda ctx: ctx.run_script(
+        'statistics/merge_chado_alliance_gene_summary_counts.py', ctx.input('chado_stats_file'),
+        ctx.input('alliance_file'), stdout='gene_summary_merged.tsv')),
+    ('statistics/merge_chado_alliance_gene_summary_counts.py --engine row', lambda ctx: ctx.run_script(
+        'statistics/merge_chado_alliance_gene_summary_counts.py', '--engine', 'row', ctx.input('chado_stats_file'),
+        ctx.input('alliance_file'), stdout='gene_summary_merged_row.tsv')),
+    ('statistics/gene_summary_report.py', lambda ctx: ctx.run_script(
+        'statistics/gene_summary_report.py', *ctx.db_args, ctx.input('alliance_file'), stdout='gene_summary_report.tsv')),
+    ('statistics/gene_summary_report.py --format parquet', lambda ctx: ctx.run_script(
+        'statistics/gene_summary_report.py', *ctx.db_args, ctx.input('alliance_file'), '--format', 'parquet',
+        '-o', 'gene_summary_report.parquet')),
+    ('statistics/redfly_stats.py', run_redfly_stats),
+    ('statistics/redfly_stats.py --mmap', lambda ctx: run_redfly_stats(ctx, '--mmap')),
+    ('statistics/data_class_counts.pl', run_data_class_counts),
+]
+
+
+def run_scenario(ctx, name: str, func, runs: int):
+    """
+    Runs a scenario and times each run.
+
+    :return: Dictionary with the status, run times in seconds, best, mean, and any error.
+    """
+    result = {'name': name, 'status': 'ok', 'runs': []}
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            func(ctx)
+            result['runs'].append(time.perf_counter() - start)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+        if ctx.args.verbose:
+            traceback.print_exc()
+    if result['runs']:
+        result['best'] = min(result['runs'])
+        result['mean'] = sum(result['runs']) / len(result['runs'])
+    return result
+
+
+def git_info():
+    """
+    Returns the commit and whether the working tree has uncommitted changes.
+    """
+    def git(*git_args):
+        return subprocess.run(['git', '-C', REPO_DIR] + list(git_args), capture_output=True, text=True).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except OSError:
+        return {'commit': None, 'dirty': None}
+
+
+def environment(ctx):
+    info = git_info()
+    info.update({
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'postgres': ctx.query('show server_version')[0][0],
+        'database': ctx.args.dbname,
+        'runs': ctx.args.runs,
+        'ids': ctx.args.ids,
+        'fixture': {table: ctx.query(f'select count(*) from {table}')[0][0] for table in FIXTURE_TABLES},
+    })
+    return info
+
+
+def compare_results(old: dict, new: dict, out=sys.stdout):
+    """
+    Prints the best time of each scenario in two result sets and the ratio new / old.
+    """
+    def seconds(value):
+        return '-' if value is None else f'{value:.3f}'
+
+    old_scenarios = {s['name']: s for s in old['scenarios']}
+    print(f"old: {old.get('commit')}  new: {new.get('commit')}", file=out)
+    print(f"{'scenario':<66} {'old':>9} {'new':>9} {'new/old':>8}", file=out)
+    for scenario in new['scenarios']:
+        old_best = old_scenarios.get(scenario['name'], {}).get('best')
+        new_best = scenario.get('best')
+        ratio = f'{new_best / old_best:.2f}' if old_best and new_best is not None else '-'
+        print(f"{scenario['name']:<66} {seconds(old_best):>9} {seconds(new_best):>9} {ratio:>8}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark scenarios against a local Chado database.')
+    parser.add_argument("--host", help="Chado database hostname.", default="localhost")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="postgres")
+    parser.add_argument("-W", "--password", help="Chado database password.", default="")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="chado")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("-o", "--output", help="Results JSON file. default: benchmark_<commit>.json")
+    parser.add_argument("--scenario", action="append", metavar="PATTERN",
+                        help="Only run the scenarios matching PATTERN (shell style), may be repeated.")
+    parser.add_argument("--runs", help="Number of runs per scenario. default: 3", default=3, type=int)
+    parser.add_argument("--ids", help="Number of IDs or locations for the per ID scenarios. default: 1000",
+                        default=1000, type=int)
+    parser.add_argument("--jobs", help="Parallel connections for the data class build. default: 4", default=4,
+                        type=int)
+    parser.add_argument("--seed", help="Random seed for the inputs. default: 42", default=42, type=int)
+    parser.add_argument("--workdir", help="Directory for inputs and outputs. default: a temporary directory")
+    parser.add_argument("--compare", nargs='+', metavar="FILE",
+                        help="Compare with a previous results file.  With two files, compare them and exit.")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the traceback of failed scenarios.")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, _ in SCENARIOS:
+            print(name)
+        return 0
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0], 'r') as old_fh, open(args.compare[1], 'r') as new_fh:
+            compare_results(json.load(old_fh), json.load(new_fh))
+        return 0
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes one or two files.')
+
+    scenarios = [(name, func) for name, func in SCENARIOS
+                 if not args.scenario or any(fnmatch.fnmatch(name, pattern) for pattern in args.scenario)]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='chado_benchmarks_')
+    os.makedirs(workdir, exist_ok=True)
+    ctx = BenchmarkContext(args, workdir)
+    try:
+        results = environment(ctx)
+        results['scenarios'] = []
+        for name, func in scenarios:
+            result = run_scenario(ctx, name, func, args.runs)
+            results['scenarios'].append(result)
+            if result['status'] == 'ok':
+                print(f"{name:<66} best={result['best']:.3f}s mean={result['mean']:.3f}s", file=sys.stderr)
+            else:
+                print(f"{name:<66} {result['error']}", file=sys.stderr)
+    finally:
+        ctx.close()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or f"benchmark_{(results['commit'] or 'unknown')[:10]}.json"
+    with open(output, 'w') as fh:
+        json.dump(results, fh, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare[0], 'r') as old_fh:
+            compare_results(json.load(old_fh), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""
+Shared Python helpers for the FlyBase Chado scripts in misc/, statistics/, and benchmarks/.
+
+The scripts are run directly rather than installed, so they add the repository root to
+sys.path before importing from this package.
+"""
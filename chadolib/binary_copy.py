@@ -0,0 +1,317 @@
+"""
+Module: binary_copy.py
+
+Description:
+
+Streams query results out of Chado with COPY ... TO STDOUT (FORMAT binary).
+
+The binary COPY format sends each value with its length and in its binary representation,
+so rows can be decoded without CSV/TSV quoting rules or text to number conversions, and the
+result set never has to be written to or read back from a file.
+
+* BinaryCopyParser is a push parser.  Feed it the bytes of a binary COPY stream in pieces of
+  any size and it returns the rows that have been completed so far.
+* stream_copy runs the COPY on a background thread and yields the decoded rows in chunks
+  while the server is still sending, so the consumer works on one chunk while the next is
+  being received.  The number of chunks buffered between the two is bounded.  With
+  columns=True each chunk is a list of column value lists instead of row tuples (see
+  chadolib.columnar).
+
+e.g.
+for rows in stream_copy(conn, 'select uniquename, feature_id from feature', chunk_size=50000):
+    df = pd.DataFrame.from_records(rows, columns=['uniquename', 'feature_id'])
+"""
+import queue
+import struct
+import threading
+
+# The header of every binary COPY stream.
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+_int16 = struct.Struct('>h')
+_int32 = struct.Struct('>i')
+_float4 = struct.Struct('>f')
+_float8 = struct.Struct('>d')
+
+
+def _decode_text(value: bytes):
+    return value.decode('utf-8')
+
+
+def _decode_int(value: bytes):
+    return int.from_bytes(value, 'big', signed=True)
+
+
+# Value decoders by type OID, for the types used by the scripts.  Other types must be cast in
+# the query, e.g. to text.
+DECODERS = {
+    16: lambda value: value != b'\x00',            # bool
+    17: bytes,                                     # bytea
+    19: _decode_text,                              # name
+    20: _decode_int,                               # int8
+    21: _decode_int,                               # int2
+    23: _decode_int,                               # int4
+    25: _decode_text,                              # text
+    26: lambda value: int.from_bytes(value, 'big'),  # oid
+    114: _decode_text,                             # json
+    700: lambda value: _float4.unpack(value)[0],   # float4
+    701: lambda value: _float8.unpack(value)[0],   # float8
+    1042: _decode_text,                            # bpchar
+    1043: _decode_text,                            # varchar
+    3802: lambda value: value[1:].decode('utf-8'),  # jsonb, version byte then text
+}
+
+
+def describe_query(conn, query: str):
+    """
+    Returns the cursor description of the result of a query.
+
+    The query is described by running it with LIMIT 0, which plans it but does not return any rows.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :return: Sequence of psycopg2 Column objects with the name and type OID (type_code) of each column.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f'select * from ({query}) as described limit 0')
+        return cur.description
+
+
+def column_decoders(conn, query: str):
+    """
+    Returns the column names and value decoders for the result of a query.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :return: Tuple of the list of column names and the list of decoders.
+    """
+    description = describe_query(conn, query)
+    unsupported = [f'{column.name} (oid {column.type_code})' for column in description
+                   if column.type_code not in DECODERS]
+    if unsupported:
+        raise ValueError(f"No binary decoder for columns: {', '.join(unsupported)}. Cast them to text in the query.")
+    return [column.name for column in description], [DECODERS[column.type_code] for column in description]
+
+
+class BinaryCopyParser:
+    """
+    Incremental parser for the PostgreSQL binary COPY format.
+    """
+
+    def __init__(self, decoders: list):
+        """
+        :param decoders: List with a function for each column that decodes its value from bytes.
+        """
+        self.decoders = decoders
+        self.finished = False
+        self._buffer = bytearray()
+        self._header_read = False
+
+    def _read_header(self):
+        # Signature, flags field, and header extension area length followed by the extension.
+        if len(self._buffer) < len(PGCOPY_SIGNATURE) + 8:
+            return False
+        if bytes(self._buffer[:len(PGCOPY_SIGNATURE)]) != PGCOPY_SIGNATURE:
+            raise ValueError("Not a binary COPY stream.")
+        extension_length = _int32.unpack_from(self._buffer, len(PGCOPY_SIGNATURE) + 4)[0]
+        header_length = len(PGCOPY_SIGNATURE) + 8 + extension_length
+        if len(self._buffer) < header_length:
+            return False
+        del self._buffer[:header_length]
+        self._header_read = True
+        return True
+
+    def feed(self, data: bytes):
+        """
+        Adds bytes from the COPY stream.
+
+        :param data: The next bytes of the stream.
+        :return: List of the rows (tuples) completed by this data.
+        """
+        return values_to_rows(self.feed_values(data), len(self.decoders))
+
+    def feed_values(self, data: bytes):
+        """
+        Adds bytes from the COPY stream.
+
+        :param data: The next bytes of the stream.
+        :return: Flat list of the values of the rows completed by this data, row after row.
+        """
+        if self.finished:
+            if data:
+                raise ValueError("Data after the end of the binary COPY stream.")
+            return []
+        self._buffer += data
+        if not self._header_read and not self._read_header():
+            return []
+
+        values = []
+        buffer = self._buffer
+        size = len(buffer)
+        decoders = self.decoders
+        offset = 0
+        while offset + 2 <= size:
+            field_count = _int16.unpack_from(buffer, offset)[0]
+            if field_count == -1:
+                # File trailer.
+                offset += 2
+                self.finished = True
+                break
+            if field_count != len(decoders):
+                raise ValueError(f"Expected {len(decoders)} columns, got {field_count}.")
+            position = offset + 2
+            row = []
+            for decoder in decoders:
+                if position + 4 > size:
+                    break
+                length = _int32.unpack_from(buffer, position)[0]
+                position += 4
+                if length == -1:
+                    row.append(None)
+                    continue
+                if position + length > size:
+                    break
+                row.append(decoder(buffer[position:position + length]))
+                position += length
+            if len(row) < field_count:
+                # The rest of the row has not been received yet.
+                break
+            values.extend(row)
+            offset = position
+        del buffer[:offset]
+        return values
+
+
+def values_to_rows(values: list, num_columns: int):
+    """
+    :param values: Flat list of row values returned by BinaryCopyParser.feed_values.
+    :param num_columns: The number of columns per row.
+    :return: List of row tuples.
+    """
+    if num_columns == 1:
+        return [(value,) for value in values]
+    return list(zip(*values_to_columns(values, num_columns)))
+
+
+def values_to_columns(values: list, num_columns: int):
+    """
+    :param values: Flat list of row values returned by BinaryCopyParser.feed_values.
+    :param num_columns: The number of columns per row.
+    :return: List with a list of values for each column.
+    """
+    return [values[i::num_columns] for i in range(num_columns)]
+
+
+class _CopyWriter:
+    """
+    File like object for cursor.copy_expert that parses the COPY data as it is received and
+    hands it on in chunks of rows.  The values are kept in a flat list until a chunk is complete
+    and then converted to rows or columns with the convert function.
+    """
+
+    def __init__(self, parser: BinaryCopyParser, chunk_size: int, put, cancelled: threading.Event, convert):
+        self.parser = parser
+        self.chunk_values = chunk_size * len(parser.decoders)
+        self.put = put
+        self.cancelled = cancelled
+        self.convert = convert
+        self.values = []
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise _CopyCancelled()
+        self.values.extend(self.parser.feed_values(data))
+        while self.chunk_values and len(self.values) >= self.chunk_values:
+            self.put(self.convert(self.values[:self.chunk_values]))
+            del self.values[:self.chunk_values]
+        return len(data)
+
+    def flush(self):
+        if self.values:
+            self.put(self.convert(self.values))
+            self.values = []
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+_END = object()
+
+
+def stream_copy(conn, query: str, chunk_size: int = 100000, decoders: list = None, max_chunks: int = 4,
+                columns: bool = False):
+    """
+    Runs a query with COPY ... TO STDOUT (FORMAT binary) and yields the decoded rows in chunks.
+
+    The COPY runs on a background thread, so the rows of one chunk can be processed while the
+    next is being received.  At most max_chunks chunks are buffered.  The connection must not be
+    used by anything else until the generator is exhausted or closed.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query, without a trailing semicolon.
+    :param chunk_size: The number of rows per chunk. default: 100000
+    :param decoders: The value decoders of the columns. default: looked up with column_decoders
+    :param max_chunks: The maximum number of chunks to buffer. default: 4
+    :param columns: Yield each chunk as a list of column value lists instead of row tuples. default: False
+    :return: Generator of lists of row tuples, or of lists of column values with columns=True.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    if decoders is None:
+        decoders = column_decoders(conn, query)[1]
+    num_columns = len(decoders)
+    if columns:
+        def convert(values):
+            return values_to_columns(values, num_columns)
+    else:
+        def convert(values):
+            return values_to_rows(values, num_columns)
+    chunks = queue.Queue(maxsize=max_chunks)
+    cancelled = threading.Event()
+
+    def put(item):
+        # Wait for room in the buffer, but give up if the consumer has gone away.
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _CopyCancelled()
+
+    def run():
+        writer = _CopyWriter(BinaryCopyParser(decoders), chunk_size, put, cancelled, convert)
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(f'copy ({query}) to stdout with (format binary)', writer)
+            if not writer.parser.finished:
+                raise ValueError("The binary COPY stream ended without a trailer.")
+            writer.flush()
+            put(_END)
+        except _CopyCancelled:
+            pass
+        except Exception as e:
+            try:
+                put(e)
+            except _CopyCancelled:
+                pass
+
+    thread = threading.Thread(target=run, name='chadolib-copy', daemon=True)
+    thread.start()
+    completed = False
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END:
+                completed = True
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        thread.join()
+        if not completed:
+            # Leave the connection usable after a cancelled or failed COPY.
+            conn.rollback()
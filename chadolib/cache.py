@@ -0,0 +1,257 @@
+"""
+Module: cache.py
+
+Description:
+
+A release aware on disk cache for lookups that only change between FlyBase releases:
+current symbols (and other synonyms), updated IDs, and scaffold feature_ids.
+
+Each database gets its own SQLite file in the cache directory (CHADOLIB_CACHE_DIR or
+~/.cache/chadolib).  The file records the release it was filled from (see
+chadolib.query.fetch_release) and is emptied automatically when the connected
+database has a different release.
+
+Lookups are done in bulk.  Keys found in the cache are answered locally and all misses
+are resolved with a single set based query (flybase.current_synonyms, flybase.update_ids,
+or one scaffold query) and then stored, including keys with no result.
+
+e.g.
+cache = LookupCache.open(conn)
+symbols = cache.symbols(['FBgn0000490', 'FBtr0070000'])
+scaffolds = cache.scaffold_ids(['2L', '3L'])
+cache.close()
+"""
+import os
+import re
+import sqlite3
+
+from chadolib.query import fetch_release
+from chadolib.symbols import dbapi_connection, resolve_synonyms
+
+# Environment variable for the cache directory.
+CACHE_DIR_ENV = 'CHADOLIB_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'chadolib')
+
+cache_schema = """
+create table if not exists meta (
+    key text primary key,
+    value text
+);
+create table if not exists synonym (
+    id text,
+    synonym_type text,
+    synonym text,
+    primary key (id, synonym_type)
+) without rowid;
+create table if not exists updated_id (
+    submitted_id text,
+    rank integer,
+    updated_id text,
+    status text,
+    primary key (submitted_id, rank)
+) without rowid;
+create table if not exists scaffold (
+    genus text,
+    species text,
+    scaffold_type text,
+    name text,
+    feature_id integer,
+    primary key (genus, species, scaffold_type, name)
+) without rowid;
+"""
+
+update_ids_query = """
+select submitted_id, updated_id, status
+    from flybase.update_ids(%s::text[])
+"""
+
+scaffold_ids_query = """
+select f.name, f.feature_id
+    from feature f join organism o on f.organism_id = o.organism_id
+                   join cvterm cvt on f.type_id = cvt.cvterm_id
+    where o.genus = %s
+      and o.species = %s
+      and cvt.name = %s
+      and f.is_obsolete = false
+      and f.is_analysis = false
+      and f.name = any(%s::text[])
+"""
+
+
+def cache_path(conn, cache_dir: str = None):
+    """
+    Returns the cache file for the database of a connection.
+
+    :param conn: psycopg2 or SQLAlchemy connection to the Chado database.
+    :param cache_dir: The cache directory. default: $CHADOLIB_CACHE_DIR or ~/.cache/chadolib
+    :return: Path of the SQLite cache file.
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+    dsn = dbapi_connection(conn).get_dsn_parameters()
+    name = '_'.join(dsn.get(key) or '' for key in ('host', 'port', 'dbname'))
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', name) + '.sqlite')
+
+
+class LookupCache:
+    """
+    SQLite backed lookup cache tied to the release of a Chado database.
+    """
+
+    def __init__(self, conn, path: str):
+        self.conn = dbapi_connection(conn)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The cache may be handed to a worker thread, but must not be used by two threads at once.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('pragma journal_mode = wal')
+        self.db.executescript(cache_schema)
+        self.release = fetch_release(self.conn)
+        self.invalidated = self._check_release()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, conn, cache_dir: str = None):
+        """
+        Opens the cache for the database of a connection.
+
+        :param conn: psycopg2 or SQLAlchemy connection to the Chado database.
+        :param cache_dir: The cache directory. default: $CHADOLIB_CACHE_DIR or ~/.cache/chadolib
+        :return: LookupCache
+        """
+        return cls(conn, cache_path(conn, cache_dir))
+
+    def close(self):
+        self.db.close()
+
+    def _check_release(self):
+        """
+        Empties the cache if it was filled from a different release.
+
+        :return: True if the cache was emptied.
+        """
+        row = self.db.execute("select value from meta where key = 'release'").fetchone()
+        if row and row[0] == self.release:
+            return False
+        with self.db:
+            for table in ('synonym', 'updated_id', 'scaffold'):
+                self.db.execute(f'delete from {table}')
+            self.db.execute("insert or replace into meta (key, value) values ('release', ?)", (self.release,))
+        return True
+
+    def _cached(self, sql: str, keys: list, params: tuple = ()):
+        """
+        Runs a lookup query for many keys by joining against a temporary key table.
+
+        :param sql: Query that joins the temp.lookup_key table on its key column.
+        :param keys: The keys to look up.
+        :param params: Any other query parameters.
+        :return: List of result rows.
+        """
+        self.db.execute('create temp table if not exists lookup_key (key text primary key) without rowid')
+        self.db.execute('delete from temp.lookup_key')
+        self.db.executemany('insert or ignore into temp.lookup_key (key) values (?)', ((k,) for k in keys))
+        return self.db.execute(sql, params).fetchall()
+
+    def synonyms(self, ids, synonym_type: str = 'symbol'):
+        """
+        Returns the current synonym of the given type for FlyBase IDs.
+
+        :param ids: Iterable of FlyBase IDs.
+        :param synonym_type: The synonym type, e.g. 'symbol' or 'fullname'. default: 'symbol'
+        :return: Dictionary of FlyBase ID to current synonym or None.
+        """
+        ids = list(dict.fromkeys(i for i in ids if i is not None))
+        rows = self._cached("""
+            select s.id, s.synonym
+                from temp.lookup_key k join synonym s on k.key = s.id
+                where s.synonym_type = ?
+        """, ids, (synonym_type,))
+        synonyms = dict(rows)
+        missing = [i for i in ids if i not in synonyms]
+        self.hits += len(synonyms)
+        self.misses += len(missing)
+        if missing:
+            resolved = resolve_synonyms(self.conn, missing, synonym_type)
+            with self.db:
+                self.db.executemany('insert or replace into synonym (id, synonym_type, synonym) values (?, ?, ?)',
+                                    ((i, synonym_type, resolved.get(i)) for i in missing))
+            synonyms.update((i, resolved.get(i)) for i in missing)
+        return synonyms
+
+    def symbols(self, ids):
+        """
+        :param ids: Iterable of FlyBase IDs.
+        :return: Dictionary of FlyBase ID to current symbol or None.
+        """
+        return self.synonyms(ids, 'symbol')
+
+    def updated_ids(self, ids):
+        """
+        Returns the flybase.update_ids results for FlyBase IDs.
+
+        :param ids: Iterable of FlyBase IDs.
+        :return: Dictionary of submitted ID to a list of (updated ID, status) tuples.  IDs that
+                 could not be found have a single (None, None) tuple.
+        """
+        ids = list(dict.fromkeys(i for i in ids if i is not None))
+        rows = self._cached("""
+            select u.submitted_id, u.updated_id, u.status
+                from temp.lookup_key k join updated_id u on k.key = u.submitted_id
+                order by u.submitted_id, u.rank
+        """, ids)
+        updated = {}
+        for submitted_id, updated_id, status in rows:
+            updated.setdefault(submitted_id, []).append((updated_id, status))
+        missing = [i for i in ids if i not in updated]
+        self.hits += len(updated)
+        self.misses += len(missing)
+        if missing:
+            resolved = {}
+            with self.conn.cursor() as cur:
+                cur.execute(update_ids_query, (missing,))
+                for submitted_id, updated_id, status in cur:
+                    resolved.setdefault(submitted_id, []).append((updated_id, status))
+            with self.db:
+                self.db.executemany(
+                    'insert or replace into updated_id (submitted_id, rank, updated_id, status) values (?, ?, ?, ?)',
+                    ((i, rank, updated_id, status) for i, results in resolved.items()
+                     for rank, (updated_id, status) in enumerate(results)))
+            updated.update(resolved)
+        return updated
+
+    def scaffold_ids(self, names, genus: str = 'Drosophila', species: str = 'melanogaster',
+                     scaffold_type: str = 'golden_path'):
+        """
+        Returns the feature_ids of scaffolds by name.
+
+        :param names: Iterable of scaffold names, e.g. ['2L', '3L']
+        :param genus: The genus of the scaffold organism. default: 'Drosophila'
+        :param species: The species of the scaffold organism. default: 'melanogaster'
+        :param scaffold_type: The feature type of the scaffolds. default: 'golden_path'
+        :return: Dictionary of scaffold name to feature_id or None.
+        """
+        names = list(dict.fromkeys(names))
+        rows = self._cached("""
+            select s.name, s.feature_id
+                from temp.lookup_key k join scaffold s on k.key = s.name
+                where s.genus = ?
+                  and s.species = ?
+                  and s.scaffold_type = ?
+        """, names, (genus, species, scaffold_type))
+        scaffolds = dict(rows)
+        missing = [n for n in names if n not in scaffolds]
+        self.hits += len(scaffolds)
+        self.misses += len(missing)
+        if missing:
+            with self.conn.cursor() as cur:
+                cur.execute(scaffold_ids_query, (genus, species, scaffold_type, missing))
+                resolved = dict(cur.fetchall())
+            with self.db:
+                self.db.executemany(
+                    'insert or replace into scaffold (genus, species, scaffold_type, name, feature_id) '
+                    'values (?, ?, ?, ?, ?)',
+                    ((genus, species, scaffold_type, n, resolved.get(n)) for n in missing))
+            scaffolds.update((n, resolved.get(n)) for n in missing)
+        return scaffolds
+
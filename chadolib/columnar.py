@@ -0,0 +1,303 @@
+"""
+Module: columnar.py
+
+Description:
+
+Typed columnar (Apache Arrow) results and Parquet / Arrow IPC output for the scripts that
+extract data from Chado.
+
+Query results are read with COPY ... TO STDOUT (FORMAT binary) (see chadolib.binary_copy) and
+the values of each column are assembled straight into Arrow arrays.  Fixed width values are
+never turned into Python numbers, they are joined and read as one big endian numpy buffer, and
+text values are validated as UTF-8 by Arrow instead of being decoded one at a time.
+
+* stream_record_batches yields the result of a query as Arrow RecordBatches.
+* read_table and read_frame return the whole result as an Arrow Table or pandas DataFrame.
+* TableWriter writes Arrow tables, record batches, or DataFrames to a zstd compressed Parquet
+  file or an uncompressed Arrow IPC file.  IPC files can be opened with pyarrow.memory_map and
+  read without copying.
+
+pyarrow (with numpy and pandas) is only needed for these formats and is imported the first
+time it is used, so scripts can offer the --format option without depending on it.
+
+e.g.
+with TableWriter('genes.parquet', 'parquet') as writer:
+    for batch in stream_record_batches(conn, 'select uniquename, feature_id from feature'):
+        writer.write(batch)
+"""
+import os
+
+from chadolib.binary_copy import DECODERS, describe_query, stream_copy
+
+# Columnar output formats and their file extensions.
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+PARQUET_COMPRESSION = 'zstd'
+
+# Numpy dtypes of the binary COPY values of fixed width types by type OID.
+FIXED_WIDTH_DTYPES = {
+    16: 'u1',    # bool
+    20: '>i8',   # int8
+    21: '>i2',   # int2
+    23: '>i4',   # int4
+    26: '>u4',   # oid
+    700: '>f4',  # float4
+    701: '>f8',  # float8
+}
+# Types whose binary COPY value is UTF-8 text.
+TEXT_TYPES = {19, 25, 114, 1042, 1043, 3802}
+
+
+def import_pyarrow():
+    """
+    :return: The pyarrow module.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError("The parquet and arrow output formats require pyarrow (pip install pyarrow).") from None
+    return pyarrow
+
+
+def add_arguments(parser, text_format: str = 'tsv'):
+    """
+    Adds the --format option to an argparse parser.  The chosen format is stored as output_format.
+
+    :param parser: The argparse.ArgumentParser of the script.
+    :param text_format: The name of the default text output of the script. default: tsv
+    :return:
+    """
+    parser.add_argument('--format', dest='output_format', choices=[text_format] + list(FORMATS),
+                        default=text_format,
+                        help='Output format.  parquet writes zstd compressed Parquet, arrow writes Arrow IPC '
+                             f'files that can be memory mapped.  Both require pyarrow. default: {text_format}')
+
+
+def output_path(path: str, output_format: str):
+    """
+    :param path: Path of an output file.
+    :param output_format: The output format.
+    :return: The path with the file extension of the format.
+    """
+    if output_format not in FORMATS:
+        return path
+    return os.path.splitext(path)[0] + FORMATS[output_format]
+
+
+def _arrow_type(pa, type_code: int):
+    if type_code == 16:
+        return pa.bool_()
+    if type_code == 17:
+        return pa.binary()
+    if type_code in TEXT_TYPES:
+        return pa.string()
+    if type_code in FIXED_WIDTH_DTYPES:
+        import numpy as np
+
+        return pa.from_numpy_dtype(np.dtype(FIXED_WIDTH_DTYPES[type_code]).newbyteorder('='))
+    raise ValueError(f"No Arrow type for type oid {type_code}.")
+
+
+def _raw_decoder(type_code: int):
+    # jsonb has a version byte before the text, all other values are kept as received.
+    if type_code == 3802:
+        return lambda value: bytes(value[1:])
+    return bytes
+
+
+def _column_array(pa, values: list, type_code: int):
+    """
+    Builds an Arrow array from the raw binary COPY values of a column.
+
+    :param pa: The pyarrow module.
+    :param values: List of bytes values, None for null.
+    :param type_code: The PostgreSQL type OID of the column.
+    :return: pyarrow Array.
+    """
+    if type_code not in FIXED_WIDTH_DTYPES:
+        array = pa.array(values, type=pa.binary())
+        return array.cast(pa.string()) if type_code in TEXT_TYPES else array
+
+    import numpy as np
+
+    dtype = np.dtype(FIXED_WIDTH_DTYPES[type_code])
+    mask = None
+    if None in values:
+        mask = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        empty = bytes(dtype.itemsize)
+        values = [empty if value is None else value for value in values]
+    array = np.frombuffer(b''.join(values), dtype=dtype)
+    array = array != 0 if type_code == 16 else array.astype(dtype.newbyteorder('='))
+    return pa.array(array, mask=mask)
+
+
+def _strip_query(query: str):
+    # The query is wrapped in COPY, so a trailing semicolon has to go.
+    return query.strip().rstrip(';').rstrip()
+
+
+def _describe(pa, conn, query: str):
+    description = describe_query(conn, query)
+    unsupported = [f'{column.name} (oid {column.type_code})' for column in description
+                   if column.type_code not in DECODERS]
+    if unsupported:
+        raise ValueError(f"No binary decoder for columns: {', '.join(unsupported)}. Cast them to text in the query.")
+    type_codes = [column.type_code for column in description]
+    schema = pa.schema([(column.name, _arrow_type(pa, column.type_code)) for column in description])
+    return schema, type_codes
+
+
+def _record_batches(pa, conn, query: str, schema, type_codes: list, chunk_size: int):
+    decoders = [_raw_decoder(type_code) for type_code in type_codes]
+    for columns in stream_copy(conn, query, chunk_size=chunk_size, decoders=decoders, columns=True):
+        arrays = [_column_array(pa, values, type_code) for values, type_code in zip(columns, type_codes)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_record_batches(conn, query: str, chunk_size: int = 100000):
+    """
+    Runs a query with binary COPY and yields the result as Arrow RecordBatches.
+
+    The connection must not be used by anything else until the generator is exhausted or closed
+    (see chadolib.binary_copy.stream_copy).
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :param chunk_size: The maximum number of rows per batch. default: 100000
+    :return: Generator of pyarrow RecordBatches.
+    """
+    pa = import_pyarrow()
+    query = _strip_query(query)
+    schema, type_codes = _describe(pa, conn, query)
+    yield from _record_batches(pa, conn, query, schema, type_codes, chunk_size)
+
+
+def read_table(conn, query: str, chunk_size: int = 100000):
+    """
+    Runs a query with binary COPY and returns the result as an Arrow Table.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :param chunk_size: The number of rows per record batch of the table. default: 100000
+    :return: pyarrow Table with a typed column for each column of the query.
+    """
+    pa = import_pyarrow()
+    query = _strip_query(query)
+    schema, type_codes = _describe(pa, conn, query)
+    return pa.Table.from_batches(list(_record_batches(pa, conn, query, schema, type_codes, chunk_size)),
+                                 schema=schema)
+
+
+def read_frame(conn, query: str, index_col: str = None, chunk_size: int = 100000):
+    """
+    Runs a query with binary COPY and returns the result as a pandas DataFrame, like
+    pandas.read_sql but without building a Python row tuple for every row.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :param index_col: Optional column to use as the index.
+    :param chunk_size: The number of rows read at a time. default: 100000
+    :return: DataFrame
+    """
+    df = read_table(conn, query, chunk_size).to_pandas()
+    return df.set_index(index_col) if index_col else df
+
+
+def stream_frames(conn, query: str, index_col: str = None, chunk_size: int = 100000):
+    """
+    Streaming version of read_frame.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The SELECT query.
+    :param index_col: Optional column to use as the index.
+    :param chunk_size: The maximum number of rows per DataFrame. default: 100000
+    :return: Generator of DataFrames.
+    """
+    for batch in stream_record_batches(conn, query, chunk_size):
+        df = batch.to_pandas()
+        yield df.set_index(index_col) if index_col else df
+
+
+class TableWriter:
+    """
+    Writes tables to a Parquet or Arrow IPC file one piece at a time.
+
+    The schema of the file is taken from the first piece written, with columns that only
+    held nulls stored as strings, and later pieces are cast to it.
+    """
+
+    def __init__(self, path: str, output_format: str, schema=None):
+        """
+        :param path: The output file.
+        :param output_format: 'parquet' or 'arrow'.
+        :param schema: Optional pyarrow Schema of the file. default: the schema of the first piece written
+        """
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown columnar format '{output_format}', choose from {', '.join(FORMATS)}.")
+        self.pa = import_pyarrow()
+        self.path = path
+        self.output_format = output_format
+        self.schema = schema
+        self.num_rows = 0
+        self._writer = None
+
+    def _open(self, schema):
+        pa = self.pa
+        self.schema = pa.schema([field.with_type(pa.string()) if field.type == pa.null() else field
+                                 for field in schema], metadata=schema.metadata)
+        if self.output_format == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(self.path, self.schema, compression=PARQUET_COMPRESSION)
+        else:
+            self._writer = pa.ipc.new_file(self.path, self.schema)
+
+    def write(self, data):
+        """
+        :param data: pyarrow Table or RecordBatch, or pandas DataFrame.  A named DataFrame index is
+                     written as a column.
+        :return:
+        """
+        import pandas as pd
+
+        pa = self.pa
+        if isinstance(data, pd.DataFrame):
+            table = pa.Table.from_pandas(data)
+        elif isinstance(data, pa.RecordBatch):
+            table = pa.Table.from_batches([data])
+        else:
+            table = data
+        if self._writer is None:
+            self._open(self.schema or table.schema)
+        if not table.schema.equals(self.schema, check_metadata=False):
+            table = table.cast(self.schema)
+        self._writer.write_table(table)
+        self.num_rows += table.num_rows
+
+    def close(self):
+        if self._writer is None:
+            # Nothing was written, still leave a valid file.
+            self._open(self.schema or self.pa.schema([]))
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def write_frame(df, path: str, output_format: str):
+    """
+    Writes a DataFrame to a Parquet or Arrow IPC file.
+
+    :param df: The DataFrame.
+    :param path: The output file.
+    :param output_format: 'parquet' or 'arrow'.
+    :return:
+    """
+    with TableWriter(path, output_format) as writer:
+        writer.write(df)
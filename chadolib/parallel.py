@@ -0,0 +1,75 @@
+"""
+Module: parallel.py
+
+Description:
+
+Runs independent Chado extraction queries at the same time, each on its own pooled
+connection, and reports how long each one took.
+
+e.g.
+engine = create_pooled_engine('postgresql+psycopg2://flybase@chado.flybase.org/flybase', pool_size=2)
+results, timings = run_concurrently(engine, {
+    'go_counts': fetch_go_counts,
+    'ortholog_counts': fetch_ortholog_counts,
+})
+report_timings(timings)
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+
+def create_pooled_engine(url: str, pool_size: int = 4, **kwargs):
+    """
+    Creates a SQLAlchemy engine backed by a QueuePool large enough to run pool_size queries at once.
+
+    :param url: SQLAlchemy database URL.
+    :param pool_size: The number of connections to keep in the pool. default: 4
+    :param kwargs: Additional keyword arguments passed to create_engine.
+    :return: SQLAlchemy Engine object.
+    """
+    kwargs.setdefault('client_encoding', 'utf8')
+    return create_engine(url, poolclass=QueuePool, pool_size=pool_size, max_overflow=0, **kwargs)
+
+
+def _timed(engine, func):
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        result = func(conn)
+    return result, time.perf_counter() - start
+
+
+def run_concurrently(engine, tasks: dict, max_workers: int = None):
+    """
+    Runs each task on its own connection checked out from the engine's pool.
+
+    Tasks are callables that take a SQLAlchemy Connection and return a result (e.g. a DataFrame).
+    They must not depend on each other since they run in separate sessions.  If any task raises,
+    the exception is re-raised after all tasks have finished.
+
+    :param engine: SQLAlchemy engine, see create_pooled_engine.
+    :param tasks: Dictionary of task name to callable.
+    :param max_workers: The maximum number of tasks to run at once. default: the number of tasks
+    :return: Tuple of a dictionary of task name to result and a dictionary of task name to wall time in seconds.
+    """
+    results = {}
+    timings = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(tasks), 1)) as executor:
+        futures = {name: executor.submit(_timed, engine, func) for name, func in tasks.items()}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+    return results, timings
+
+
+def report_timings(timings: dict, file=sys.stderr):
+    """
+    Prints the wall time of each task.
+
+    :param timings: Dictionary of task name to wall time in seconds.
+    :param file: File handle to print to. default: STDERR
+    """
+    for name, seconds in timings.items():
+        print("{}\t{:.3f}s".format(name, seconds), file=file)
@@ -0,0 +1,564 @@
+"""
+Module: profiling.py
+
+Description:
+
+Opt in profiling for the scripts that query Chado.  When a profiler has been started,
+every SQL statement run on an instrumented connection is recorded and a JSON trace is
+written when the script finishes.
+
+* Statements: the wall time of the statement, the time spent fetching its rows, the number
+  of rows, and the bytes transferred.  For COPY the bytes are counted exactly, for other
+  statements they are estimated from the text representation of the fetched rows.
+* Phases: named sections of a script (e.g. building a DataFrame or writing a CSV file) with
+  their wall time and the part of it that was spent in SQL statements.
+* Plans: with explain=True, each distinct query statement that takes longer than the explain
+  threshold is run again once with EXPLAIN (ANALYZE, BUFFERS) on the same connection and its
+  plan is added to the trace.  The explain runs in a read only transaction (or savepoint) that
+  is always rolled back, so a statement that turns out to write, e.g. a SELECT of a refresh
+  function, fails in the trace instead of being applied twice.
+* Functions: the calls and time of the functions in the FlyBase schemas, from the change in
+  pg_stat_user_functions over the run.  The server must be tracking function calls
+  (track_functions = pl or all), the trace records the setting.  The counters are database
+  wide, so calls made by other sessions during the run are included.  SQL functions that
+  the planner inlines are not counted.
+
+Connections returned by chadolib.query.get_connection are instrumented automatically.
+Other psycopg2 connections and SQLAlchemy engines are instrumented with instrument and
+instrument_engine.  Nothing is recorded until start is called.
+
+e.g.
+profiling.add_arguments(parser)
+args = parser.parse_args()
+profiling.start_from_args(args, host=args.host, user=args.username, dbname=args.dbname)
+conn = get_connection(host=args.host, user=args.username, dbname=args.dbname)
+try:
+    with profiling.phase('GO counts'):
+        df = pd.read_sql(GO_COUNTS_SQL, conn)
+    with profiling.phase('write CSV'):
+        df.to_csv('go_counts.csv')
+finally:
+    close_connections()
+    profiling.finish()
+"""
+import datetime
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+# Schemas of the helper functions reported from pg_stat_user_functions.
+FUNCTION_SCHEMAS = ('flybase', 'gene', 'gene_group', 'humanhealth')
+# Seconds to wait for the function counters of the script's sessions to be reported to the
+# statistics system after the script has finished.
+FUNCTION_STATS_WAIT = 3.0
+
+# The active profiler, set by start.
+_profiler = None
+
+_leading_comments_re = re.compile(r'^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*', re.DOTALL)
+_read_only_re = re.compile(r'^(?:select|with|values|table)\b', re.IGNORECASE)
+_declare_re = re.compile(r'^declare\s+.*?\bcursor\b.*?\bfor\s+(.*)$', re.IGNORECASE | re.DOTALL)
+_copy_to_re = re.compile(r'^copy\s*\((.*)\)\s*to\s+stdout\b', re.IGNORECASE | re.DOTALL)
+_prepare_re = re.compile(r'^prepare\s+(\w+)(?:\s*\([^)]*\))?\s+as\s+(.*)$', re.IGNORECASE | re.DOTALL)
+_execute_re = re.compile(r'^execute\s+(\w+)', re.IGNORECASE)
+
+function_stats_query = """
+select funcid::regprocedure::text, calls, total_time, self_time
+    from pg_stat_user_functions
+    where schemaname = any(%s)
+"""
+
+
+def _strip_comments(sql: str):
+    return _leading_comments_re.sub('', sql, count=1)
+
+
+def _row_bytes(row):
+    # Approximates the size of a row in the text protocol, a 7 byte message header and
+    # the length and text of each value.
+    size = 7
+    for value in row:
+        size += 4
+        if value is None:
+            continue
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            size += len(value)
+        else:
+            size += len(str(value))
+    return size
+
+
+class _CountingFile:
+    """
+    Wraps the file object of a COPY and counts the bytes that pass through it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bytes += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.file.readline(size)
+        self.bytes += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return data
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.file.write(data)
+
+
+class ProfilingCursor(psycopg2.extensions.cursor):
+    """
+    psycopg2 cursor that reports its statements to the active profiler.
+    """
+
+    _record = None
+
+    def execute(self, query, vars=None):
+        profiler = _profiler
+        if profiler is None:
+            return super().execute(query, vars)
+        record = profiler.begin_statement(self, query)
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            record['error'] = f'{type(e).__name__}: {e}'.strip()
+            raise
+        finally:
+            profiler.end_execute(self, record)
+
+    def executemany(self, query, vars_list):
+        profiler = _profiler
+        if profiler is None:
+            return super().executemany(query, vars_list)
+        record = profiler.begin_statement(self, query)
+        try:
+            return super().executemany(query, vars_list)
+        except Exception as e:
+            record['error'] = f'{type(e).__name__}: {e}'.strip()
+            raise
+        finally:
+            profiler.end_execute(self, record)
+
+    def copy_expert(self, sql, file, size=8192):
+        profiler = _profiler
+        if profiler is None:
+            return super().copy_expert(sql, file, size)
+        record = profiler.begin_statement(self, sql)
+        counting_file = _CountingFile(file)
+        try:
+            return super().copy_expert(sql, counting_file, size)
+        except Exception as e:
+            record['error'] = f'{type(e).__name__}: {e}'.strip()
+            raise
+        finally:
+            record['bytes'] = counting_file.bytes
+            profiler.end_execute(self, record, copy_sql=sql)
+
+    def _fetched(self, rows, start):
+        record = self._record
+        if record is not None and _profiler is not None:
+            seconds = time.perf_counter() - start
+            record['fetch_seconds'] += seconds
+            record['rows'] += len(rows)
+            record['bytes'] += sum(_row_bytes(row) for row in rows)
+            _profiler.add_phase_sql_seconds(seconds)
+        return rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        return self._fetched(super().fetchmany(self.arraysize if size is None else size), start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        return self._fetched(super().fetchall(), start)
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        record, self._record = self._record, None
+        super().close()
+        if record is not None and self.name is not None and _profiler is not None:
+            # Server side cursors fetch their rows after execute, so they are finished here.
+            _profiler.end_statement(self, record)
+
+
+class Profiler:
+    """
+    Collects the statements, phases, plans, and function times of a run.
+    """
+
+    def __init__(self, trace_file: str, conn_params: dict = None, explain: bool = False,
+                 explain_threshold: float = 1.0, function_schemas: tuple = FUNCTION_SCHEMAS):
+        """
+        :param trace_file: Path of the JSON trace to write.
+        :param conn_params: psycopg2.connect keyword arguments, used to read the function statistics.
+        :param explain: Capture EXPLAIN (ANALYZE, BUFFERS) plans of slow statements.
+        :param explain_threshold: Statements that take at least this many seconds are explained.
+        :param function_schemas: Schemas of the functions to report.
+        """
+        self.trace_file = trace_file
+        self.explain = explain
+        self.explain_threshold = explain_threshold
+        self.function_schemas = list(function_schemas)
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.queries = {}
+        self.statements = []
+        self.phases = []
+        self.plans = []
+        self.track_functions = None
+        self.function_error = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._prepared = {}
+        self._explained = set()
+        self._stats_conn = None
+        self._functions_before = {}
+        if conn_params is not None:
+            self._open_stats_connection(conn_params)
+
+    def _elapsed(self):
+        return time.perf_counter() - self._start
+
+    def _open_stats_connection(self, conn_params: dict):
+        try:
+            self._stats_conn = psycopg2.connect(**conn_params)
+            self._stats_conn.autocommit = True
+            with self._stats_conn.cursor() as cur:
+                cur.execute('show track_functions')
+                self.track_functions = cur.fetchone()[0]
+            self._functions_before = self._function_stats()
+        except psycopg2.Error as e:
+            self.function_error = str(e).strip()
+            if self._stats_conn is not None:
+                self._stats_conn.close()
+            self._stats_conn = None
+
+    def _function_stats(self):
+        with self._stats_conn.cursor() as cur:
+            cur.execute(function_stats_query, (self.function_schemas,))
+            return {name: (calls, total_time, self_time) for name, calls, total_time, self_time in cur}
+
+    def _phase_stack(self):
+        stack = getattr(self._local, 'phases', None)
+        if stack is None:
+            stack = self._local.phases = []
+        return stack
+
+    @contextmanager
+    def phase(self, name: str):
+        stack = self._phase_stack()
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None,
+                  'thread': threading.current_thread().name, 'start': round(self._elapsed(), 6),
+                  'seconds': None, 'sql_seconds': 0.0}
+        self.phases.append(record)
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            stack.pop()
+
+    def add_phase_sql_seconds(self, seconds: float):
+        # Statement and fetch time counts towards every open phase of the thread.
+        for phase in self._phase_stack():
+            phase['sql_seconds'] += seconds
+
+    def _query_id(self, sql: str):
+        with self._lock:
+            query = self.queries.get(sql)
+            if query is None:
+                query = self.queries[sql] = {'id': len(self.queries), 'sql': sql}
+            return query['id']
+
+    def begin_statement(self, cursor, query):
+        if isinstance(query, bytes):
+            sql = query.decode('utf-8', 'replace')
+        elif isinstance(query, str):
+            sql = query
+        else:
+            # psycopg2.sql.Composable
+            sql = query.as_string(cursor)
+        sql = sql.strip()
+        stack = self._phase_stack()
+        record = {'query': self._query_id(sql), 'start': round(self._elapsed(), 6), 'seconds': 0.0,
+                  'fetch_seconds': 0.0, 'rows': 0, 'bytes': 0, 'phase': stack[-1]['name'] if stack else None,
+                  'thread': threading.current_thread().name, '_sql': sql, '_start': time.perf_counter()}
+        self.statements.append(record)
+        cursor._record = record
+        return record
+
+    def end_execute(self, cursor, record, copy_sql: str = None):
+        record['seconds'] = time.perf_counter() - record.pop('_start')
+        self.add_phase_sql_seconds(record['seconds'])
+        sql = record.pop('_sql')
+        match = _prepare_re.match(_strip_comments(sql))
+        if match:
+            self._prepared[match.group(1).lower()] = match.group(2)
+        if copy_sql is not None:
+            record['rows'] = max(cursor.rowcount, 0)
+            record['_explain_sql'] = sql
+        elif cursor.name is None and cursor.description is None:
+            # Statements without a result set report the rows they changed.
+            record['rows'] = max(cursor.rowcount, 0)
+        elif cursor.query is not None:
+            # The statement with its parameters bound.
+            encoding = psycopg2.extensions.encodings.get(cursor.connection.encoding, 'utf-8')
+            record['_explain_sql'] = cursor.query.decode(encoding, 'replace')
+        if cursor.name is None or copy_sql is not None:
+            self.end_statement(cursor, record)
+
+    def end_statement(self, cursor, record):
+        explain_sql = record.pop('_explain_sql', None)
+        if (not self.explain or explain_sql is None or 'error' in record
+                or record['seconds'] + record['fetch_seconds'] < self.explain_threshold):
+            return
+        with self._lock:
+            if record['query'] in self._explained:
+                return
+            self._explained.add(record['query'])
+        sql = self._explainable(explain_sql)
+        if sql is None:
+            return
+        plan = {'query': record['query'], 'seconds': record['seconds'] + record['fetch_seconds']}
+        plan.update(self._run_explain(cursor.connection, sql))
+        self.plans.append(plan)
+
+    def _explainable(self, sql: str):
+        """
+        Returns the SQL to explain for a statement, or None if the statement is not a query.
+        """
+        sql = _strip_comments(sql)
+        # Server side cursors and COPY are explained with the query they run.
+        match = _declare_re.match(sql) or _copy_to_re.match(sql)
+        if match:
+            sql = _strip_comments(match.group(1))
+        match = _execute_re.match(sql)
+        if match:
+            prepared_sql = self._prepared.get(match.group(1).lower())
+            if prepared_sql is None or not _read_only_re.match(_strip_comments(prepared_sql)):
+                return None
+            return sql
+        return sql if _read_only_re.match(sql) else None
+
+    def _run_explain(self, conn, sql: str):
+        """
+        Runs EXPLAIN (ANALYZE, BUFFERS) for a statement without changing the transaction state
+        of the connection.  The statement runs read only and everything it did is rolled back.
+        """
+        status = conn.get_transaction_status()
+        if status not in (psycopg2.extensions.TRANSACTION_STATUS_IDLE, psycopg2.extensions.TRANSACTION_STATUS_INTRANS):
+            return {'error': 'The connection is not idle.'}
+        savepoint = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            if savepoint:
+                cur.execute('savepoint chadolib_explain')
+            elif conn.autocommit:
+                cur.execute('begin')
+            try:
+                cur.execute('set transaction read only')
+                cur.execute('explain (analyze, buffers, format json) ' + sql.rstrip().rstrip(';'))
+                result = {'plan': cur.fetchone()[0][0]}
+            except psycopg2.Error as e:
+                result = {'error': str(e).strip()}
+            if savepoint:
+                # Also restores the read write mode of the transaction.
+                cur.execute('rollback to savepoint chadolib_explain')
+                cur.execute('release savepoint chadolib_explain')
+            elif conn.autocommit:
+                cur.execute('rollback')
+            else:
+                # End the transaction that the explain started.
+                conn.rollback()
+        return result
+
+    def _function_times(self):
+        if self._stats_conn is None:
+            return []
+        # Each session reports its counters shortly after it goes idle or closes.
+        deadline = time.time() + FUNCTION_STATS_WAIT
+        after = self._function_stats()
+        while time.time() < deadline:
+            time.sleep(0.5)
+            latest = self._function_stats()
+            if latest == after and latest != self._functions_before:
+                break
+            after = latest
+        self._stats_conn.close()
+        functions = []
+        for name, (calls, total_time, self_time) in after.items():
+            before_calls, before_total, before_self = self._functions_before.get(name, (0, 0.0, 0.0))
+            if calls > before_calls:
+                functions.append({'function': name, 'calls': calls - before_calls,
+                                  'total_ms': round(total_time - before_total, 3),
+                                  'self_ms': round(self_time - before_self, 3)})
+        return sorted(functions, key=lambda f: f['total_ms'], reverse=True)
+
+    def trace(self):
+        """
+        Returns the trace as a dictionary.
+        """
+        queries = {query['id']: dict(query, calls=0, seconds=0.0, fetch_seconds=0.0, rows=0, bytes=0, errors=0)
+                   for query in self.queries.values()}
+        for statement in self.statements:
+            # Statements of server side cursors that were never closed.
+            statement.pop('_explain_sql', None)
+            query = queries[statement['query']]
+            query['calls'] += 1
+            query['errors'] += 'error' in statement
+            for key in ('seconds', 'fetch_seconds', 'rows', 'bytes'):
+                query[key] += statement[key]
+            for key in ('seconds', 'fetch_seconds'):
+                statement[key] = round(statement[key], 6)
+        for query in queries.values():
+            query['seconds'] = round(query['seconds'], 6)
+            query['fetch_seconds'] = round(query['fetch_seconds'], 6)
+        for phase in self.phases:
+            if phase['seconds'] is not None:
+                phase['seconds'] = round(phase['seconds'], 6)
+            phase['sql_seconds'] = round(phase['sql_seconds'], 6)
+        return {
+            'argv': sys.argv,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round(self._elapsed(), 6),
+            'queries': sorted(queries.values(), key=lambda q: q['seconds'] + q['fetch_seconds'], reverse=True),
+            'phases': self.phases,
+            'plans': self.plans,
+            'functions': {
+                'track_functions': self.track_functions,
+                'schemas': self.function_schemas,
+                'error': self.function_error,
+                'functions': self._function_times(),
+            },
+            'statements': self.statements,
+        }
+
+
+def start(trace_file: str, conn_params: dict = None, explain: bool = False, explain_threshold: float = 1.0):
+    """
+    Starts profiling.  Connections opened by get_connection from now on are instrumented.
+
+    :param trace_file: Path of the JSON trace to write.
+    :param conn_params: psycopg2.connect keyword arguments, used to read the function statistics.
+    :param explain: Capture EXPLAIN (ANALYZE, BUFFERS) plans of slow statements.
+    :param explain_threshold: Statements that take at least this many seconds are explained. default: 1.0
+    :return: The Profiler.
+    """
+    global _profiler
+    _profiler = Profiler(trace_file, conn_params, explain, explain_threshold)
+    return _profiler
+
+
+def finish():
+    """
+    Stops profiling and writes the trace.  Does nothing if profiling was not started.
+
+    :return: The trace dictionary or None.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    trace = profiler.trace()
+    with open(profiler.trace_file, 'w') as fh:
+        json.dump(trace, fh, indent=2, default=str)
+    print(f"Profile of {len(trace['statements'])} statements written to {profiler.trace_file}", file=sys.stderr)
+    return trace
+
+
+def active():
+    """
+    :return: True if profiling has been started.
+    """
+    return _profiler is not None
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Records a named phase of a script.  Does nothing if profiling was not started.
+
+    :param name: The phase name.
+    """
+    if _profiler is None:
+        yield None
+    else:
+        with _profiler.phase(name) as record:
+            yield record
+
+
+def instrument(conn):
+    """
+    Records the statements of a psycopg2 connection while profiling is active.
+
+    :param conn: psycopg2 connection.
+    :return: The connection.
+    """
+    if _profiler is not None and conn.cursor_factory in (None, psycopg2.extensions.cursor):
+        conn.cursor_factory = ProfilingCursor
+    return conn
+
+
+def instrument_engine(engine):
+    """
+    Records the statements of the connections opened by a SQLAlchemy engine while profiling is active.
+
+    :param engine: SQLAlchemy Engine.
+    :return: The engine.
+    """
+    if _profiler is not None:
+        from sqlalchemy import event
+
+        event.listen(engine, 'connect', lambda dbapi_connection, connection_record: instrument(dbapi_connection))
+    return engine
+
+
+def add_arguments(parser):
+    """
+    Adds the --profile, --explain, and --explain-threshold options to an argparse parser.
+    """
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', metavar='FILE',
+                       help='Write a JSON trace of the SQL statements, phases, and function times to FILE.')
+    group.add_argument('--explain', action='store_true',
+                       help='Add EXPLAIN (ANALYZE, BUFFERS) plans of slow queries to the trace.  The queries are '
+                            'run a second time in a read only transaction that is rolled back.')
+    group.add_argument('--explain-threshold', metavar='SECONDS', type=float, default=1.0,
+                       help='Explain statements that take at least this long. default: 1.0')
+
+
+def start_from_args(args, **conn_params):
+    """
+    Starts profiling if --profile was given.
+
+    :param args: The parsed arguments, see add_arguments.
+    :param conn_params: psycopg2.connect keyword arguments for the function statistics.
+    :return: The Profiler or None.
+    """
+    if not args.profile:
+        return None
+    return start(args.profile, conn_params or None, args.explain, args.explain_threshold)
@@ -0,0 +1,310 @@
+"""
+Module: query.py
+
+Description:
+
+A small query layer for the scripts that talk to Chado with psycopg2.
+
+* get_connection returns an open connection for a set of connection parameters,
+  reusing it on later calls instead of reconnecting.
+* ChadoSession prepares hot queries once per connection with PREPARE and runs them
+  with EXECUTE, so only the parameters are sent on each call and the plan is reused.
+* ID lookups (feature_id, cvterm_id, organism_id, scaffold feature_id) are memoized in a
+  bounded LRU cache.  The cache is tied to the release of the connected database and is
+  cleared when the release changes.
+* Scaffold and symbol lookups can also be backed by an on disk chadolib.cache.LookupCache
+  that is shared between runs.
+
+e.g.
+session = ChadoSession(get_connection(dbname='flybase', user='flybase', host='chado.flybase.org'))
+session.scaffold_id('3L')
+session.prepare('gene_name', 'select name from feature where uniquename = $1', ['text'])
+session.execute('gene_name', ('FBgn0000490',)).fetchone()
+"""
+from collections import OrderedDict
+
+import psycopg2
+
+from chadolib import profiling
+from chadolib.symbols import resolve_symbols
+
+# Open connections keyed by their connection parameters.
+_connections = {}
+# Marker for cache misses, since None is a valid cached lookup result.
+_MISSING = object()
+
+# Lookup statements prepared on demand by ChadoSession.  Each entry is the list of
+# argument types and the SQL text using $n placeholders.
+LOOKUP_STATEMENTS = {
+    'chadolib_feature_id': (['text'], """
+        select feature_id
+            from feature
+            where uniquename = $1
+              and is_obsolete = false
+            limit 1
+    """),
+    'chadolib_cvterm_id': (['text', 'text'], """
+        select cvt.cvterm_id
+            from cvterm cvt join cv on cvt.cv_id = cv.cv_id
+            where cvt.name = $1
+              and cv.name = $2
+              and cvt.is_obsolete = 0
+            limit 1
+    """),
+    'chadolib_organism_id': (['text', 'text'], """
+        select organism_id
+            from organism
+            where genus = $1
+              and species = $2
+    """),
+    'chadolib_scaffold_id': (['text', 'text', 'text', 'text'], """
+        select feature_id
+            from feature f join organism o on f.organism_id = o.organism_id
+                           join cvterm cvt on f.type_id = cvt.cvterm_id
+            where o.genus = $1
+              and o.species = $2
+              and cvt.name = $3
+              and f.is_obsolete = false
+              and f.is_analysis = false
+              and f.name = $4
+    """),
+}
+
+
+def get_connection(**params):
+    """
+    Returns an open psycopg2 connection for the given connection parameters.
+
+    Connections are reused across calls with the same parameters until they are closed.
+    New connections are instrumented if chadolib.profiling has been started.
+
+    :param params: psycopg2.connect keyword arguments (dbname, user, host, etc.)
+    :return: psycopg2 connection object.
+    """
+    key = tuple(sorted(params.items()))
+    conn = _connections.get(key)
+    if conn is None or conn.closed:
+        conn = profiling.instrument(psycopg2.connect(**params))
+        _connections[key] = conn
+    return conn
+
+
+def close_connections():
+    """
+    Closes all connections opened by get_connection.
+    """
+    for conn in _connections.values():
+        if not conn.closed:
+            conn.close()
+    _connections.clear()
+
+
+def fetch_release(conn):
+    """
+    Returns a string that identifies the release loaded in the connected database.
+
+    Chado does not record the FlyBase release in a standard place, so this combines the
+    database name with the highest feature_id, which changes whenever a new release is loaded.
+    Both are a single index probe.
+
+    :param conn: psycopg2 connection object.
+    :return: Release identifier string, e.g. 'flybase:87412345'
+    """
+    with conn.cursor() as cur:
+        cur.execute("select current_database(), (select max(feature_id) from feature)")
+        dbname, max_feature_id = cur.fetchone()
+    return f'{dbname}:{max_feature_id}'
+
+
+class LRUCache:
+    """
+    A bounded least recently used cache that is tied to a database release.
+    """
+
+    def __init__(self, maxsize: int = 4096, release: str = None):
+        if maxsize < 1:
+            raise ValueError("Cache size must be a positive integer.")
+        self.maxsize = maxsize
+        self.release = release
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def check_release(self, release: str):
+        """
+        Clears the cache if it was filled from a different release.
+
+        :param release: The release of the connected database.
+        :return: True if the cache was invalidated.
+        """
+        if release == self.release:
+            return False
+        self.clear()
+        self.release = release
+        return True
+
+
+class ChadoSession:
+    """
+    Wraps a psycopg2 connection with prepared statements and cached ID lookups.
+    """
+
+    def __init__(self, conn, cache_size: int = 4096, release: str = None, lookup_cache=None):
+        self.conn = conn
+        self.lookup_cache = lookup_cache
+        if release is None and lookup_cache is not None:
+            release = lookup_cache.release
+        self.cache = LRUCache(cache_size, release or fetch_release(conn))
+        self._statements = dict(LOOKUP_STATEMENTS)
+        self._prepared = set()
+
+    @property
+    def release(self):
+        return self.cache.release
+
+    def refresh_release(self):
+        """
+        Checks the release of the connected database and clears the lookup cache if it changed.
+
+        :return: True if the cache was invalidated.
+        """
+        return self.cache.check_release(fetch_release(self.conn))
+
+    def prepare(self, name: str, sql: str, arg_types: list = ()):
+        """
+        Registers a statement to be prepared on first use.
+
+        :param name: The statement name, must be a valid SQL identifier.
+        :param sql: The SQL text using $1, $2, ... for parameters.
+        :param arg_types: The PostgreSQL types of the parameters, e.g. ['text', 'integer'].
+        """
+        if name in self._prepared and self._statements.get(name) != (list(arg_types), sql):
+            raise ValueError(f"Statement '{name}' has already been prepared with different SQL.")
+        self._statements[name] = (list(arg_types), sql)
+
+    def execute(self, name: str, params: tuple = (), cursor=None):
+        """
+        Executes a registered statement, preparing it on the server first if needed.
+
+        :param name: The statement name.
+        :param params: The statement parameters.
+        :param cursor: Optional cursor to execute on.  default: a new cursor
+        :return: The cursor with the statement results.
+        """
+        if name not in self._statements:
+            raise ValueError(f"Unknown statement '{name}'.")
+        cur = cursor or self.conn.cursor()
+        if name not in self._prepared:
+            arg_types, sql = self._statements[name]
+            types = f" ({', '.join(arg_types)})" if arg_types else ''
+            # Another session on the same connection may have prepared a statement with this name.
+            cur.execute('select 1 from pg_prepared_statements where name = lower(%s)', (name,))
+            if cur.fetchone():
+                cur.execute(f'deallocate {name}')
+            cur.execute(f'prepare {name}{types} as {sql}')
+            self._prepared.add(name)
+        if params:
+            cur.execute(f"execute {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+        else:
+            cur.execute(f'execute {name}')
+        return cur
+
+    def _lookup(self, statement: str, params: tuple):
+        key = (statement, params)
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            row = self.execute(statement, params).fetchone()
+            value = row[0] if row else None
+            self.cache.set(key, value)
+        return value
+
+    def feature_id(self, uniquename: str):
+        """
+        :param uniquename: The feature.uniquename, e.g. 'FBgn0000490'
+        :return: The feature_id of the non obsolete feature or None.
+        """
+        return self._lookup('chadolib_feature_id', (uniquename,))
+
+    def cvterm_id(self, name: str, cv: str):
+        """
+        :param name: The cvterm name.
+        :param cv: The cv name.
+        :return: The cvterm_id of the non obsolete term or None.
+        """
+        return self._lookup('chadolib_cvterm_id', (name, cv))
+
+    def organism_id(self, genus: str, species: str):
+        """
+        :param genus: The organism genus.
+        :param species: The organism species.
+        :return: The organism_id or None.
+        """
+        return self._lookup('chadolib_organism_id', (genus, species))
+
+    def scaffold_id(self, scaffold_name: str, genus: str = 'Drosophila', species: str = 'melanogaster',
+                    scaffold_type: str = 'golden_path'):
+        """
+        :param scaffold_name: The name of the scaffold, e.g. '3L'
+        :param genus: The genus of the scaffold organism. default: 'Drosophila'
+        :param species: The species of the scaffold organism. default: 'melanogaster'
+        :param scaffold_type: The feature type of the scaffold. default: 'golden_path'
+        :return: The feature_id of the scaffold or None.
+        """
+        params = (genus, species, scaffold_type, scaffold_name)
+        if self.lookup_cache is None:
+            return self._lookup('chadolib_scaffold_id', params)
+
+        key = ('chadolib_scaffold_id', params)
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.lookup_cache.scaffold_ids([scaffold_name], genus, species, scaffold_type)[scaffold_name]
+            self.cache.set(key, value)
+        return value
+
+    def scaffold_ids(self, scaffold_names, genus: str = 'Drosophila', species: str = 'melanogaster',
+                     scaffold_type: str = 'golden_path'):
+        """
+        :param scaffold_names: Iterable of scaffold names.
+        :param genus: The genus of the scaffold organism. default: 'Drosophila'
+        :param species: The species of the scaffold organism. default: 'melanogaster'
+        :param scaffold_type: The feature type of the scaffold. default: 'golden_path'
+        :return: Dictionary of scaffold name to feature_id or None.
+        """
+        if self.lookup_cache is not None:
+            return self.lookup_cache.scaffold_ids(scaffold_names, genus, species, scaffold_type)
+        return {name: self.scaffold_id(name, genus, species, scaffold_type) for name in scaffold_names}
+
+    def symbols(self, ids):
+        """
+        Resolves the current symbols of FlyBase IDs in bulk, from the lookup cache if there is one.
+
+        :param ids: Iterable of FlyBase IDs.
+        :return: Dictionary of FlyBase ID to current symbol or None.
+        """
+        if self.lookup_cache is not None:
+            return self.lookup_cache.symbols(ids)
+        return resolve_symbols(self.conn, ids)
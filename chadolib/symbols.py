@@ -0,0 +1,87 @@
+"""
+Module: symbols.py
+
+Description:
+
+Client side helpers for resolving current symbols and other synonyms of FlyBase IDs
+with the set based flybase.current_synonyms SQL function (see schema/symbols/main.sql).
+
+Instead of calling flybase.current_symbol once per output row, the distinct IDs of a
+result set are sent to Chado as an array and resolved in one query.
+
+e.g.
+symbols = resolve_symbols(conn, ['FBgn0000490', 'FBtr0070000'])
+df = add_symbols(df, conn, id_column='fbid')
+"""
+
+# Maximum number of IDs sent to Chado in a single query.
+DEFAULT_CHUNK_SIZE = 100000
+
+current_synonyms_query = """
+select id, synonym
+    from flybase.current_synonyms(%s::text[], %s)
+"""
+
+
+def dbapi_connection(conn):
+    """
+    Returns the DBAPI (psycopg2) connection for a psycopg2 or SQLAlchemy connection.
+    """
+    # SQLAlchemy Connection objects wrap the DBAPI connection.
+    return getattr(conn, 'connection', conn)
+
+
+def resolve_synonyms(conn, ids, synonym_type: str = 'symbol', chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Resolves the current synonym of the given type for a collection of FlyBase IDs.
+
+    :param conn: psycopg2 or SQLAlchemy connection to the Chado database.
+    :param ids: Iterable of FlyBase IDs, repeats and None are ignored.
+    :param synonym_type: The synonym type, e.g. 'symbol' or 'fullname'. default: 'symbol'
+    :param chunk_size: The maximum number of IDs to send per query. default: 100000
+    :return: Dictionary of FlyBase ID to current synonym or None.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    synonyms = {}
+    if not ids:
+        return synonyms
+
+    cur = dbapi_connection(conn).cursor()
+    try:
+        for offset in range(0, len(ids), chunk_size):
+            cur.execute(current_synonyms_query, (ids[offset:offset + chunk_size], synonym_type))
+            synonyms.update(cur.fetchall())
+    finally:
+        cur.close()
+    return synonyms
+
+
+def resolve_symbols(conn, ids, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Resolves the current symbol for a collection of FlyBase IDs.
+
+    :param conn: psycopg2 or SQLAlchemy connection to the Chado database.
+    :param ids: Iterable of FlyBase IDs.
+    :param chunk_size: The maximum number of IDs to send per query. default: 100000
+    :return: Dictionary of FlyBase ID to current symbol or None.
+    """
+    return resolve_synonyms(conn, ids, 'symbol', chunk_size)
+
+
+def add_symbols(df, conn, id_column: str = None, symbol_column: str = 'symbol', synonym_type: str = 'symbol'):
+    """
+    Adds a column with the current symbol (or other synonym) of each FlyBase ID in a DataFrame.
+
+    :param df: pandas DataFrame with FlyBase IDs in a column or the index.
+    :param conn: psycopg2 or SQLAlchemy connection to the Chado database.
+    :param id_column: The column holding the FlyBase IDs. default: the DataFrame index
+    :param symbol_column: The name of the column to add. default: 'symbol'
+    :param synonym_type: The synonym type to resolve. default: 'symbol'
+    :return: The DataFrame with the added column.
+    """
+    ids = df.index if id_column is None else df[id_column]
+    synonyms = resolve_synonyms(conn, ids.unique(), synonym_type)
+    df[symbol_column] = ids.map(synonyms.get)
+    return df
@@ -23,12 +23,48 @@ species from 18 orthology algorithms.
 
 The intersection of these two lists is one possible answer to this question.
 
+The results are written to CSV files by default.  With --format parquet or --format arrow
+the query results are read with binary COPY straight into typed Arrow columns and written
+to zstd compressed Parquet or Arrow IPC files with the same names and a .parquet or .arrow
+extension (see chadolib/columnar.py, requires pyarrow).
+
 """
 
+import os
+import sys
+
 import pandas as pd
 import argparse
 from sqlalchemy import create_engine
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chadolib import columnar, profiling  # noqa: E402
+from chadolib.cache import LookupCache  # noqa: E402
+from chadolib.parallel import create_pooled_engine, report_timings, run_concurrently  # noqa: E402
+from chadolib.query import close_connections, get_connection  # noqa: E402
+
+# Output files.
+GO_COUNTS_FILE = 'dmel_go_counts.csv'
+FEW_GO_ASPECTS_FILE = 'dmel_few_go_aspects.csv'
+ORTHOLOG_COUNTS_FILE = 'dmel_orthologs_species_count.csv'
+FINAL_FILE = 'conserved_darkened_genes.csv'
+
+# Genes with this many GO aspects or less are considered to have sparse annotations.
+MAX_GO_ASPECTS = 1
+# The number of species in DIOPT, genes with orthologs in all of them are considered highly conserved.
+NUM_DIOPT_SPECIES = 9
+
+# Empty results with the columns of fetch_go_counts and fetch_ortholog_counts, written by the
+# streaming mode when a query returns no rows.
+EMPTY_GO_COUNTS = pd.DataFrame({'symbol': pd.Series([], dtype=object),
+                                'biological_process': pd.Series([], dtype='int32'),
+                                'molecular_function': pd.Series([], dtype='int32'),
+                                'cellular_component': pd.Series([], dtype='int32'),
+                                'num_aspects': pd.Series([], dtype='int64')},
+                               index=pd.Index([], name='fbid', dtype=object))
+EMPTY_ORTHOLOG_COUNTS = pd.DataFrame({'num_ortho_species': pd.Series([], dtype='int64')},
+                                     index=pd.Index([], name='fbid', dtype=object))
+
 """
 Name: setup_go_func
 Description:
@@ -56,7 +92,7 @@ Returns:
 
 def setup_go_func(conn):
     conn.execute("""
-    create function pg_temp.experimental_go_count(fbgn text, aspect text) returns integer as $$
+    create or replace function pg_temp.experimental_go_count(fbgn text, aspect text) returns integer as $$
     select count(distinct cvt.name)::integer
        from feature f join feature_cvterm fcvt on (f.feature_id=fcvt.feature_id)
                       join cvterm cvt on (fcvt.cvterm_id=cvt.cvterm_id)
@@ -79,6 +115,136 @@ def setup_go_func(conn):
     """)
 
 
+# The Following SQL returns GO term counts for all GO aspects for Dmel genes
+# that have been localized to the genome, one pg_temp.experimental_go_count call per gene and aspect.
+PER_GENE_GO_COUNTS_SQL = """
+select gene.uniquename as fbid,
+       flybase.current_symbol(gene.uniquename) as symbol,
+       pg_temp.experimental_go_count(gene.uniquename,'biological_process') as biological_process,
+       pg_temp.experimental_go_count(gene.uniquename,'molecular_function') as molecular_function,
+       pg_temp.experimental_go_count(gene.uniquename,'cellular_component') as cellular_component
+    from feature gene join cvterm cvt on (gene.type_id=cvt.cvterm_id)
+                      join organism org on (gene.organism_id=org.organism_id)
+                      join featureloc fl on (gene.feature_id=fl.feature_id)
+    where gene.uniquename ~ '^FBgn[0-9]+$'
+      and gene.is_obsolete = false
+      and gene.is_analysis = false
+      and cvt.name = 'gene'
+      and org.genus = 'Drosophila' and org.species = 'melanogaster'
+;
+"""
+
+# Same result as PER_GENE_GO_COUNTS_SQL, but the experimental term counts for all three aspects
+# of every gene are computed in a single grouped pass.  Annotations qualified with 'NOT' are
+# removed with an anti-join instead of a correlated subquery.
+GROUPED_GO_COUNTS_SQL = """
+with genes as (
+    select gene.feature_id, gene.uniquename
+        from feature gene join cvterm cvt on (gene.type_id=cvt.cvterm_id)
+                          join organism org on (gene.organism_id=org.organism_id)
+                          join featureloc fl on (gene.feature_id=fl.feature_id)
+        where gene.uniquename ~ '^FBgn[0-9]+$'
+          and gene.is_obsolete = false
+          and gene.is_analysis = false
+          and cvt.name = 'gene'
+          and org.genus = 'Drosophila' and org.species = 'melanogaster'
+),
+go_counts as (
+    select f.uniquename,
+           count(distinct cvt.name) filter (where cv.name = 'biological_process') as biological_process,
+           count(distinct cvt.name) filter (where cv.name = 'molecular_function') as molecular_function,
+           count(distinct cvt.name) filter (where cv.name = 'cellular_component') as cellular_component
+       from feature f join feature_cvterm fcvt on (f.feature_id=fcvt.feature_id)
+                      join cvterm cvt on (fcvt.cvterm_id=cvt.cvterm_id)
+                      join cv on (cvt.cv_id=cv.cv_id)
+                      join feature_cvtermprop ev_code on (fcvt.feature_cvterm_id=ev_code.feature_cvterm_id)
+                      join cvterm ev_code_type on (ev_code.type_id=ev_code_type.cvterm_id)
+       where f.uniquename in (select uniquename from genes)
+          and cv.name in ('biological_process', 'molecular_function', 'cellular_component')
+          -- The following ignores terms that have been annotated with 'NOT'
+          and not exists (
+              select 1
+                 from feature_cvtermprop fcvtp join cvterm fcvtp_type on (fcvtp.type_id=fcvtp_type.cvterm_id)
+                 where fcvtp.feature_cvterm_id = fcvt.feature_cvterm_id
+                   and fcvtp_type.name = 'NOT'
+          )
+          -- Select only experimental terms, no annotations from predictions.
+          and ev_code_type.name = 'evidence_code'
+          and ev_code.value ~
+          'inferred from (physical interaction|direct assay|genetic interaction|mutant phenotype|expression pattern|(high throughput (experiment|direct assay|expression pattern|genetic interaction|mutant phenotype)))'
+       group by f.uniquename
+)
+select genes.uniquename as fbid,
+       {symbol} as symbol,
+       coalesce(go_counts.biological_process, 0)::integer as biological_process,
+       coalesce(go_counts.molecular_function, 0)::integer as molecular_function,
+       coalesce(go_counts.cellular_component, 0)::integer as cellular_component
+    from genes left join go_counts on (genes.uniquename=go_counts.uniquename)
+               {symbol_join}
+;
+"""
+
+# Symbol column and join for the GROUPED_GO_COUNTS_SQL and SUMMARY_TABLE_GO_COUNTS_SQL templates.
+# The symbols of all genes are resolved in one flybase.current_symbols call, or left null
+# and filled in from a chadolib LookupCache.
+GO_COUNTS_SYMBOL_SQL = {
+    'grouped': ('sym.symbol',
+                'left join flybase.current_symbols(array(select uniquename from genes)) sym '
+                'on (genes.uniquename=sym.id)'),
+    'summary_table': ('sym.symbol',
+                      'left join flybase.current_symbols(array(select id from dataclass.gene_go_aspect_count)) sym '
+                      'on (go.id=sym.id)'),
+}
+NO_SYMBOL_SQL = ('null::varchar(255)', '')
+
+# Reads the GO term counts from the table maintained by flybase.refresh_gene_go_aspect_count().
+SUMMARY_TABLE_GO_COUNTS_SQL = """
+select go.id as fbid,
+       {symbol} as symbol,
+       go.biological_process,
+       go.molecular_function,
+       go.cellular_component
+    from dataclass.gene_go_aspect_count go
+        {symbol_join}
+;
+"""
+
+
+# SQL to fetch counts of species in orthology calls for all Dmel genes that are localized to the genome.
+ORTHOLOG_COUNTS_SQL = """
+select gene.uniquename as fbid,
+       count(distinct fbog.organism_id) as num_ortho_species
+    from feature gene join feature_relationship ortho_rel on (gene.feature_id=ortho_rel.object_id)
+                      join feature fbog on (ortho_rel.subject_id=fbog.feature_id)
+                      join cvterm fr_type on (ortho_rel.type_id=fr_type.cvterm_id)
+                      join feature_relationshipprop frp on (ortho_rel.feature_relationship_id=frp.feature_relationship_id)
+                      join organism org on (gene.organism_id=org.organism_id)
+                      join cvterm cvt on (gene.type_id=cvt.cvterm_id)
+                      join featureloc fl on (gene.feature_id=fl.feature_id)
+    where gene.uniquename ~ '^FBgn[0-9]+$'
+      and gene.is_analysis = false
+      and gene.is_obsolete = false
+      and cvt.name = 'gene'
+      and fbog.is_analysis = false
+      and fbog.is_obsolete = false
+      and fr_type.name = 'orthologous_to'
+      and frp.value = 'DIOPT'
+      and org.genus = 'Drosophila'
+      and org.species ='melanogaster'
+group by gene.uniquename
+;
+"""
+
+# Reads the species counts from the table maintained by flybase.refresh_gene_diopt_species_count().
+SUMMARY_TABLE_ORTHOLOG_COUNTS_SQL = """
+select ortho.id as fbid,
+       ortho.num_ortho_species
+    from dataclass.gene_diopt_species_count ortho
+    where ortho.num_ortho_species > 0
+;
+"""
+
+
 """
 Name: fetch_go_counts
 Description:
@@ -87,9 +253,26 @@ This function queries a FlyBase Chado database and returns a list of all FlyBase
 that have been localized to the genome.  The columns include the FlyBase FBgn ID, the
 gene symbol, term counts by GO aspect, and the number of aspects with more than 0 terms.
 
+Two methods are available for computing the GO term counts.
+
+grouped  - (default) Computes the counts for all three aspects of every gene in a single
+           grouped pass over the GO annotations.
+per_gene - Calls the pg_temp.experimental_go_count SQL function once per gene and aspect.
+           This is the original method and is kept for comparison (see benchmarks/go_counts.py).
+summary_table - Reads the precomputed counts from dataclass.gene_go_aspect_count
+                (see schema/data_classes/gene_annotation_counts.sql).
+
+The grouped and per_gene methods return the same DataFrame.  The summary_table method returns
+one row per gene.
+
+If a chadolib LookupCache is given, the grouped and summary_table methods read the gene symbols
+from the local cache instead of resolving them in Chado.
 
 Arguments:
     conn - A SQLAlchemy Connection object.
+    method - The method used to compute the GO term counts ('grouped', 'per_gene', or 'summary_table').
+    lookup_cache - Optional chadolib.cache.LookupCache for the gene symbols.
+    binary - Read the results with binary COPY into Arrow columns instead of pandas.read_sql (requires pyarrow).
 
 Returns:
     DataFrame - A Data frame with the gene ID, symbol, term counts for all 3 GO aspects, and
@@ -97,29 +280,73 @@ Returns:
 """
 
 
-def fetch_go_counts(conn):
-    # Install a SQL function that is used by this function.
-    setup_go_func(conn)
+def fetch_go_counts(conn, method='grouped', lookup_cache=None, binary=False):
+    with profiling.phase('GO counts'):
+        df = read_frame(conn, go_counts_sql(conn, method, lookup_cache), binary)
+        return add_num_aspects(add_cached_symbols(df, method, lookup_cache))
 
-    # The Following SQL returns GO term counts for all GO aspects for Dmel genes
-    # that have been localized to the genome.
-    fbgn_go_counts_sql = """
-    select gene.uniquename as fbid,
-           flybase.current_symbol(gene.uniquename) as symbol,
-           pg_temp.experimental_go_count(gene.uniquename,'biological_process') as biological_process,
-           pg_temp.experimental_go_count(gene.uniquename,'molecular_function') as molecular_function,
-           pg_temp.experimental_go_count(gene.uniquename,'cellular_component') as cellular_component
-        from feature gene join cvterm cvt on (gene.type_id=cvt.cvterm_id)
-                          join organism org on (gene.organism_id=org.organism_id)
-                          join featureloc fl on (gene.feature_id=fl.feature_id)
-        where gene.uniquename ~ '^FBgn[0-9]+$'
-          and gene.is_obsolete = false
-          and gene.is_analysis = false
-          and cvt.name = 'gene'
-          and org.genus = 'Drosophila' and org.species = 'melanogaster'
-    ;
-    """
-    df = pd.read_sql(fbgn_go_counts_sql, conn, index_col='fbid')
+
+"""
+Name: stream_go_counts
+Description:
+
+Streaming version of fetch_go_counts.  The query is run with a server side cursor and the
+results are returned as a sequence of DataFrames with at most chunksize rows each, so the
+full result set is never held in client memory.
+
+Arguments:
+    conn - A SQLAlchemy Connection object.
+    method - The method used to compute the GO term counts (see fetch_go_counts).
+    chunksize - The maximum number of rows per DataFrame.
+    lookup_cache - Optional chadolib.cache.LookupCache for the gene symbols.
+    binary - Read the results with binary COPY into Arrow columns (see fetch_go_counts).
+
+Returns:
+    Generator of DataFrames with the same columns as fetch_go_counts.
+"""
+
+
+def stream_go_counts(conn, method='grouped', chunksize=10000, lookup_cache=None, binary=False):
+    sql = go_counts_sql(conn, method, lookup_cache)
+    for df in stream_frames(conn, sql, chunksize, binary):
+        yield add_num_aspects(add_cached_symbols(df, method, lookup_cache))
+
+
+def go_counts_sql(conn, method, lookup_cache=None):
+    if method == 'per_gene':
+        # Install a SQL function that is used by this method.
+        setup_go_func(conn)
+        return PER_GENE_GO_COUNTS_SQL
+    elif method in GO_COUNTS_SYMBOL_SQL:
+        template = GROUPED_GO_COUNTS_SQL if method == 'grouped' else SUMMARY_TABLE_GO_COUNTS_SQL
+        symbol, symbol_join = NO_SYMBOL_SQL if lookup_cache is not None else GO_COUNTS_SYMBOL_SQL[method]
+        return template.format(symbol=symbol, symbol_join=symbol_join)
+    raise ValueError("Unknown GO count method '{}'.".format(method))
+
+
+def read_frame(conn, sql, binary=False):
+    # Reads a query result indexed by fbid, with binary COPY into Arrow columns or with pandas.read_sql.
+    if binary:
+        return columnar.read_frame(conn.connection, sql, index_col='fbid')
+    return pd.read_sql(sql, conn, index_col='fbid')
+
+
+def stream_frames(conn, sql, chunksize=10000, binary=False):
+    # Streaming version of read_frame.
+    if binary:
+        return columnar.stream_frames(conn.connection, sql, index_col='fbid', chunk_size=chunksize)
+    return pd.read_sql(sql, conn.execution_options(stream_results=True), index_col='fbid', chunksize=chunksize)
+
+
+def add_cached_symbols(df, method, lookup_cache=None):
+    # Fills in the symbol column from the lookup cache when the query did not resolve them.
+    if lookup_cache is not None and method in GO_COUNTS_SYMBOL_SQL:
+        symbols = lookup_cache.symbols(df.index)
+        df['symbol'] = df.index.map(symbols.get)
+    return df
+
+
+def add_num_aspects(df):
     # Counts the number of GO aspect columns with non zero values and adds it as a new
     # column to the DataFrame as 'num_aspects'.
     df['num_aspects'] = df[['biological_process', 'molecular_function', 'cellular_component']].astype(bool).sum(axis=1)
@@ -134,8 +361,16 @@ This function queries a FlyBase Chado database and returns a DataFrame containin
 and the number of species that are reported by DIOPT in orthology calls.  No filtering of calls by
 score is attempted here, which could be a source of furture improvements.
 
+Two methods are available.
+
+query         - (default) Computes the counts from the feature_relationship tables.
+summary_table - Reads the precomputed counts from dataclass.gene_diopt_species_count
+                (see schema/data_classes/gene_annotation_counts.sql).
+
 Arguments:
     conn - A SQLAlchemy Connection object.
+    method - The method used to compute the species counts ('query' or 'summary_table').
+    binary - Read the results with binary COPY into Arrow columns (see fetch_go_counts).
 
 Returns:
     DataFrame - A DataFrame with the FlyBase gene ID and the number of species in the DIOPT reported
@@ -143,32 +378,61 @@ Returns:
 """
 
 
-def fetch_ortholog_counts(conn):
-    # SQL to fetch counts of species in orthology calls for all Dmel genes that are localized to the genome.
-    ortholog_counts_sql = """
-            select gene.uniquename as fbid,
-                   count(distinct fbog.organism_id) as num_ortho_species
-                from feature gene join feature_relationship ortho_rel on (gene.feature_id=ortho_rel.object_id)
-                                  join feature fbog on (ortho_rel.subject_id=fbog.feature_id)
-                                  join cvterm fr_type on (ortho_rel.type_id=fr_type.cvterm_id)
-                                  join feature_relationshipprop frp on (ortho_rel.feature_relationship_id=frp.feature_relationship_id)
-                                  join organism org on (gene.organism_id=org.organism_id)
-                                  join cvterm cvt on (gene.type_id=cvt.cvterm_id)
-                                  join featureloc fl on (gene.feature_id=fl.feature_id)
-                where gene.uniquename ~ '^FBgn[0-9]+$'
-                  and gene.is_analysis = false
-                  and gene.is_obsolete = false
-                  and cvt.name = 'gene'
-                  and fbog.is_analysis = false
-                  and fbog.is_obsolete = false
-                  and fr_type.name = 'orthologous_to'
-                  and frp.value = 'DIOPT'
-                  and org.genus = 'Drosophila'
-                  and org.species ='melanogaster'
-            group by gene.uniquename
-            ;
-            """
-    return pd.read_sql(ortholog_counts_sql, conn, index_col='fbid')
+def fetch_ortholog_counts(conn, method='query', binary=False):
+    with profiling.phase('ortholog counts'):
+        return read_frame(conn, ortholog_counts_sql(method), binary)
+
+
+"""
+Name: stream_ortholog_counts
+Description:
+
+Streaming version of fetch_ortholog_counts that returns the results as a sequence of
+DataFrames with at most chunksize rows each.
+
+Arguments:
+    conn - A SQLAlchemy Connection object.
+    method - The method used to compute the species counts (see fetch_ortholog_counts).
+    chunksize - The maximum number of rows per DataFrame.
+    binary - Read the results with binary COPY into Arrow columns (see fetch_go_counts).
+
+Returns:
+    Generator of DataFrames with the same columns as fetch_ortholog_counts.
+"""
+
+
+def stream_ortholog_counts(conn, method='query', chunksize=10000, binary=False):
+    return stream_frames(conn, ortholog_counts_sql(method), chunksize, binary)
+
+
+def ortholog_counts_sql(method):
+    if method == 'query':
+        return ORTHOLOG_COUNTS_SQL
+    elif method == 'summary_table':
+        return SUMMARY_TABLE_ORTHOLOG_COUNTS_SQL
+    raise ValueError("Unknown ortholog count method '{}'.".format(method))
+
+
+"""
+Name: refresh_summary_tables
+Description:
+
+Brings the GO and DIOPT summary tables up to date by recomputing only those genes whose
+annotations changed since the last refresh.  This requires write access to the database.
+
+Arguments:
+    conn - A SQLAlchemy Connection object.
+    full_rebuild - Recompute every gene instead of only those that changed.
+
+Returns:
+    DataFrame - The number of genes recomputed for each table.
+"""
+
+
+def refresh_summary_tables(conn, full_rebuild=False):
+    with conn.begin():
+        return pd.read_sql("select * from flybase.refresh_gene_annotation_counts(%(full_rebuild)s)", conn,
+                           params={'full_rebuild': full_rebuild})
 
 
 def main():
@@ -179,32 +443,226 @@ def main():
     parser.add_argument("-W", "--password", help="Chado database password.")
     parser.add_argument("-d", "--dbname", help="Chado database password.", default="flybase")
     parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("--summary-tables", action="store_true",
+                        help="Read GO and ortholog counts from the dataclass summary tables.")
+    parser.add_argument("--refresh-summary-tables", action="store_true",
+                        help="Refresh the dataclass summary tables before reading them (requires write access).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream query results in chunks and write the output files incrementally.")
+    parser.add_argument("--chunksize", help="Number of rows per chunk when streaming.", default=10000, type=int)
+    parser.add_argument("--parallel", action="store_true",
+                        help="Run the GO and ortholog queries at the same time on separate connections.")
+    parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                        help="Read gene symbols from the local lookup cache in DIR (default: ~/.cache/chadolib), "
+                             "which is filled on the first run and reset when the database release changes.")
+    columnar.add_arguments(parser, text_format='csv')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    if args.parallel and args.stream:
+        parser.error("--parallel and --stream can not be used together.")
+    if args.output_format != 'csv':
+        # Fail before connecting when pyarrow is missing.
+        columnar.import_pyarrow()
+    binary = args.output_format != 'csv'
+    profiling.start_from_args(args, host=args.host, user=args.username, password=args.password, port=args.port,
+                              dbname=args.dbname)
 
     # Init the SQLAlchemy engine and connect.
-    engine = create_engine(
-        'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(args.username, args.password, args.host, args.port, args.dbname),
-        client_encoding='utf8')
+    url = 'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(args.username, args.password, args.host, args.port,
+                                                         args.dbname)
+    if args.parallel:
+        engine = create_pooled_engine(url, pool_size=2)
+    else:
+        engine = create_engine(url, client_encoding='utf8')
+    profiling.instrument_engine(engine)
     conn = engine.connect()
 
-    # Fetch GO counts and store them to a CSV file.
-    go_counts = fetch_go_counts(conn)
-    go_counts.to_csv('dmel_go_counts.csv')
+    go_method, ortholog_method = 'grouped', 'query'
+    if args.summary_tables or args.refresh_summary_tables:
+        go_method, ortholog_method = 'summary_table', 'summary_table'
+    if args.refresh_summary_tables:
+        print(refresh_summary_tables(conn).to_string(index=False))
+
+    lookup_cache = None
+    if args.cache is not None:
+        # Cache misses are resolved on their own connection.
+        cache_conn = get_connection(host=args.host, user=args.username, password=args.password, port=args.port,
+                                    dbname=args.dbname)
+        lookup_cache = LookupCache.open(cache_conn, args.cache or None)
+
+    try:
+        if args.stream:
+            write_results_streaming(conn, go_method, ortholog_method, args.chunksize, lookup_cache,
+                                    args.output_format)
+        elif args.parallel:
+            conn.close()
+            go_counts, gene_orthologs_species_count = fetch_counts_parallel(engine, go_method, ortholog_method,
+                                                                            lookup_cache, binary)
+            write_results(go_counts, gene_orthologs_species_count, args.output_format)
+        else:
+            go_counts = fetch_go_counts(conn, method=go_method, lookup_cache=lookup_cache, binary=binary)
+            gene_orthologs_species_count = fetch_ortholog_counts(conn, method=ortholog_method, binary=binary)
+            write_results(go_counts, gene_orthologs_species_count, args.output_format)
+    finally:
+        if lookup_cache is not None:
+            lookup_cache.close()
+        # Close every session before finishing the profile, the server only reports the function
+        # counters of sessions that are idle outside a transaction or closed.
+        conn.close()
+        engine.dispose()
+        close_connections()
+        profiling.finish()
+
+
+"""
+Name: fetch_counts_parallel
+Description:
+
+Runs fetch_go_counts and fetch_ortholog_counts at the same time on separate pooled
+connections and prints the wall time of each query to STDERR.
+
+Arguments:
+    engine - A SQLAlchemy Engine with a pool of at least 2 connections.
+    go_method - The method used to compute the GO term counts (see fetch_go_counts).
+    ortholog_method - The method used to compute the species counts (see fetch_ortholog_counts).
+    lookup_cache - Optional chadolib.cache.LookupCache for the gene symbols.
+    binary - Read the results with binary COPY into Arrow columns (see fetch_go_counts).
+
+Returns:
+    Tuple - The GO counts and ortholog counts DataFrames.
+"""
+
+
+def fetch_counts_parallel(engine, go_method='grouped', ortholog_method='query', lookup_cache=None, binary=False):
+    results, timings = run_concurrently(engine, {
+        'go_counts': lambda conn: fetch_go_counts(conn, method=go_method, lookup_cache=lookup_cache, binary=binary),
+        'ortholog_counts': lambda conn: fetch_ortholog_counts(conn, method=ortholog_method, binary=binary),
+    })
+    report_timings(timings)
+    return results['go_counts'], results['ortholog_counts']
+
+
+"""
+Name: write_results
+Description:
+
+Takes the GO and ortholog counts, selects the conserved darkened genes, and writes
+all results to files in the current directory.
+
+Arguments:
+    go_counts - DataFrame returned by fetch_go_counts.
+    gene_orthologs_species_count - DataFrame returned by fetch_ortholog_counts.
+    output_format - The format of the output files ('csv', 'parquet', or 'arrow').
+
+Returns:
+    None
+"""
+
+
+def write_results(go_counts, gene_orthologs_species_count, output_format='csv'):
+    # Store GO counts to a file.
+    with profiling.phase('write ' + GO_COUNTS_FILE):
+        write_frame(go_counts, GO_COUNTS_FILE, output_format)
 
     # Select out genes with 1 or less GO aspects and store to a file.
-    genes_few_go_aspects = go_counts[go_counts['num_aspects'] <= 1]
-    genes_few_go_aspects.to_csv('dmel_few_go_aspects.csv')
+    with profiling.phase('write ' + FEW_GO_ASPECTS_FILE):
+        genes_few_go_aspects = go_counts[go_counts['num_aspects'] <= MAX_GO_ASPECTS]
+        write_frame(genes_few_go_aspects, FEW_GO_ASPECTS_FILE, output_format)
 
-    # Fetch ortholog counts and store to a file.
-    gene_orthologs_species_count = fetch_ortholog_counts(conn)
-    gene_orthologs_species_count.to_csv('dmel_orthologs_species_count.csv')
+    # Store ortholog counts to a file.
+    with profiling.phase('write ' + ORTHOLOG_COUNTS_FILE):
+        write_frame(gene_orthologs_species_count, ORTHOLOG_COUNTS_FILE, output_format)
 
     # Calculate the intersection between the GO and orthology lists.
-    merged_gene_list = pd.merge(genes_few_go_aspects, gene_orthologs_species_count, on='fbid')
-    final_filename = 'conserved_darkened_genes.csv'
-    print("Saving final gene list to {}".format(final_filename))
-    # Save those genes from the merged list that are conserved across all current DIOPT species.
-    merged_gene_list[merged_gene_list['num_ortho_species'] == 9].to_csv(final_filename)
+    with profiling.phase('write ' + FINAL_FILE):
+        merged_gene_list = pd.merge(genes_few_go_aspects, gene_orthologs_species_count, on='fbid')
+        print("Saving final gene list to {}".format(columnar.output_path(FINAL_FILE, output_format)))
+        # Save those genes from the merged list that are conserved across all current DIOPT species.
+        write_frame(merged_gene_list[merged_gene_list['num_ortho_species'] == NUM_DIOPT_SPECIES], FINAL_FILE,
+                    output_format)
+
+
+def write_frame(df, path, output_format='csv'):
+    # Writes a DataFrame to a CSV file, or to a Parquet or Arrow file with the extension of the format.
+    if output_format == 'csv':
+        df.to_csv(path)
+    else:
+        columnar.write_frame(df, columnar.output_path(path, output_format), output_format)
+
+
+def open_output(path, output_format='csv'):
+    # Opens an output file for write_results_streaming, see write_chunk.
+    if output_format == 'csv':
+        return open(path, 'w', newline='')
+    return columnar.TableWriter(columnar.output_path(path, output_format), output_format)
+
+
+def write_chunk(out, chunk, first):
+    # Appends a DataFrame to a file opened by open_output.
+    if isinstance(out, columnar.TableWriter):
+        out.write(chunk)
+    else:
+        chunk.to_csv(out, header=first)
+
+
+"""
+Name: write_results_streaming
+Description:
+
+Produces the same files as write_results while holding at most one chunk of query
+results in memory.  The ortholog counts are streamed first, keeping only the genes that are
+conserved across all DIOPT species.  The GO counts are then streamed and each chunk is
+filtered by the number of GO aspects, joined against the conserved genes, and appended
+to the output files.
+
+Arguments:
+    conn - A SQLAlchemy Connection object.
+    go_method - The method used to compute the GO term counts (see fetch_go_counts).
+    ortholog_method - The method used to compute the species counts (see fetch_ortholog_counts).
+    chunksize - The maximum number of rows fetched from the database at a time.
+    lookup_cache - Optional chadolib.cache.LookupCache for the gene symbols.
+    output_format - The format of the output files ('csv', 'parquet', or 'arrow').  The Parquet and
+                    Arrow formats read the query results with binary COPY.
+
+Returns:
+    None
+"""
+
+
+def write_results_streaming(conn, go_method='grouped', ortholog_method='query', chunksize=10000, lookup_cache=None,
+                            output_format='csv'):
+    binary = output_format != 'csv'
+    conserved_chunks = []
+    with profiling.phase('stream ortholog counts'), open_output(ORTHOLOG_COUNTS_FILE, output_format) as ortholog_out:
+        ortholog_chunks = stream_ortholog_counts(conn, method=ortholog_method, chunksize=chunksize, binary=binary)
+        for i, chunk in enumerate(chunks_or_empty(ortholog_chunks, EMPTY_ORTHOLOG_COUNTS)):
+            write_chunk(ortholog_out, chunk, i == 0)
+            conserved_chunks.append(chunk[chunk['num_ortho_species'] == NUM_DIOPT_SPECIES])
+    conserved = pd.concat(conserved_chunks)
+
+    print("Saving final gene list to {}".format(columnar.output_path(FINAL_FILE, output_format)))
+    with profiling.phase('stream GO counts'), \
+            open_output(GO_COUNTS_FILE, output_format) as go_out, \
+            open_output(FEW_GO_ASPECTS_FILE, output_format) as few_out, \
+            open_output(FINAL_FILE, output_format) as final_out:
+        go_chunks = stream_go_counts(conn, method=go_method, chunksize=chunksize, lookup_cache=lookup_cache,
+                                     binary=binary)
+        for i, chunk in enumerate(chunks_or_empty(go_chunks, EMPTY_GO_COUNTS)):
+            write_chunk(go_out, chunk, i == 0)
+            genes_few_go_aspects = chunk[chunk['num_aspects'] <= MAX_GO_ASPECTS]
+            write_chunk(few_out, genes_few_go_aspects, i == 0)
+            write_chunk(final_out, pd.merge(genes_few_go_aspects, conserved, on='fbid'), i == 0)
+
+
+def chunks_or_empty(chunks, empty):
+    # Yields the chunks of a stream, or the empty DataFrame if the stream has none, so the
+    # output files get the same header as the files written by write_results.
+    has_chunks = False
+    for chunk in chunks:
+        has_chunks = True
+        yield chunk
+    if not has_chunks:
+        yield empty
 
 
 if __name__ == "__main__":
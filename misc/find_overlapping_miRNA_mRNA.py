@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
+import argparse
+import os
 import re
 import sys
 
-import psycopg2
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chadolib import columnar, profiling  # noqa: E402
+from chadolib.query import ChadoSession, close_connections, get_connection  # noqa: E402
 
 """
 Program: find_overlapping_miRNA_mRNA.py
@@ -12,6 +16,9 @@ QuickStart:
 
 ./find_overlapping_miRNA_mRNA.py file_with_locations.txt > overlapping_features.txt
 
+# Send all locations to Chado in batches of 10,000 instead of one query per location.
+./find_overlapping_miRNA_mRNA.py --batch --chunk-size 10000 file_with_locations.txt > overlapping_features.txt
+
 Description:
 
 This script takes a file of newline delimited scaffold locations and returns a TSV
@@ -21,6 +28,32 @@ Scaffold locations are expected to use the form of <SCAFFOLD NAME>:<MIN>..<MAX>
 
 e.g. 3L:37238..59593
 
+By default, each location is looked up with its own query.  For large location files,
+the --batch option loads the parsed locations into Chado as arrays and joins them against
+featureloc in chunks (--chunk-size), streaming results back as they arrive.  Both modes
+produce the same features for each location.
+
+When the same genome release is used against many location files, the transcript
+locations can be exported once into an offline snapshot (--export-snapshot) and then
+queried locally (--snapshot) without connecting to Chado.  See transcript_index.py.
+
+# Export the transcript snapshot once.
+./find_overlapping_miRNA_mRNA.py --export-snapshot dmel_transcripts
+# Query the snapshot without connecting to Chado.
+./find_overlapping_miRNA_mRNA.py --snapshot dmel_transcripts file_with_locations.txt > output.txt
+
+Scaffold IDs and transcript symbols can be kept in a local lookup cache (--cache) that
+is shared between runs and reset automatically when the Chado release changes.  See
+chadolib/cache.py.
+
+./find_overlapping_miRNA_mRNA.py --cache --batch file_with_locations.txt > output.txt
+
+The results can also be written to a Parquet or Arrow IPC file with typed location, uniquename,
+symbol, and type columns instead of TSV.  This requires pyarrow (see chadolib/columnar.py).
+With --snapshot the columns are built straight from the snapshot arrays.
+
+./find_overlapping_miRNA_mRNA.py --batch --format parquet -o overlaps.parquet file_with_locations.txt
+
 This script uses the FlyBase public Chado database to find the overlapping
 features.
 
@@ -39,6 +72,10 @@ python3 -m venv venv
 source venv/bin/activate
 # Install psycopg2
 pip install psycopg2
+# Install numpy (only required for the --snapshot and --export-snapshot options)
+pip install numpy
+# Install pyarrow (only required for the parquet and arrow output formats)
+pip install pyarrow
 ./find_overlapping_miRNA_mRNA.py file_with_locations.txt > output.txt
 """
 
@@ -49,19 +86,22 @@ chado_db = {
     'host': 'chado.flybase.org'
 }
 
-# Dictionary to hold scaffold feature IDs
-scaffold_ids = {}
 # Sequence coordinate regex
 location_regex = re.compile(r'^(?P<scaffold>\w+):(?P<fmin>\d+)\.\.(?P<fmax>\d+)$')
 
+# Columns of the Parquet and Arrow output.
+OUTPUT_COLUMNS = ['location', 'uniquename', 'symbol', 'type']
+
 
-def get_scaffold_id(conn, scaffold_name: str = None, genus: str = 'Drosophila', species: str = 'melanogaster',
+def get_scaffold_id(session, scaffold_name: str = None, genus: str = 'Drosophila', species: str = 'melanogaster',
                     scaffold_type: str = 'golden_path'):
     """
     Fetches the feature.feature_id of the specified scaffold feature from Chado.
     This function assumes that only one unique scaffold per organism exists.
 
-    :param conn: The psycopg2 connection object for the Chado database.
+    Lookups are cached by the session, so each scaffold is only fetched from Chado once per release.
+
+    :param session: The chadolib ChadoSession for the Chado database.
     :param scaffold_name: The name of the scaffold to lookup.
     :param genus: The genus of the scaffold organism. default: 'Drosophila'
     :param species: The species of the scaffold organism. default: 'melanogaster'
@@ -71,20 +111,10 @@ def get_scaffold_id(conn, scaffold_name: str = None, genus: str = 'Drosophila',
     if scaffold_name is None:
         raise ValueError("No scaffold name specified.")
 
-    scaffold_id_query = """
-    select feature_id
-        from feature f join organism o on f.organism_id = o.organism_id
-                       join cvterm cvt on f.type_id = cvt.cvterm_id 
-        where o.genus = %s
-          and o.species = %s
-          and cvt.name = %s
-          and f.is_obsolete = false
-          and f.is_analysis = false
-          and f.name = %s
-    """
-    cur = conn.cursor()
-    cur.execute(scaffold_id_query, (genus, species, scaffold_type, scaffold_name))
-    return cur.fetchone()[0]
+    scaffold_id = session.scaffold_id(scaffold_name, genus, species, scaffold_type)
+    if scaffold_id is None:
+        raise ValueError(f"Scaffold '{scaffold_name}' not found.")
+    return scaffold_id
 
 
 def get_location_dict(location: str):
@@ -103,64 +133,332 @@ def get_location_dict(location: str):
     return None
 
 
-def get_overlapping_miRNA_mRNA(conn, location: dict = {}):
+def get_overlapping_miRNA_mRNA(session, location: dict = {}, index=None):
     """
-    Takes a Chado database connection, a location, and returns a dictionary of all miRNA /
+    Takes a Chado database session, a location, and returns a dictionary of all miRNA /
     mRNA features that overlap the given location.
 
-    :param conn: The psycopg2 connection object for the Chado database.
+    The query is prepared once per connection and only the location is sent on each call.
+    If a TranscriptIndex is passed the lookup is answered from the local snapshot and the
+    session is not used.
+
+    :param session: The chadolib ChadoSession for the Chado database.
     :param location: Dictionary containing the featureloc fields (srcfeature_id, scaffold, fmin, and fmax)
+    :param index: Optional TranscriptIndex loaded from a transcript snapshot.
     :return: Dictionary containing FlyBase ID as key and a tuple of FlyBase ID, symbol, and feature type.
     """
+    if index is not None:
+        return index.query(location['scaffold'], int(location['fmin']), int(location['fmax']))
+
     # SQL query to look for overlapping transcript features.
-    miRNA_mRNA_query = """
+    # With a lookup cache the symbols are read from the cache instead of Chado.
+    symbol_column = "''" if session.lookup_cache is not None else 'flybase.current_symbol(f.uniquename)'
+    miRNA_mRNA_query = f"""
     select f.uniquename,
-           flybase.current_symbol(f.uniquename),
+           {symbol_column},
            cvt.name
-        from featureloc_slice(%s, %s, %s) as fl join feature f on fl.feature_id=f.feature_id
+        from featureloc_slice($1, $2, $3) as fl join feature f on fl.feature_id=f.feature_id
                                                 join cvterm cvt on f.type_id=cvt.cvterm_id
-        where f.uniquename ~ '^FBtr\d+$'
+        where f.uniquename ~ '^FBtr\\d+$'
             and f.is_obsolete = false
             and f.is_analysis = false
             and cvt.name in ('miRNA','mRNA')
-        ;
     """
-    cur = conn.cursor()
-    cur.execute(miRNA_mRNA_query, (location['srcfeature_id'], location['fmin'], location['fmax']))
+    session.prepare('overlapping_miRNA_mRNA', miRNA_mRNA_query, ['integer', 'integer', 'integer'])
+    cur = session.execute('overlapping_miRNA_mRNA',
+                          (location['srcfeature_id'], int(location['fmin']), int(location['fmax'])))
+    rows = cur.fetchall()
+    if session.lookup_cache is not None:
+        symbols = session.symbols(r[0] for r in rows)
+        rows = [(fbtr, symbols.get(fbtr), feature_type) for fbtr, _, feature_type in rows]
     # Return a dictionary containing all miRNA and mRNA features that overlap the given location.
     # The dictionary key is the FBtr ID and the value is a tuple with FBtr ID, symbol, and feature type.
-    return {r[0]: r for r in cur}
+    return {r[0]: r for r in rows}
+
+
+def get_overlapping_miRNA_mRNA_batch(session, locations: list = [], chunk_size: int = 5000):
+    """
+    Takes a Chado database connection and a list of locations and yields a tuple of the location
+    index and the FlyBase ID, symbol, and feature type for every miRNA / mRNA feature that overlaps it.
+
+    Locations are sent to Chado in chunks of chunk_size as parallel arrays and joined against featureloc
+    in a single query per chunk.  The overlap test is the same one used by featureloc_slice, so the
+    features returned for each location match get_overlapping_miRNA_mRNA.  Rows are streamed from a
+    server side cursor in input order, with each feature reported once per location.  The symbols of
+    each batch of chunk_size rows are resolved with a single flybase.current_symbols call.
+
+    :param session: The chadolib ChadoSession for the Chado database.
+    :param locations: List of dictionaries containing the featureloc fields (srcfeature_id, fmin, and fmax)
+    :param chunk_size: The number of locations to send to Chado per query. default: 5000
+    :return: Generator of tuples with the location index, FlyBase ID, symbol, and feature type.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+
+    # SQL query to look for overlapping transcript features for an array of locations.
+    batch_miRNA_mRNA_query = """
+    select distinct on (loc.idx, f.uniquename)
+           loc.idx,
+           f.uniquename,
+           cvt.name
+        from unnest(%s::integer[], %s::integer[], %s::integer[])
+                 with ordinality as loc(srcfeature_id, fmin, fmax, idx)
+             join featureloc fl on fl.srcfeature_id = loc.srcfeature_id
+                               and boxquery(loc.fmin, loc.fmax) <@ boxrange(fl.fmin, fl.fmax)
+             join feature f on fl.feature_id=f.feature_id
+             join cvterm cvt on f.type_id=cvt.cvterm_id
+        where f.uniquename ~ '^FBtr\\d+$'
+            and f.is_obsolete = false
+            and f.is_analysis = false
+            and cvt.name in ('miRNA','mRNA')
+        order by loc.idx, f.uniquename
+        ;
+    """
+    for offset in range(0, len(locations), chunk_size):
+        chunk = locations[offset:offset + chunk_size]
+        # Named cursors are server side, so rows are fetched in batches of chunk_size as we go.
+        with session.conn.cursor(name='overlapping_miRNA_mRNA_batch') as cur:
+            cur.execute(batch_miRNA_mRNA_query, ([int(loc['srcfeature_id']) for loc in chunk],
+                                                 [int(loc['fmin']) for loc in chunk],
+                                                 [int(loc['fmax']) for loc in chunk]))
+            while True:
+                overlaps = cur.fetchmany(chunk_size)
+                if not overlaps:
+                    break
+                symbols = session.symbols(fbtr for _, fbtr, _ in overlaps)
+                for idx, fbtr, feature_type in overlaps:
+                    # Ordinality is 1 based and relative to the chunk.
+                    yield offset + idx - 1, fbtr, symbols.get(fbtr), feature_type
+
+
+def read_locations(location_fh):
+    """
+    Reads and parses all locations from a file handle, skipping blank lines.
+
+    :param location_fh: File handle of newline delimited locations.
+    :return: Tuple of the stripped location lines and the list of parsed location dictionaries.
+    """
+    lines = []
+    locations = []
+    for location in location_fh:
+        if not location.strip():
+            continue
+        parsed_location = get_location_dict(location)
+        if parsed_location is None:
+            raise ValueError(f"Unable to parse location '{location.strip()}'.")
+        lines.append(location.strip())
+        locations.append(parsed_location)
+    return lines, locations
+
+
+class OverlapFileWriter:
+    """
+    Writes overlapping features to a Parquet or Arrow IPC file with the OUTPUT_COLUMNS.
+    Rows are collected into columns and written in batches.
+    """
+
+    def __init__(self, path: str, output_format: str, batch_size: int = 100000):
+        """
+        :param path: The output file.
+        :param output_format: 'parquet' or 'arrow'.
+        :param batch_size: The number of rows per batch. default: 100000
+        """
+        self.pa = columnar.import_pyarrow()
+        schema = self.pa.schema([(column, self.pa.string()) for column in OUTPUT_COLUMNS])
+        self.writer = columnar.TableWriter(path, output_format, schema)
+        self.batch_size = batch_size
+        self.columns = [[] for _ in OUTPUT_COLUMNS]
+
+    def add(self, location: str, fbtr: str, symbol: str, feature_type: str):
+        for column, value in zip(self.columns, (location, fbtr, symbol, feature_type)):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_size:
+            self.flush()
+
+    def add_columns(self, locations, fbtrs, symbols, feature_types):
+        """
+        Adds whole columns, e.g. numpy string arrays.  Empty symbols are stored as nulls.
+        """
+        self.flush()
+        symbols = self.pa.array(symbols, mask=symbols == '', type=self.pa.string())
+        self.writer.write(self.pa.table([locations, fbtrs, symbols, feature_types], names=OUTPUT_COLUMNS))
+
+    def flush(self):
+        if self.columns[0]:
+            self.writer.write(self.pa.table(self.columns, names=OUTPUT_COLUMNS))
+            self.columns = [[] for _ in OUTPUT_COLUMNS]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def print_overlaps(session, location_fh, out: OverlapFileWriter = None):
+    """
+    Looks up the overlapping mRNA/miRNA features one location at a time and prints them as TSV.
+
+    :param session: The chadolib ChadoSession for the Chado database.
+    :param location_fh: File handle of newline delimited locations.
+    :param out: Optional OverlapFileWriter to write the features to instead of STDOUT.
+    """
+    for location in location_fh:
+        # Parse location strings into a dictionary.
+        parsed_location = get_location_dict(location)
+        # Add the feature_id of the scaffold to the parsed_location object
+        # as a srcfeature_id attribute. Looking up the scaffold ID is a
+        # performance optimization step for the overlap lookup step.
+        parsed_location['srcfeature_id'] = get_scaffold_id(session, parsed_location['scaffold'])
+
+        # Get all overlapping mRNA/miRNA features for this location.
+        features = get_overlapping_miRNA_mRNA(session, parsed_location)
+
+        # Print results.
+        for fbtr, feature in features.items():
+            if out is not None:
+                out.add(location.strip(), fbtr, feature[1], feature[2])
+            else:
+                print(f'{location.strip()}\t{fbtr}\t{feature[1]}\t{feature[2]}')
+
+
+def print_overlaps_batch(session, location_fh, chunk_size: int = 5000, out: OverlapFileWriter = None):
+    """
+    Parses all locations up front and prints the overlapping mRNA/miRNA features as TSV
+    using the batched lookup.
+
+    :param session: The chadolib ChadoSession for the Chado database.
+    :param location_fh: File handle of newline delimited locations.
+    :param chunk_size: The number of locations to send to Chado per query.
+    :param out: Optional OverlapFileWriter to write the features to instead of STDOUT.
+    """
+    lines, locations = read_locations(location_fh)
+    # Look up all scaffolds at once.
+    scaffold_ids = session.scaffold_ids({loc['scaffold'] for loc in locations})
+    for parsed_location in locations:
+        parsed_location['srcfeature_id'] = scaffold_ids[parsed_location['scaffold']]
+        if parsed_location['srcfeature_id'] is None:
+            raise ValueError(f"Scaffold '{parsed_location['scaffold']}' not found.")
+
+    for idx, fbtr, symbol, feature_type in get_overlapping_miRNA_mRNA_batch(session, locations, chunk_size):
+        if out is not None:
+            out.add(lines[idx], fbtr, symbol, feature_type)
+        else:
+            print(f'{lines[idx]}\t{fbtr}\t{symbol}\t{feature_type}')
+
+
+def print_overlaps_snapshot(index, location_fh, out: OverlapFileWriter = None):
+    """
+    Parses all locations and prints the overlapping mRNA/miRNA features as TSV using
+    a local transcript snapshot instead of Chado.
+
+    :param index: TranscriptIndex loaded from a transcript snapshot.
+    :param location_fh: File handle of newline delimited locations.
+    :param out: Optional OverlapFileWriter to write the features to instead of STDOUT.
+    """
+    import numpy as np
+
+    lines, locations = read_locations(location_fh)
+
+    location_idx, rows = index.query_batch([loc['scaffold'] for loc in locations],
+                                           [int(loc['fmin']) for loc in locations],
+                                           [int(loc['fmax']) for loc in locations])
+    if out is not None:
+        # Gather the columns from the snapshot arrays without building a row per feature.
+        out.add_columns(np.asarray(lines, dtype=str)[location_idx], index.uniquename[rows], index.symbol[rows],
+                        np.asarray(index.types, dtype=str)[index.type[rows]])
+        return
+    for idx, row in zip(location_idx, rows):
+        fbtr, symbol, feature_type = index.feature(row)
+        print(f'{lines[idx]}\t{fbtr}\t{symbol}\t{feature_type}')
+
+
+def close_output(out: OverlapFileWriter = None):
+    """
+    Closes the OverlapFileWriter, or the -o output file that replaced STDOUT.
+    """
+    if out is not None:
+        out.close()
+    elif sys.stdout is not sys.__stdout__:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
 
 
 if __name__ == '__main__':
-    # Get file with locations.
-    location_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Find mRNA and miRNA features overlapping scaffold locations.')
+    parser.add_argument('location_file', nargs='?',
+                        help='File of newline delimited locations, e.g. 3L:37238..59593')
+    parser.add_argument('--batch', action='store_true',
+                        help='Look up locations in batches instead of one query per location.')
+    parser.add_argument('--chunk-size', type=int, default=5000,
+                        help='Number of locations per query in batch mode. default: 5000')
+    parser.add_argument('--snapshot', metavar='DIR',
+                        help='Answer overlaps from a local transcript snapshot instead of Chado.')
+    parser.add_argument('--export-snapshot', metavar='DIR',
+                        help='Export the Chado transcript locations to a snapshot directory and exit.')
+    parser.add_argument('--cache', nargs='?', const='', metavar='DIR',
+                        help='Read scaffold IDs and symbols from the local lookup cache in DIR '
+                             '(default: ~/.cache/chadolib).  The cache is reset when the Chado release changes.')
+    parser.add_argument('-o', '--output', help='Output file. default: STDOUT')
+    columnar.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.location_file is None and args.export_snapshot is None:
+        parser.error('the location_file argument is required')
+    if args.output_format != 'tsv' and not args.output:
+        parser.error(f'--format {args.output_format} requires --output')
+    profiling.start_from_args(args, **chado_db)
+
+    out = None
+    if args.output and not args.export_snapshot:
+        if args.output_format == 'tsv':
+            sys.stdout = open(args.output, 'w')
+        else:
+            out = OverlapFileWriter(args.output, args.output_format)
+
+    if args.snapshot:
+        from transcript_index import TranscriptIndex
+
+        try:
+            with open(args.location_file, 'r') as fh, profiling.phase('find overlaps'):
+                print_overlaps_snapshot(TranscriptIndex.load(args.snapshot), fh, out)
+        except ValueError as e:
+            print(f'ERROR: {e}', file=sys.stderr)
+        finally:
+            close_output(out)
+            profiling.finish()
+        sys.exit(0)
+
     # Connect to Chado DB.
-    conn = psycopg2.connect(**chado_db)
+    conn = get_connection(**chado_db)
+    lookup_cache = None
+    if args.cache is not None:
+        from chadolib.cache import LookupCache
+
+        lookup_cache = LookupCache.open(conn, args.cache or None)
+    session = ChadoSession(conn, lookup_cache=lookup_cache)
+    if args.export_snapshot:
+        from transcript_index import export_snapshot
+
+        try:
+            with profiling.phase('export snapshot'):
+                num_rows = export_snapshot(session.conn, args.export_snapshot)
+            print(f'Exported {num_rows} transcript locations to {args.export_snapshot}', file=sys.stderr)
+        finally:
+            close_connections()
+            profiling.finish()
+        sys.exit(0)
+
     try:
-        with open(location_file, 'r') as fh:
-            for location in fh:
-                # Parse location strings into a dictionary.
-                parsed_location = get_location_dict(location)
-                name = parsed_location['scaffold']
-                # Lookup the scaffold feature_id in Chado if we don't already have it.
-                if name not in scaffold_ids:
-                    scaffold_ids[name] = get_scaffold_id(conn, name)
-
-                # Add the feature_id of the scaffold to the parsed_location object
-                # as a srcfeature_id attribute. Looking up the scaffold ID is a
-                # performance optimization step for the overlap lookup step.
-                parsed_location['srcfeature_id'] = scaffold_ids[name]
-
-                # Get all overlapping mRNA/miRNA features for this location.
-                features = get_overlapping_miRNA_mRNA(conn, parsed_location)
-
-                # Print results.
-                if len(features) > 0:
-                    for fbtr, feature in features.items():
-                        print(f'{location.strip()}\t{fbtr}\t{feature[1]}\t{feature[2]}')
+        with open(args.location_file, 'r') as fh, profiling.phase('find overlaps'):
+            if args.batch:
+                print_overlaps_batch(session, fh, args.chunk_size, out)
+            else:
+                print_overlaps(session, fh, out)
 
     except ValueError as e:
         print(f'ERROR: {e}', file=sys.stderr)
     finally:
-        conn.close()
+        close_output(out)
+        if lookup_cache is not None:
+            lookup_cache.close()
+        close_connections()
+        profiling.finish()
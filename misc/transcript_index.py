@@ -0,0 +1,234 @@
+"""
+Module: transcript_index.py
+
+Description:
+
+An offline snapshot and in-memory interval index of the Dmel mRNA and miRNA
+transcript locations in Chado.  This is used by find_overlapping_miRNA_mRNA.py
+to answer overlap queries without connecting to the database.
+
+A snapshot is a directory of NumPy arrays (one per column) plus a small JSON
+metadata file.  Rows are sorted by scaffold and fmin so that each scaffold is a
+contiguous slice, and the arrays are memory-mapped when loaded.
+
+For each scaffold the index is the array of sorted start positions plus a running
+maximum of the end positions (max-end augmentation).  For a query [fmin, fmax] the
+candidate rows are bounded by a binary search on each array and then filtered with
+a vectorized comparison.  Overlaps use the same inclusive test as featureloc_slice.
+
+e.g.
+# Export once per genome release.
+conn = psycopg2.connect(...)
+export_snapshot(conn, 'dmel_transcripts_r6')
+
+# Query as many times as needed.
+index = TranscriptIndex.load('dmel_transcripts_r6')
+index.query('3L', 37238, 59593)
+"""
+import json
+import os
+
+import numpy as np
+
+# Snapshot file names.
+META_FILE = 'meta.json'
+COLUMNS = ('fmin', 'fmax', 'max_end', 'uniquename', 'symbol', 'type')
+
+# SQL to fetch all current mRNA/miRNA transcript locations on Dmel scaffolds.
+snapshot_query = """
+select src.name,
+       fl.fmin,
+       fl.fmax,
+       f.uniquename,
+       cvt.name
+    from featureloc fl join feature f on fl.feature_id=f.feature_id
+                       join cvterm cvt on f.type_id=cvt.cvterm_id
+                       join feature src on fl.srcfeature_id=src.feature_id
+                       join cvterm src_type on src.type_id=src_type.cvterm_id
+                       join organism o on src.organism_id=o.organism_id
+    where f.uniquename ~ '^FBtr[0-9]+$'
+        and f.is_obsolete = false
+        and f.is_analysis = false
+        and cvt.name in ('miRNA','mRNA')
+        and src.is_obsolete = false
+        and src.is_analysis = false
+        and src_type.name = %s
+        and o.genus = %s
+        and o.species = %s
+    order by src.name, fl.fmin
+    ;
+"""
+
+
+def export_snapshot(conn, path: str, genus: str = 'Drosophila', species: str = 'melanogaster',
+                    scaffold_type: str = 'golden_path'):
+    """
+    Exports all mRNA / miRNA transcript locations from Chado into a snapshot directory.
+
+    :param conn: The psycopg2 connection object for the Chado database.
+    :param path: The directory to write the snapshot to.  It is created if it does not exist.
+    :param genus: The genus of the scaffold organism. default: 'Drosophila'
+    :param species: The species of the scaffold organism. default: 'melanogaster'
+    :param scaffold_type: The feature type of the scaffolds. default: 'golden_path'
+    :return: The number of transcript locations written.
+    """
+    # Only exporting needs Chado, so TranscriptIndex.load works without chadolib on the path.
+    from chadolib.symbols import resolve_symbols
+
+    cur = conn.cursor()
+    cur.execute(snapshot_query, (scaffold_type, genus, species))
+    rows = cur.fetchall()
+    # Resolve all transcript symbols in one call.
+    symbols = resolve_symbols(conn, (r[3] for r in rows))
+
+    scaffolds = {}
+    for i, row in enumerate(rows):
+        start, end = scaffolds.get(row[0], (i, i))
+        scaffolds[row[0]] = (start, i + 1)
+
+    fmin = np.array([r[1] for r in rows], dtype=np.int64)
+    fmax = np.array([r[2] for r in rows], dtype=np.int64)
+    # Running maximum of fmax within each scaffold, used to bound the candidates for a query.
+    max_end = np.empty_like(fmax)
+    for start, end in scaffolds.values():
+        max_end[start:end] = np.maximum.accumulate(fmax[start:end])
+
+    # Null symbols are stored as empty strings since the arrays are fixed width.
+    types = sorted({r[4] for r in rows})
+    arrays = {
+        'fmin': fmin,
+        'fmax': fmax,
+        'max_end': max_end,
+        'uniquename': np.array([r[3] for r in rows], dtype=str),
+        'symbol': np.array([symbols.get(r[3]) or '' for r in rows], dtype=str),
+        'type': np.array([types.index(r[4]) for r in rows], dtype=np.int8),
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name in COLUMNS:
+        np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+
+    meta = {
+        'genus': genus,
+        'species': species,
+        'scaffold_type': scaffold_type,
+        'database': conn.get_dsn_parameters().get('dbname'),
+        'num_rows': len(rows),
+        'types': types,
+        'scaffolds': {name: list(bounds) for name, bounds in scaffolds.items()},
+    }
+    with open(os.path.join(path, META_FILE), 'w') as fh:
+        json.dump(meta, fh, indent=2)
+
+    return len(rows)
+
+
+class TranscriptIndex:
+    """
+    Per scaffold interval index over a transcript snapshot.
+    """
+
+    def __init__(self, meta: dict, arrays: dict):
+        self.meta = meta
+        self.types = meta['types']
+        self.scaffolds = {name: tuple(bounds) for name, bounds in meta['scaffolds'].items()}
+        self.fmin = arrays['fmin']
+        self.fmax = arrays['fmax']
+        self.max_end = arrays['max_end']
+        self.uniquename = arrays['uniquename']
+        self.symbol = arrays['symbol']
+        self.type = arrays['type']
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """
+        Loads a snapshot directory written by export_snapshot.
+
+        :param path: The snapshot directory.
+        :param mmap: Memory-map the arrays instead of reading them into memory. default: True
+        :return: A TranscriptIndex for the snapshot.
+        """
+        with open(os.path.join(path, META_FILE), 'r') as fh:
+            meta = json.load(fh)
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in COLUMNS}
+        return cls(meta, arrays)
+
+    def feature(self, row: int):
+        """
+        Returns the FlyBase ID, symbol, and feature type for a snapshot row.
+
+        :param row: The row number in the snapshot.
+        :return: Tuple of FlyBase ID, symbol (or None), and feature type.
+        """
+        return str(self.uniquename[row]), str(self.symbol[row]) or None, self.types[self.type[row]]
+
+    def query_batch(self, scaffolds: list, fmins, fmaxs):
+        """
+        Finds all transcripts that overlap a batch of locations.
+
+        :param scaffolds: Sequence of scaffold names, one per location.
+        :param fmins: Sequence of location start positions.
+        :param fmaxs: Sequence of location end positions.
+        :return: Tuple of two arrays, the location index and the snapshot row of each overlap. Pairs are
+                 ordered by location index and FlyBase ID with each transcript reported once per location.
+        """
+        scaffolds = np.asarray(scaffolds, dtype=str)
+        fmins = np.asarray(fmins, dtype=np.int64)
+        fmaxs = np.asarray(fmaxs, dtype=np.int64)
+        query_hits = []
+        row_hits = []
+
+        for name in np.unique(scaffolds):
+            if name not in self.scaffolds:
+                continue
+            start, end = self.scaffolds[name]
+            queries = np.flatnonzero(scaffolds == name)
+            qmin = fmins[queries]
+            qmax = fmaxs[queries]
+
+            # Rows in [lo, hi) start before the query ends and have a running max end after the query starts.
+            hi = np.searchsorted(self.fmin[start:end], qmax, side='right')
+            lo = np.searchsorted(self.max_end[start:end], qmin, side='left')
+            lengths = np.clip(hi - lo, 0, None)
+            total = int(lengths.sum())
+            if total == 0:
+                continue
+
+            # Expand each [lo, hi) range into a flat array of candidate rows.
+            offsets = np.cumsum(lengths) - lengths
+            candidate_query = np.repeat(np.arange(len(queries)), lengths)
+            candidate_row = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(lo, lengths) + start
+
+            overlaps = self.fmax[candidate_row] >= qmin[candidate_query]
+            query_hits.append(queries[candidate_query[overlaps]])
+            row_hits.append(candidate_row[overlaps])
+
+        if not query_hits:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        query_hits = np.concatenate(query_hits)
+        row_hits = np.concatenate(row_hits)
+        names = self.uniquename[row_hits]
+        order = np.lexsort((names, query_hits))
+        query_hits = query_hits[order]
+        row_hits = row_hits[order]
+        names = names[order]
+
+        # Drop repeated transcripts (multiple featurelocs) for the same location.
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (query_hits[1:] != query_hits[:-1]) | (names[1:] != names[:-1])
+        return query_hits[keep], row_hits[keep]
+
+    def query(self, scaffold: str, fmin: int, fmax: int):
+        """
+        Finds all transcripts that overlap a single location.
+
+        :param scaffold: The scaffold name.
+        :param fmin: The location start position.
+        :param fmax: The location end position.
+        :return: Dictionary containing FlyBase ID as key and a tuple of FlyBase ID, symbol, and feature type.
+        """
+        _, rows = self.query_batch([scaffold], [fmin], [fmax])
+        features = (self.feature(row) for row in rows)
+        return {feature[0]: feature for feature in features}
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Program: update_ids.py
+
+Description:
+
+Validates and updates a file of FlyBase IDs against Chado with flybase.update_ids(text[])
+(see schema/ids/id_updater.sql).
+
+The input file is read in chunks.  Each chunk is loaded into a temporary table with COPY
+and resolved with a single set based flybase.update_ids call, so memory use is bounded by
+the chunk size and there is one round trip per chunk instead of one per ID.
+
+The output is a TSV with the submitted ID, the updated ID, and the status (current,
+updated, or split) in the order of the input file.  IDs that could not be found have
+empty updated ID and status columns.
+
+With --format parquet or --format arrow the results are read with binary COPY into Arrow
+columns and written to a Parquet or Arrow IPC file instead, with nulls for the IDs that could
+not be found (see chadolib/columnar.py, requires pyarrow).
+
+With --cache the results are kept in the local lookup cache, which is shared between runs and
+reset automatically when the Chado release changes (see chadolib/cache.py).  IDs that are
+already cached are answered locally and only the rest of each chunk is sent to Chado.
+
+Usage:
+python3 update_ids.py --host localhost -U flybase -d flybase ids_to_validate.tsv > update_id_output.tsv
+
+python3 update_ids.py --format parquet -o update_id_output.parquet ids_to_validate.tsv
+
+python3 update_ids.py --cache ids_to_validate.tsv > update_id_output.tsv
+"""
+import argparse
+import io
+import os
+import sys
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chadolib import columnar, profiling  # noqa: E402
+from chadolib.query import close_connections, get_connection  # noqa: E402
+
+OUTPUT_HEADER = '#submitted_id\tupdated_id\tstatus'
+
+create_submitted_ids_table = """
+create temp table if not exists submitted_ids (
+    idx serial,
+    id text
+)
+"""
+
+update_ids_query = """
+select submitted_id, updated_id, status
+    from flybase.update_ids(array(select id from submitted_ids order by idx))
+"""
+# The status is an enum, which has no binary decoder.
+update_ids_text_query = """
+select submitted_id, updated_id, status::text as status
+    from flybase.update_ids(array(select id from submitted_ids order by idx))
+"""
+
+
+def read_ids(id_fh):
+    """
+    Reads FlyBase IDs from the first column of a file, skipping blank and comment lines.
+
+    :param id_fh: File handle of newline delimited IDs.
+    :return: Generator of IDs.
+    """
+    for line in id_fh:
+        if not line.strip() or line.startswith('#'):
+            continue
+        yield line.rstrip('\r\n').split('\t')[0].strip()
+
+
+def load_id_chunks(conn, ids, chunk_size: int = 50000):
+    """
+    Loads IDs into the submitted_ids temporary table one chunk at a time.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param ids: Iterable of submitted FlyBase IDs.
+    :param chunk_size: The number of IDs per chunk. default: 50000
+    :return: Generator that yields the number of IDs in the table after each chunk is loaded.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    ids = iter(ids)
+    with conn.cursor() as cur:
+        cur.execute(create_submitted_ids_table)
+        while True:
+            chunk = list(islice(ids, chunk_size))
+            if not chunk:
+                break
+            cur.execute('truncate submitted_ids restart identity')
+            # Escape backslashes for the COPY text format.
+            buffer = io.StringIO(''.join(i.replace('\\', '\\\\') + '\n' for i in chunk))
+            cur.copy_expert('copy submitted_ids (id) from stdin', buffer)
+            yield len(chunk)
+
+
+def update_id_chunks(conn, ids, chunk_size: int = 50000):
+    """
+    Validates and updates IDs in chunks with flybase.update_ids.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param ids: Iterable of submitted FlyBase IDs.
+    :param chunk_size: The number of IDs to send to Chado per query. default: 50000
+    :return: Generator of tuples with the submitted ID, updated ID, and status.
+    """
+    for _ in load_id_chunks(conn, ids, chunk_size):
+        with conn.cursor() as cur:
+            cur.execute(update_ids_query)
+            yield from cur
+    conn.rollback()
+
+
+def update_id_batches(conn, ids, chunk_size: int = 50000):
+    """
+    Columnar version of update_id_chunks.  The results are read with binary COPY.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param ids: Iterable of submitted FlyBase IDs.
+    :param chunk_size: The number of IDs to send to Chado per query. default: 50000
+    :return: Generator of pyarrow RecordBatches with the submitted_id, updated_id, and status columns.
+    """
+    for num_ids in load_id_chunks(conn, ids, chunk_size):
+        yield from columnar.stream_record_batches(conn, update_ids_text_query, num_ids)
+    conn.rollback()
+
+
+def update_id_chunks_cached(lookup_cache, ids, chunk_size: int = 50000):
+    """
+    Version of update_id_chunks that reads the results from a lookup cache.  The IDs of each chunk
+    that are not cached yet are resolved with a single flybase.update_ids call and stored.
+
+    :param lookup_cache: chadolib.cache.LookupCache of the Chado database.
+    :param ids: Iterable of submitted FlyBase IDs.
+    :param chunk_size: The number of IDs per chunk. default: 50000
+    :return: Generator of tuples with the submitted ID, updated ID, and status.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    ids = iter(ids)
+    while True:
+        chunk = list(islice(ids, chunk_size))
+        if not chunk:
+            break
+        updated = lookup_cache.updated_ids(chunk)
+        for submitted_id in chunk:
+            for updated_id, status in updated[submitted_id]:
+                yield submitted_id, updated_id, status
+
+
+def update_id_batches_cached(lookup_cache, ids, chunk_size: int = 50000):
+    """
+    Columnar version of update_id_chunks_cached.
+
+    :param lookup_cache: chadolib.cache.LookupCache of the Chado database.
+    :param ids: Iterable of submitted FlyBase IDs.
+    :param chunk_size: The number of IDs per chunk. default: 50000
+    :return: Generator of pyarrow RecordBatches with the submitted_id, updated_id, and status columns.
+    """
+    pa = columnar.import_pyarrow()
+    schema = pa.schema([(name, pa.string()) for name in ('submitted_id', 'updated_id', 'status')])
+    rows = update_id_chunks_cached(lookup_cache, ids, chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield pa.RecordBatch.from_arrays([pa.array(column, type=pa.string()) for column in zip(*chunk)],
+                                         schema=schema)
+
+
+def write_updated_ids(rows, out=sys.stdout):
+    """
+    Writes updated ID rows in the update_id_output.tsv format.
+
+    :param rows: Iterable of tuples with the submitted ID, updated ID, and status.
+    :param out: File handle to write to. default: STDOUT
+    :return: The number of rows written.
+    """
+    num_rows = 0
+    out.write(OUTPUT_HEADER + '\n')
+    for submitted_id, updated_id, status in rows:
+        out.write(f"{submitted_id}\t{updated_id or ''}\t{status or ''}\n")
+        num_rows += 1
+    return num_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate and update FlyBase IDs.')
+    parser.add_argument('id_file', help='File of FlyBase IDs, one per line.  Use - for STDIN.')
+    parser.add_argument('-o', '--output', help='Output file. default: STDOUT')
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help='Number of IDs sent to Chado per query. default: 50000')
+    parser.add_argument("--host", help="Chado database hostname.", default="chado.flybase.org")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="flybase")
+    parser.add_argument("-W", "--password", help="Chado database password.")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="flybase")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument('--cache', nargs='?', const='', metavar='DIR',
+                        help='Read updated IDs from the local lookup cache in DIR (default: ~/.cache/chadolib).  '
+                             'The cache is reset when the Chado release changes.')
+    columnar.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.output_format != 'tsv':
+        if not args.output:
+            parser.error(f'--format {args.output_format} requires --output')
+        columnar.import_pyarrow()
+
+    profiling.start_from_args(args, host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                              port=args.port)
+    conn = get_connection(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                          port=args.port)
+    lookup_cache = None
+    if args.cache is not None:
+        from chadolib.cache import LookupCache
+
+        lookup_cache = LookupCache.open(conn, args.cache or None)
+    id_fh = sys.stdin if args.id_file == '-' else open(args.id_file, 'r')
+    out = None
+    if args.output_format == 'tsv':
+        out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        with profiling.phase('update IDs'):
+            if out is not None:
+                if lookup_cache is not None:
+                    rows = update_id_chunks_cached(lookup_cache, read_ids(id_fh), args.chunk_size)
+                else:
+                    rows = update_id_chunks(conn, read_ids(id_fh), args.chunk_size)
+                write_updated_ids(rows, out)
+            else:
+                if lookup_cache is not None:
+                    batches = update_id_batches_cached(lookup_cache, read_ids(id_fh), args.chunk_size)
+                else:
+                    batches = update_id_batches(conn, read_ids(id_fh), args.chunk_size)
+                with columnar.TableWriter(args.output, args.output_format) as writer:
+                    for batch in batches:
+                        writer.write(batch)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+        if id_fh is not sys.stdin:
+            id_fh.close()
+        if lookup_cache is not None:
+            lookup_cache.close()
+        close_connections()
+        profiling.finish()
+    sys.exit(0)
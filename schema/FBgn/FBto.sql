@@ -141,11 +141,15 @@ UPDATE gene.allele SET stocks_count = (select count(*) from flybase.get_stocks(f
 
 -- Add and populate a pub count column.
 ALTER TABLE gene.allele ADD COLUMN pub_count bigint DEFAULT 0;
-UPDATE gene.allele SET pub_count = (select flybase.pub_count(fbal_id));
+UPDATE gene.allele SET pub_count = pc.pub_count
+    FROM flybase.pub_counts(array(select fbal_id from gene.allele)) pc
+    WHERE gene.allele.fbal_id = pc.id;
 
 -- Add and populate a paper count column.
 ALTER TABLE gene.allele ADD COLUMN paper_count bigint DEFAULT 0;
-UPDATE gene.allele SET paper_count = (select flybase.pub_count_by_type(fbal_id, 'paper'));
+UPDATE gene.allele SET paper_count = pc.pub_count
+    FROM flybase.pub_counts_by_type(array(select fbal_id from gene.allele), 'paper') pc
+    WHERE gene.allele.fbal_id = pc.id;
 
 -- Add and populate a known lesion column.
 ALTER TABLE gene.allele ADD COLUMN known_lesion boolean DEFAULT false;
@@ -221,7 +225,9 @@ UPDATE gene.split_system_combination SET stocks_count = (select count(*) from fl
 
 -- Add and populate a pub count column.
 ALTER TABLE gene.split_system_combination ADD COLUMN pub_count bigint DEFAULT 0;
-UPDATE gene.split_system_combination SET pub_count = (select flybase.pub_count(fbco_id));
+UPDATE gene.split_system_combination SET pub_count = pc.pub_count
+    FROM flybase.pub_counts(array(select fbco_id from gene.split_system_combination)) pc
+    WHERE gene.split_system_combination.fbco_id = pc.id;
 
 CREATE INDEX split_system_combination_idx1 ON gene.split_system_combination (fbco_id);
 CREATE INDEX split_system_combination_idx2 ON gene.split_system_combination (symbol);
@@ -415,7 +421,9 @@ UPDATE gene.insertion SET stocks_count = (select count(*) from flybase.get_stock
 
 -- Add and populate a pub count column.
 ALTER TABLE gene.insertion ADD COLUMN pub_count bigint DEFAULT 0;
-UPDATE gene.insertion SET pub_count = (select flybase.pub_count(fbti_id));
+UPDATE gene.insertion SET pub_count = pc.pub_count
+    FROM flybase.pub_counts(array(select fbti_id from gene.insertion)) pc
+    WHERE gene.insertion.fbti_id = pc.id;
 
 ALTER TABLE gene.insertion ADD CONSTRAINT insertion_fk1 FOREIGN KEY (allele_id) REFERENCES gene.allele (id);
 ALTER TABLE gene.insertion ADD CONSTRAINT insertion_fk2 FOREIGN KEY (gene_id) REFERENCES gene.gene (feature_id);
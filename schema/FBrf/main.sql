@@ -122,3 +122,127 @@ BEGIN
 END
 $$ LANGUAGE plpgsql stable;
 COMMENT ON FUNCTION flybase.pub_count_by_type(text, text) IS 'Given a FlyBase ID, returns a count of FlyBase pub records of the specified type directly associated with it.';
+
+/**
+Set based versions of pub_count and pub_count_by_type.
+
+Given an array of FlyBase IDs, returns each distinct ID with a count of the FlyBase pub records
+directly associated with it.  Counts are computed with one grouped join per linker table
+instead of one dynamic query per ID.  A null pub_type counts pubs of all types.
+
+e.g.
+select * from flybase.pub_counts_by_type(array['FBal0000001','FBgg0000001'], 'paper');
+
+*/
+CREATE OR REPLACE FUNCTION flybase.pub_counts_by_type(ids text[], pub_type text)
+    RETURNS TABLE (id text, pub_count bigint) AS
+$$
+with input as (
+    select distinct i.id, upper(substring(i.id from 1 for 4)) as data_class
+        from unnest(ids) as i(id)
+        where i.id is not null
+),
+fbrf as (
+    select p.pub_id
+        from pub p
+        where upper(substring(p.uniquename from 1 for 4)) = 'FBRF'
+          and p.is_obsolete = false
+          and (pub_type is null or p.type_id in (select c.cvterm_id from cvterm c where c.name = pub_type))
+),
+counts as (
+    select obj.uniquename::text as id, count(*) as pub_count
+        from input join grp obj on input.id = obj.uniquename
+                   join grp_pub linker on obj.grp_id = linker.grp_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class = 'FBGG'
+          and obj.is_obsolete = false
+        group by obj.uniquename
+    union all
+    select obj.uniquename::text, count(*)
+        from input join strain obj on input.id = obj.uniquename
+                   join strain_pub linker on obj.strain_id = linker.strain_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class = 'FBSN'
+          and obj.is_obsolete = false
+        group by obj.uniquename
+    union all
+    select obj.uniquename::text, count(*)
+        from input join cell_line obj on input.id = obj.uniquename
+                   join cell_line_pub linker on obj.cell_line_id = linker.cell_line_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class = 'FBTC'
+          and obj.is_obsolete = false
+        group by obj.uniquename
+    union all
+    select obj.uniquename::text, count(*)
+        from input join humanhealth obj on input.id = obj.uniquename
+                   join humanhealth_pub linker on obj.humanhealth_id = linker.humanhealth_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class = 'FBHH'
+          and obj.is_obsolete = false
+        group by obj.uniquename
+    union all
+    select obj.uniquename::text, count(*)
+        from input join library obj on input.id = obj.uniquename
+                   join library_pub linker on obj.library_id = linker.library_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class = 'FBLC'
+          and obj.is_obsolete = false
+        group by obj.uniquename
+    union all
+    select obj.uniquename::text, count(*)
+        from input join feature obj on input.id = obj.uniquename
+                   join feature_pub linker on obj.feature_id = linker.feature_id
+                   join fbrf on linker.pub_id = fbrf.pub_id
+        where input.data_class not in ('FBGG', 'FBSN', 'FBTC', 'FBHH', 'FBLC')
+          and obj.is_obsolete = false
+        group by obj.uniquename
+)
+select input.id, coalesce(counts.pub_count, 0)::bigint
+    from input left join counts on input.id = counts.id
+    order by input.id
+$$ LANGUAGE sql stable;
+COMMENT ON FUNCTION flybase.pub_counts_by_type(text[], text) IS 'Given an array of FlyBase IDs and a pub type, returns each ID with a count of FlyBase pub records of that type (all types if null) directly associated with it.';
+
+CREATE OR REPLACE FUNCTION flybase.pub_counts(ids text[])
+    RETURNS TABLE (id text, pub_count bigint) AS
+$$
+select * from flybase.pub_counts_by_type(ids, null);
+$$ LANGUAGE sql stable;
+COMMENT ON FUNCTION flybase.pub_counts(text[]) IS 'Given an array of FlyBase IDs, returns each ID with a count of FlyBase pub records directly associated with it.';
+
+/**
+Returns the pub counts of every current object of a data class, e.g. all alleles.
+
+e.g.
+select * from flybase.data_class_pub_counts_by_type('FBal', 'paper');
+
+*/
+CREATE OR REPLACE FUNCTION flybase.data_class_pub_counts_by_type(data_class text, pub_type text)
+    RETURNS TABLE (id text, pub_count bigint) AS
+$$
+select * from flybase.pub_counts_by_type(array(
+    select uniquename from grp where upper(data_class) = 'FBGG' and is_obsolete = false and uniquename ~ '^FBgg[0-9]+$'
+    union all
+    select uniquename from strain where upper(data_class) = 'FBSN' and is_obsolete = false and uniquename ~ '^FBsn[0-9]+$'
+    union all
+    select uniquename from cell_line where upper(data_class) = 'FBTC' and is_obsolete = false and uniquename ~ '^FBtc[0-9]+$'
+    union all
+    select uniquename from humanhealth where upper(data_class) = 'FBHH' and is_obsolete = false and uniquename ~ '^FBhh[0-9]+$'
+    union all
+    select uniquename from library where upper(data_class) = 'FBLC' and is_obsolete = false and uniquename ~ '^FBlc[0-9]+$'
+    union all
+    select uniquename from feature
+        where upper(data_class) not in ('FBGG', 'FBSN', 'FBTC', 'FBHH', 'FBLC')
+          and is_obsolete = false
+          and uniquename ~ ('^' || flybase.data_class(data_class) || '[0-9]+$')
+), pub_type);
+$$ LANGUAGE sql stable;
+COMMENT ON FUNCTION flybase.data_class_pub_counts_by_type(text, text) IS 'Given a FlyBase data class (e.g. FBal) and a pub type, returns every current object of that class with a count of FlyBase pub records of that type (all types if null) directly associated with it.';
+
+CREATE OR REPLACE FUNCTION flybase.data_class_pub_counts(data_class text)
+    RETURNS TABLE (id text, pub_count bigint) AS
+$$
+select * from flybase.data_class_pub_counts_by_type(data_class, null);
+$$ LANGUAGE sql stable;
+COMMENT ON FUNCTION flybase.data_class_pub_counts(text) IS 'Given a FlyBase data class (e.g. FBal), returns every current object of that class with a count of FlyBase pub records directly associated with it.';
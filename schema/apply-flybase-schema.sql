@@ -4,6 +4,9 @@
 -- Import FBgn ID updater.
 \ir ids/id_updater.sql
 
+-- Cell lines, adds the cell_line.is_obsolete column used by the set based symbol functions.
+\ir FBtc/main.sql
+
 -- Symbol related functions.
 \ir symbols/main.sql
 
@@ -22,9 +25,6 @@
 -- Stocks
 \ir FBst/main.sql
 
--- Cell lines
-\ir FBtc/main.sql
-
 -- Pubs
 \ir FBrf/main.sql
 
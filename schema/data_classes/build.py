@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Program: build.py
+
+Description:
+
+Parallel builder for the dataclass and dataclass_relationship tables.
+
+main.sql builds every table one after another.  This script reads the same SQL files,
+following the \\ir includes of main.sql, and turns them into a dependency graph of steps.
+
+* table - CREATE TABLE ... AS and the ALTER TABLE statements that define its keys.
+* index - Each CREATE INDEX, run after its table is built.
+* fk    - Each foreign key, run after both of its tables are built.
+* script - Files that are not plain table builds (e.g. gene_annotation_counts.sql) are run
+           as a whole on one connection.
+
+A table depends on the other tables of this build that its SQL references (e.g.
+dataclass_relationship.gene_allele depends on dataclass.allele).  Steps are run as soon as
+their dependencies finish, on up to --jobs connections, so the build time is bounded by
+the slowest chain of steps instead of the sum of all of them.
+
+Tables are built under staging schemas (dataclass_staging and dataclass_relationship_staging).
+When every step has succeeded the staging tables are moved to their final names, which are
+read from the ALTER TABLE ... RENAME TO statements in main.sql (e.g. dataclass.geneV2), in a
+single transaction.  Readers see either the previous tables or the new ones and a failed
+build leaves the previous tables in place.
+
+The start and end time of every step are written to a JSON file (--timings).  A trace of
+every statement and of the flybase.* function times can be written with --profile (see
+chadolib/profiling.py).
+
+Usage:
+python3 build.py --host localhost -U flybase -d flybase --jobs 8 --timings build_timings.json
+
+# Show the steps and their dependencies without running them.
+python3 build.py --dry-run
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from chadolib import profiling  # noqa: E402
+
+MAIN_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.sql')
+
+# Schemas that hold the built tables and the staging schema used for each during a build.
+STAGING_SCHEMAS = {
+    'dataclass': 'dataclass_staging',
+    'dataclass_relationship': 'dataclass_relationship_staging',
+}
+
+table_name_re = r'((?:dataclass|dataclass_relationship)\.\w+)'
+include_re = re.compile(r'^\\ir\s+(\S+)\s*$')
+create_table_re = re.compile(r'^CREATE\s+TABLE\s+' + table_name_re + r'\s+AS\b', re.IGNORECASE | re.DOTALL)
+drop_table_re = re.compile(r'^DROP\s+TABLE\s+IF\s+EXISTS\s+' + table_name_re, re.IGNORECASE)
+alter_table_re = re.compile(r'^ALTER\s+TABLE\s+' + table_name_re + r'\s+(.*)$', re.IGNORECASE | re.DOTALL)
+rename_re = re.compile(r'^RENAME\s+TO\s+(\w+)$', re.IGNORECASE)
+foreign_key_re = re.compile(r'\bFOREIGN\s+KEY\b.*\bREFERENCES\s+' + table_name_re, re.IGNORECASE | re.DOTALL)
+create_index_re = re.compile(r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+' + table_name_re,
+                             re.IGNORECASE | re.DOTALL)
+create_schema_re = re.compile(r'^CREATE\s+SCHEMA\b', re.IGNORECASE)
+table_reference_re = re.compile(r'\b' + table_name_re + r'\b', re.IGNORECASE)
+
+
+def split_statements(sql: str):
+    """
+    Splits a SQL script into statements and psql meta-commands.
+
+    Comments are removed.  Quoted strings, quoted identifiers, and dollar quoted bodies are kept intact.
+
+    :param sql: The SQL script.
+    :return: List of statements without the trailing semicolon.
+    """
+    statements = []
+    current = []
+    i = 0
+    at_line_start = True
+    while i < len(sql):
+        c = sql[i]
+        if at_line_start and c == '\\' and not ''.join(current).strip():
+            # psql meta-command, runs to the end of the line.
+            end = sql.find('\n', i)
+            end = len(sql) if end == -1 else end
+            statements.append(sql[i:end].strip())
+            current = []
+            i = end
+            continue
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end == -1 else end
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = len(sql) if end == -1 else end + 2
+            current.append(' ')
+            continue
+        if c in ("'", '"'):
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == c:
+                    if sql.startswith(c * 2, end):
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            at_line_start = False
+            continue
+        if c == '$':
+            match = re.match(r'\$(\w*)\$', sql[i:])
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = len(sql) if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+                at_line_start = False
+                continue
+        if c == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+        current.append(c)
+        if c == '\n':
+            at_line_start = True
+        elif not c.isspace():
+            at_line_start = False
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def read_sql_files(path: str, files: list = None):
+    """
+    Returns the SQL files included by a psql script in include order.
+
+    :param path: The psql script.
+    :param files: List to add the files to.
+    :return: List of tuples with the file path and its statements.
+    """
+    files = [] if files is None else files
+    with open(path, 'r') as fh:
+        statements = split_statements(fh.read())
+    files.append((path, statements))
+    for statement in statements:
+        match = include_re.match(statement)
+        if match:
+            read_sql_files(os.path.normpath(os.path.join(os.path.dirname(path), match.group(1))), files)
+    return files
+
+
+class Step:
+    """
+    A unit of work in the build graph.
+    """
+
+    def __init__(self, name: str, kind: str, statements: list, depends_on: set = None, source: str = None):
+        self.name = name
+        self.kind = kind
+        self.statements = statements
+        self.depends_on = set(depends_on or ())
+        self.source = source
+
+    def __repr__(self):
+        return f'Step({self.name!r}, {self.kind!r}, depends_on={sorted(self.depends_on)})'
+
+
+def staging_name(table: str):
+    """
+    :param table: Schema qualified table name, e.g. dataclass.gene
+    :return: The table name in its staging schema, e.g. dataclass_staging.gene
+    """
+    schema, name = table.lower().split('.', 1)
+    return f'{STAGING_SCHEMAS[schema]}.{name}'
+
+
+def to_staging(sql: str, tables: set):
+    """
+    Rewrites references to the tables of this build to their staging names.
+    """
+    def replace(match):
+        table = match.group(1).lower()
+        return staging_name(table) if table in tables else match.group(0)
+    return table_reference_re.sub(replace, sql)
+
+
+def is_driver_statement(statement: str):
+    """
+    :param statement: A statement from split_statements.
+    :return: True for the include, schema, drop, and rename statements of the main.sql files.
+    """
+    alter = alter_table_re.match(statement)
+    return bool(include_re.match(statement) or create_schema_re.match(statement) or drop_table_re.match(statement)
+                or (alter and rename_re.match(alter.group(2).strip())))
+
+
+def build_graph(main_sql: str = MAIN_SQL):
+    """
+    Parses main.sql and the files it includes into build steps.
+
+    :param main_sql: Path to main.sql.
+    :return: Tuple of the list of steps and a dictionary of built table to final table name.
+    """
+    files = read_sql_files(main_sql)
+
+    # Final names come from the renames at the end of main.sql.
+    final_names = {}
+    for _, statements in files:
+        for statement in statements:
+            match = alter_table_re.match(statement)
+            if match and rename_re.match(match.group(2).strip()):
+                table = match.group(1).lower()
+                final_names[table] = f"{table.split('.')[0]}.{rename_re.match(match.group(2).strip()).group(1)}"
+
+    built_tables = set(final_names)
+    steps = []
+    for path, statements in files:
+        source = os.path.relpath(path, os.path.dirname(main_sql))
+        if all(is_driver_statement(s) for s in statements):
+            # main.sql files, the schemas, drops, and renames are handled by the builder.
+            continue
+        created = [create_table_re.match(s).group(1).lower() for s in statements if create_table_re.match(s)]
+        if len(created) != 1 or created[0] not in built_tables:
+            # Not a plain table build, run the whole file as is.
+            steps.append(Step(source, 'script', [s for s in statements if not include_re.match(s)],
+                              source=source))
+            continue
+
+        table = created[0]
+        table_statements = []
+        depends_on = set()
+        for statement in statements:
+            if drop_table_re.match(statement) or create_schema_re.match(statement) or include_re.match(statement):
+                # The staging schemas are created empty by the builder.
+                continue
+            index = create_index_re.match(statement)
+            alter = alter_table_re.match(statement)
+            foreign_key = foreign_key_re.search(statement) if alter else None
+            if index:
+                steps.append(Step(f'{table}:{index.group(1)}', 'index', [to_staging(statement, built_tables)],
+                                  {table}, source))
+            elif foreign_key:
+                referenced = foreign_key.group(1).lower()
+                fk_depends = {table} | ({referenced} if referenced in built_tables else set())
+                name = re.search(r'\bCONSTRAINT\s+(\w+)', statement, re.IGNORECASE)
+                steps.append(Step(f'{table}:{name.group(1) if name else referenced}', 'fk',
+                                  [to_staging(statement, built_tables)], fk_depends, source))
+            else:
+                if create_table_re.match(statement):
+                    depends_on |= {t.lower() for t in table_reference_re.findall(statement)
+                                   if t.lower() in built_tables and t.lower() != table}
+                table_statements.append(to_staging(statement, built_tables))
+        steps.append(Step(table, 'table', table_statements, depends_on, source))
+
+    step_names = {step.name for step in steps}
+    for step in steps:
+        missing = step.depends_on - step_names
+        if missing:
+            raise ValueError(f"Step '{step.name}' depends on tables that are not built: {', '.join(sorted(missing))}")
+    return steps, final_names
+
+
+def run_steps(steps: list, connect, jobs: int = 4, log=sys.stderr):
+    """
+    Runs the build steps on up to jobs connections, starting each step as soon as its
+    dependencies have finished.
+
+    :param steps: List of Steps.
+    :param connect: Function that returns a new psycopg2 connection.
+    :param jobs: The number of parallel connections.
+    :param log: File handle for progress messages.
+    :return: List of timing dictionaries, one per step.
+    """
+    by_name = {step.name: step for step in steps}
+    done = set()
+    timings = []
+    connections = queue.Queue()
+    build_start = time.time()
+
+    def run(step):
+        conn = connections.get()
+        try:
+            start = time.time()
+            with profiling.phase(step.name), conn.cursor() as cur:
+                for statement in step.statements:
+                    try:
+                        cur.execute(statement)
+                    except psycopg2.Error as e:
+                        raise RuntimeError(f"Step '{step.name}' ({step.source}) failed: {e}") from e
+            end = time.time()
+            return {'step': step.name, 'kind': step.kind, 'source': step.source,
+                    'depends_on': sorted(step.depends_on), 'start': round(start - build_start, 3),
+                    'end': round(end - build_start, 3), 'seconds': round(end - start, 3)}
+        finally:
+            connections.put(conn)
+
+    for _ in range(max(1, min(jobs, len(steps)))):
+        conn = connect()
+        conn.autocommit = True
+        connections.put(conn)
+
+    pending = dict(by_name)
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=connections.qsize()) as executor:
+            while pending or running:
+                ready = [step for step in pending.values() if step.depends_on <= done]
+                for step in ready:
+                    del pending[step.name]
+                    running[executor.submit(run, step)] = step
+                if not running:
+                    raise ValueError(f"Unresolvable dependencies for: {', '.join(sorted(pending))}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    timing = future.result()
+                    timings.append(timing)
+                    done.add(step.name)
+                    print(f"{timing['seconds']:>9.3f}s  {step.kind:<6} {step.name}", file=log)
+    finally:
+        while not connections.empty():
+            connections.get().close()
+    return timings
+
+
+def swap_tables(conn, final_names: dict):
+    """
+    Replaces the final tables with the staging tables in a single transaction.
+
+    :param conn: psycopg2 connection.
+    :param final_names: Dictionary of built table to final table name.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            for final_name in final_names.values():
+                cur.execute(f'DROP TABLE IF EXISTS {final_name} CASCADE')
+            for table, final_name in final_names.items():
+                final_schema, final_table = final_name.split('.')
+                staged = staging_name(table)
+                cur.execute(f'ALTER TABLE {staged} RENAME TO {final_table}')
+                cur.execute(f"ALTER TABLE {staged.split('.')[0]}.{final_table} SET SCHEMA {final_schema}")
+            for staging_schema in STAGING_SCHEMAS.values():
+                cur.execute(f'DROP SCHEMA IF EXISTS {staging_schema} CASCADE')
+
+
+def prepare_schemas(conn):
+    """
+    Creates the final schemas and empty staging schemas.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            for schema, staging_schema in STAGING_SCHEMAS.items():
+                cur.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+                cur.execute(f'DROP SCHEMA IF EXISTS {staging_schema} CASCADE')
+                cur.execute(f'CREATE SCHEMA {staging_schema}')
+
+
+def critical_path(timings: list):
+    """
+    Returns the chain of dependent steps that finished last.
+
+    :param timings: List of timing dictionaries from run_steps.
+    :return: List of step names from the first step of the chain to the last.
+    """
+    by_name = {timing['step']: timing for timing in timings}
+    path = []
+    current = max(timings, key=lambda t: t['end']) if timings else None
+    while current:
+        path.append(current['step'])
+        parents = [by_name[d] for d in current['depends_on'] if d in by_name]
+        current = max(parents, key=lambda t: t['end']) if parents else None
+    return list(reversed(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the dataclass tables in parallel.')
+    parser.add_argument("--host", help="Chado database hostname.", default="localhost")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="flybase")
+    parser.add_argument("-W", "--password", help="Chado database password.")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="flybase")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    parser.add_argument("-j", "--jobs", help="Number of parallel connections. default: 4", default=4, type=int)
+    parser.add_argument("--main", help="The main SQL file to build from.", default=MAIN_SQL)
+    parser.add_argument("--timings", metavar="FILE", help="Write the step timings as JSON to FILE.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the build steps and exit.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    steps, final_names = build_graph(args.main)
+    if args.dry_run:
+        for step in steps:
+            depends_on = ', '.join(sorted(step.depends_on))
+            print(f"{step.kind:<6} {step.name}" + (f"  <- {depends_on}" if depends_on else ''))
+        for table, final_name in final_names.items():
+            print(f"swap   {staging_name(table)} -> {final_name}")
+        return 0
+
+    conn_params = dict(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                       port=args.port)
+    profiling.start_from_args(args, **conn_params)
+
+    def connect():
+        return profiling.instrument(psycopg2.connect(**conn_params))
+
+    conn = connect()
+    try:
+        start = time.time()
+        with profiling.phase('prepare schemas'):
+            prepare_schemas(conn)
+        try:
+            timings = run_steps(steps, connect, args.jobs)
+        except RuntimeError as e:
+            # The previous tables are untouched, the staging schemas are left for inspection.
+            print(e, file=sys.stderr)
+            return 1
+        swap_start = time.time()
+        with profiling.phase('swap tables'):
+            swap_tables(conn, final_names)
+        end = time.time()
+    finally:
+        conn.close()
+        profiling.finish()
+
+    summary = {
+        'total_seconds': round(end - start, 3),
+        'swap_seconds': round(end - swap_start, 3),
+        'sum_of_steps_seconds': round(sum(t['seconds'] for t in timings), 3),
+        'jobs': args.jobs,
+        'critical_path': critical_path(timings),
+        'steps': sorted(timings, key=lambda t: t['start']),
+    }
+    print(f"Built {len(final_names)} tables in {summary['total_seconds']}s "
+          f"(sum of steps {summary['sum_of_steps_seconds']}s)", file=sys.stderr)
+    print(f"Critical path: {' -> '.join(summary['critical_path'])}", file=sys.stderr)
+    if args.timings:
+        with open(args.timings, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+/**
+    Per gene summary tables used by misc/conserved_darkened_genes.py.
+
+    dataclass.gene_go_aspect_count      - Experimental GO term counts by aspect for Dmel genes localized to the genome.
+    dataclass.gene_diopt_species_count  - Number of species in DIOPT orthology calls for the same genes.
+
+    Unlike the other dataclass tables these are not dropped and rebuilt on every load.  Each row stores a
+    signature of the source rows it was computed from and of the columns the counts depend on.
+        GO        - feature_cvterm ID and cvterm_id, feature_cvtermprop ID, type_id and value.
+        Orthologs - feature_relationship ID, subject_id and type_id, feature_relationshipprop ID and value,
+                    and the organism_id, is_analysis and is_obsolete of the subject feature.
+    A refresh only recomputes genes whose signature changed, were added, or were removed since the last build.
+
+    Changes to the cvterm and cv rows that are referenced (e.g. a GO term renamed or moved to another cv, or
+    a renamed evidence_code, NOT or orthologous_to term) do not change the signature.  Use a full rebuild
+    after such changes.
+
+    -- Incremental refresh.
+    SELECT * FROM flybase.refresh_gene_annotation_counts();
+    -- Full rebuild.
+    SELECT * FROM flybase.refresh_gene_annotation_counts(true);
+*/
+
+CREATE SCHEMA IF NOT EXISTS dataclass;
+CREATE SCHEMA IF NOT EXISTS flybase;
+
+CREATE TABLE IF NOT EXISTS dataclass.gene_go_aspect_count
+(
+    feature_id         integer PRIMARY KEY,
+    id                 text    NOT NULL,
+    biological_process integer NOT NULL,
+    molecular_function integer NOT NULL,
+    cellular_component integer NOT NULL,
+    source_signature   text    NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dataclass.gene_diopt_species_count
+(
+    feature_id        integer PRIMARY KEY,
+    id                text    NOT NULL,
+    num_ortho_species integer NOT NULL,
+    source_signature  text    NOT NULL
+);
+
+-- History of refreshes.
+CREATE TABLE IF NOT EXISTS dataclass.gene_annotation_count_build
+(
+    build_id        serial PRIMARY KEY,
+    table_name      text        NOT NULL,
+    full_rebuild    boolean     NOT NULL,
+    genes_refreshed integer     NOT NULL,
+    genes_removed   integer     NOT NULL,
+    built_at        timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS gene_go_aspect_count_idx1 ON dataclass.gene_go_aspect_count (id);
+CREATE INDEX IF NOT EXISTS gene_go_aspect_count_idx2 ON dataclass.gene_go_aspect_count (biological_process);
+CREATE INDEX IF NOT EXISTS gene_go_aspect_count_idx3 ON dataclass.gene_go_aspect_count (molecular_function);
+CREATE INDEX IF NOT EXISTS gene_go_aspect_count_idx4 ON dataclass.gene_go_aspect_count (cellular_component);
+CREATE UNIQUE INDEX IF NOT EXISTS gene_diopt_species_count_idx1 ON dataclass.gene_diopt_species_count (id);
+CREATE INDEX IF NOT EXISTS gene_diopt_species_count_idx2 ON dataclass.gene_diopt_species_count (num_ortho_species);
+
+
+/**
+This function returns the Dmel genes that have been localized to the genome.
+*/
+CREATE OR REPLACE FUNCTION flybase.localized_dmel_genes()
+    RETURNS TABLE
+            (
+                feature_id integer,
+                uniquename text
+            )
+AS
+$$
+SELECT DISTINCT gene.feature_id, gene.uniquename
+FROM feature gene
+         JOIN cvterm cvt ON gene.type_id = cvt.cvterm_id
+         JOIN organism org ON gene.organism_id = org.organism_id
+         JOIN featureloc fl ON gene.feature_id = fl.feature_id
+WHERE gene.uniquename ~ '^FBgn[0-9]+$'
+  AND gene.is_obsolete = false
+  AND gene.is_analysis = false
+  AND cvt.name = 'gene'
+  AND org.genus = 'Drosophila'
+  AND org.species = 'melanogaster'
+    ;
+$$ LANGUAGE SQL STABLE;
+
+
+/**
+Recomputes the experimental GO term counts of genes that changed since the last refresh
+and returns the number of genes that were recomputed.
+*/
+CREATE OR REPLACE FUNCTION flybase.refresh_gene_go_aspect_count(full_rebuild boolean DEFAULT false)
+    RETURNS integer AS
+$$
+DECLARE
+    num_refreshed integer;
+    num_removed   integer;
+BEGIN
+    DROP TABLE IF EXISTS pg_temp.gene_go_signature;
+    DROP TABLE IF EXISTS pg_temp.gene_go_changed;
+
+    -- Current signature of the GO annotations for each gene.
+    CREATE TEMP TABLE gene_go_signature ON COMMIT DROP AS
+    SELECT gene.feature_id,
+           gene.uniquename                         AS id,
+           md5(coalesce(string_agg(concat_ws(':', fcvt.feature_cvterm_id, fcvt.cvterm_id,
+                                             fcvtp.feature_cvtermprop_id, fcvtp.type_id, fcvtp.value),
+                                   ',' ORDER BY fcvt.feature_cvterm_id, fcvtp.feature_cvtermprop_id), '')) AS source_signature
+    FROM flybase.localized_dmel_genes() gene
+             LEFT JOIN feature_cvterm fcvt ON gene.feature_id = fcvt.feature_id
+             LEFT JOIN feature_cvtermprop fcvtp ON fcvt.feature_cvterm_id = fcvtp.feature_cvterm_id
+    GROUP BY gene.feature_id, gene.uniquename;
+
+    CREATE TEMP TABLE gene_go_changed ON COMMIT DROP AS
+    SELECT sig.*
+    FROM gene_go_signature sig
+             LEFT JOIN dataclass.gene_go_aspect_count current ON sig.feature_id = current.feature_id
+    WHERE full_rebuild
+       OR current.feature_id IS NULL
+       OR current.source_signature <> sig.source_signature;
+
+    -- Remove genes that are no longer current or localized.
+    DELETE
+    FROM dataclass.gene_go_aspect_count current
+    WHERE NOT EXISTS(SELECT 1 FROM gene_go_signature sig WHERE sig.feature_id = current.feature_id);
+    GET DIAGNOSTICS num_removed = ROW_COUNT;
+
+    DELETE
+    FROM dataclass.gene_go_aspect_count current
+    WHERE current.feature_id IN (SELECT feature_id FROM gene_go_changed);
+
+    INSERT INTO dataclass.gene_go_aspect_count
+    SELECT changed.feature_id,
+           changed.id,
+           coalesce(go_counts.biological_process, 0),
+           coalesce(go_counts.molecular_function, 0),
+           coalesce(go_counts.cellular_component, 0),
+           changed.source_signature
+    FROM gene_go_changed changed
+             LEFT JOIN (
+        SELECT fcvt.feature_id,
+               count(DISTINCT cvt.name) FILTER (WHERE cv.name = 'biological_process') AS biological_process,
+               count(DISTINCT cvt.name) FILTER (WHERE cv.name = 'molecular_function') AS molecular_function,
+               count(DISTINCT cvt.name) FILTER (WHERE cv.name = 'cellular_component') AS cellular_component
+        FROM feature_cvterm fcvt
+                 JOIN cvterm cvt ON fcvt.cvterm_id = cvt.cvterm_id
+                 JOIN cv ON cvt.cv_id = cv.cv_id
+                 JOIN feature_cvtermprop ev_code ON fcvt.feature_cvterm_id = ev_code.feature_cvterm_id
+                 JOIN cvterm ev_code_type ON ev_code.type_id = ev_code_type.cvterm_id
+        WHERE fcvt.feature_id IN (SELECT feature_id FROM gene_go_changed)
+          AND cv.name IN ('biological_process', 'molecular_function', 'cellular_component')
+          -- Ignore terms that have been annotated with 'NOT'
+          AND NOT EXISTS(
+                SELECT 1
+                FROM feature_cvtermprop fcvtp
+                         JOIN cvterm fcvtp_type ON fcvtp.type_id = fcvtp_type.cvterm_id
+                WHERE fcvtp.feature_cvterm_id = fcvt.feature_cvterm_id
+                  AND fcvtp_type.name = 'NOT'
+            )
+          -- Select only experimental terms, no annotations from predictions.
+          AND ev_code_type.name = 'evidence_code'
+          AND ev_code.value ~
+              'inferred from (physical interaction|direct assay|genetic interaction|mutant phenotype|expression pattern|(high throughput (experiment|direct assay|expression pattern|genetic interaction|mutant phenotype)))'
+        GROUP BY fcvt.feature_id
+    ) go_counts ON changed.feature_id = go_counts.feature_id;
+    GET DIAGNOSTICS num_refreshed = ROW_COUNT;
+
+    INSERT INTO dataclass.gene_annotation_count_build (table_name, full_rebuild, genes_refreshed, genes_removed)
+    VALUES ('gene_go_aspect_count', full_rebuild, num_refreshed, num_removed);
+
+    RETURN num_refreshed;
+END
+$$ LANGUAGE plpgsql VOLATILE;
+COMMENT ON FUNCTION flybase.refresh_gene_go_aspect_count(boolean) IS 'Recomputes dataclass.gene_go_aspect_count for genes whose GO annotations changed since the last refresh (or all genes for a full rebuild).';
+
+
+/**
+Recomputes the DIOPT ortholog species counts of genes that changed since the last refresh
+and returns the number of genes that were recomputed.
+*/
+CREATE OR REPLACE FUNCTION flybase.refresh_gene_diopt_species_count(full_rebuild boolean DEFAULT false)
+    RETURNS integer AS
+$$
+DECLARE
+    num_refreshed integer;
+    num_removed   integer;
+BEGIN
+    DROP TABLE IF EXISTS pg_temp.gene_ortholog_signature;
+    DROP TABLE IF EXISTS pg_temp.gene_ortholog_changed;
+
+    -- Current signature of the relationships where each gene is the object, and of their subjects.
+    CREATE TEMP TABLE gene_ortholog_signature ON COMMIT DROP AS
+    SELECT gene.feature_id,
+           gene.uniquename AS id,
+           md5(coalesce(string_agg(concat_ws(':', fr.feature_relationship_id, fr.subject_id, fr.type_id,
+                                             subject.organism_id, subject.is_analysis, subject.is_obsolete,
+                                             frp.feature_relationshipprop_id, frp.value),
+                                   ',' ORDER BY fr.feature_relationship_id, frp.feature_relationshipprop_id), '')) AS source_signature
+    FROM flybase.localized_dmel_genes() gene
+             LEFT JOIN feature_relationship fr ON gene.feature_id = fr.object_id
+             LEFT JOIN feature subject ON fr.subject_id = subject.feature_id
+             LEFT JOIN feature_relationshipprop frp ON fr.feature_relationship_id = frp.feature_relationship_id
+    GROUP BY gene.feature_id, gene.uniquename;
+
+    CREATE TEMP TABLE gene_ortholog_changed ON COMMIT DROP AS
+    SELECT sig.*
+    FROM gene_ortholog_signature sig
+             LEFT JOIN dataclass.gene_diopt_species_count current ON sig.feature_id = current.feature_id
+    WHERE full_rebuild
+       OR current.feature_id IS NULL
+       OR current.source_signature <> sig.source_signature;
+
+    -- Remove genes that are no longer current or localized.
+    DELETE
+    FROM dataclass.gene_diopt_species_count current
+    WHERE NOT EXISTS(SELECT 1 FROM gene_ortholog_signature sig WHERE sig.feature_id = current.feature_id);
+    GET DIAGNOSTICS num_removed = ROW_COUNT;
+
+    DELETE
+    FROM dataclass.gene_diopt_species_count current
+    WHERE current.feature_id IN (SELECT feature_id FROM gene_ortholog_changed);
+
+    INSERT INTO dataclass.gene_diopt_species_count
+    SELECT changed.feature_id,
+           changed.id,
+           coalesce(ortho_counts.num_ortho_species, 0),
+           changed.source_signature
+    FROM gene_ortholog_changed changed
+             LEFT JOIN (
+        SELECT ortho_rel.object_id                AS feature_id,
+               count(DISTINCT fbog.organism_id) AS num_ortho_species
+        FROM feature_relationship ortho_rel
+                 JOIN feature fbog ON ortho_rel.subject_id = fbog.feature_id
+                 JOIN cvterm fr_type ON ortho_rel.type_id = fr_type.cvterm_id
+                 JOIN feature_relationshipprop frp ON ortho_rel.feature_relationship_id = frp.feature_relationship_id
+        WHERE ortho_rel.object_id IN (SELECT feature_id FROM gene_ortholog_changed)
+          AND fbog.is_analysis = false
+          AND fbog.is_obsolete = false
+          AND fr_type.name = 'orthologous_to'
+          AND frp.value = 'DIOPT'
+        GROUP BY ortho_rel.object_id
+    ) ortho_counts ON changed.feature_id = ortho_counts.feature_id;
+    GET DIAGNOSTICS num_refreshed = ROW_COUNT;
+
+    INSERT INTO dataclass.gene_annotation_count_build (table_name, full_rebuild, genes_refreshed, genes_removed)
+    VALUES ('gene_diopt_species_count', full_rebuild, num_refreshed, num_removed);
+
+    RETURN num_refreshed;
+END
+$$ LANGUAGE plpgsql VOLATILE;
+COMMENT ON FUNCTION flybase.refresh_gene_diopt_species_count(boolean) IS 'Recomputes dataclass.gene_diopt_species_count for genes whose ortholog relationships changed since the last refresh (or all genes for a full rebuild).';
+
+
+CREATE OR REPLACE FUNCTION flybase.refresh_gene_annotation_counts(full_rebuild boolean DEFAULT false)
+    RETURNS TABLE
+            (
+                table_name      text,
+                genes_refreshed integer
+            )
+AS
+$$
+SELECT 'gene_go_aspect_count', flybase.refresh_gene_go_aspect_count(full_rebuild)
+UNION ALL
+SELECT 'gene_diopt_species_count', flybase.refresh_gene_diopt_species_count(full_rebuild);
+$$ LANGUAGE SQL VOLATILE;
+COMMENT ON FUNCTION flybase.refresh_gene_annotation_counts(boolean) IS 'Refreshes the dataclass GO aspect and DIOPT species count tables used by the conserved darkened genes analysis.';
+
+SELECT *
+FROM flybase.refresh_gene_annotation_counts();
+
+ANALYZE dataclass.gene_go_aspect_count;
+ANALYZE dataclass.gene_diopt_species_count;
@@ -29,6 +29,9 @@ DROP TABLE IF EXISTS dataclass_relationship.gene_alleleV2 CASCADE;
 \ir gene_group.sql
 \ir ortholog.sql
 
+-- Incrementally refreshed GO / DIOPT count tables, these are not renamed below.
+\ir gene_annotation_counts.sql
+
 \ir ../data_class_relationships/main.sql
 
 ALTER TABLE dataclass.gene RENAME TO geneV2;
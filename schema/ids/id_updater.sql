@@ -69,15 +69,50 @@ $$ language plpgsql stable;
 comment on function flybase.update_ids(text) is 'Accepts a single FlyBase ID and tries to validate and update it based on the current database.  Returns a 3 column result set of the submitted ID, updated ID, and conversion status.';
 
 -- Function to operate on a list of IDs.
+-- All IDs are resolved with set based joins instead of calling flybase.update_ids(text) once per ID.
+-- Results are returned in the order of the submitted IDs.
 create or replace function flybase.update_ids (ids text[]) returns setof flybase.updated_id as $$
-declare
-  id text;
-begin
-  foreach id in array ids loop 
-    return query select * from flybase.update_ids(id);
-  end loop;
-  return;
-end
-$$ language plpgsql stable;
+with submitted as (
+  select s.id, s.idx
+    from unnest(ids) with ordinality as s(id, idx)
+),
+-- Submitted IDs that are current.
+current_ids as (
+  select distinct on (s.idx) s.idx, s.id, f.uniquename
+    from submitted s join feature f on (s.id=f.uniquename)
+    where f.is_obsolete = false
+    order by s.idx
+),
+-- Secondary IDs due to a merge or a split.  More than one row for an ID is due to a split.
+secondary_ids as (
+  select s.idx, s.id, f.uniquename,
+         count(*) over (partition by s.idx) as num_rows
+    from submitted s join dbxref dbx on (s.id=dbx.accession)
+                     join db on (dbx.db_id=db.db_id)
+                     join feature_dbxref fdbx on (dbx.dbxref_id=fdbx.dbxref_id)
+                     join feature f on (fdbx.feature_id=f.feature_id)
+    where fdbx.is_current=false
+      and lower(db.name) = 'flybase'
+      and upper(substring(f.uniquename from 1 for 4)) = upper(substring(s.id from 1 for 4))
+      and f.is_obsolete = false
+      and not exists (select 1 from current_ids c where c.idx = s.idx)
+)
+select id, updated_id, status
+  from (
+    select idx, id, uniquename as updated_id, 'current'::flybase.update_status as status
+      from current_ids
+    union all
+    select idx, id, uniquename,
+           (case when num_rows > 1 then 'split' else 'updated' end)::flybase.update_status
+      from secondary_ids
+    union all
+    -- IDs that could not be found.
+    select idx, id, null, null
+      from submitted s
+      where not exists (select 1 from current_ids c where c.idx = s.idx)
+        and not exists (select 1 from secondary_ids sec where sec.idx = s.idx)
+  ) updated
+  order by idx, updated_id
+$$ language sql stable;
 
-comment on function flybase.update_ids(text[]) is 'Accepts an array of FlyBase IDs and tries to validate and update it based on the current database.  Returns a 3 column result set of the submitted ID, updated ID, and conversion status.'
+comment on function flybase.update_ids(text[]) is 'Accepts an array of FlyBase IDs and tries to validate and update it based on the current database.  Returns a 3 column result set of the submitted ID, updated ID, and conversion status.';
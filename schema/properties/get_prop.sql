@@ -41,3 +41,101 @@ WHERE gm.grpmember_id = $1
   AND cvt.is_obsolete = 0
     ;
 $$ LANGUAGE SQL STABLE;
+
+/**
+Set based property functions.
+
+The functions above match the type pattern with SIMILAR TO against cvterm on every call.  The
+functions below resolve the pattern to the matching cvterm_ids once per query and take arrays
+of object IDs, so a whole set of objects can be handled with a single join instead of one
+lateral call per object.
+
+e.g.
+SELECT * FROM flybase.get_featureprops(ARRAY['FBgn0000490','FBgn0000491'], 'gene_summary_text');
+SELECT * FROM flybase.count_featureprops(ARRAY(SELECT uniquename FROM feature WHERE uniquename ~ '^FBgn\d+$'), 'gene_summary_text');
+
+*/
+CREATE OR REPLACE FUNCTION flybase.prop_type_ids(type text)
+    RETURNS integer[] AS
+$$
+SELECT ARRAY(
+    SELECT cvt.cvterm_id
+    FROM cvterm cvt
+    WHERE cvt.name SIMILAR TO $1
+      AND cvt.is_obsolete = 0
+    );
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.prop_type_ids(text) IS 'Given a SIMILAR TO pattern, returns the cvterm_ids of the current cvterms with a matching name.';
+
+CREATE OR REPLACE FUNCTION flybase.get_featureprops(ids text[], type text)
+    RETURNS TABLE (id text, featureprop_id integer, feature_id integer, type_id integer, value text, rank integer) AS
+$$
+SELECT f.uniquename::text, fp.featureprop_id, fp.feature_id, fp.type_id, fp.value, fp.rank
+FROM feature f
+         JOIN featureprop fp ON f.feature_id = fp.feature_id
+WHERE f.uniquename = ANY ($1)
+  AND f.is_obsolete = false
+  AND fp.type_id = ANY (flybase.prop_type_ids($2))
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.get_featureprops(text[], text) IS 'Given an array of FlyBase IDs and a type pattern, returns the matching featureprops of each ID.';
+
+CREATE OR REPLACE FUNCTION flybase.count_featureprops(ids text[], type text)
+    RETURNS TABLE (id text, prop_count bigint) AS
+$$
+SELECT i.id, count(fp.featureprop_id)
+FROM (SELECT DISTINCT unnest($1) AS id) i
+         LEFT JOIN flybase.get_featureprops($1, $2) fp ON i.id = fp.id
+WHERE i.id IS NOT NULL
+GROUP BY i.id
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.count_featureprops(text[], text) IS 'Given an array of FlyBase IDs and a type pattern, returns each ID with a count of its matching featureprops.';
+
+CREATE OR REPLACE FUNCTION flybase.get_pubprops(ids text[], type text)
+    RETURNS TABLE (id text, pubprop_id integer, pub_id integer, type_id integer, value text, rank integer) AS
+$$
+SELECT p.uniquename::text, pp.pubprop_id, pp.pub_id, pp.type_id, pp.value, pp.rank
+FROM pub p
+         JOIN pubprop pp ON pp.pub_id = p.pub_id
+WHERE p.uniquename = ANY ($1)
+  AND p.is_obsolete = false
+  AND pp.type_id = ANY (flybase.prop_type_ids($2))
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.get_pubprops(text[], text) IS 'Given an array of FlyBase pub IDs and a type pattern, returns the matching pubprops of each ID.';
+
+CREATE OR REPLACE FUNCTION flybase.count_pubprops(ids text[], type text)
+    RETURNS TABLE (id text, prop_count bigint) AS
+$$
+SELECT i.id, count(pp.pubprop_id)
+FROM (SELECT DISTINCT unnest($1) AS id) i
+         LEFT JOIN flybase.get_pubprops($1, $2) pp ON i.id = pp.id
+WHERE i.id IS NOT NULL
+GROUP BY i.id
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.count_pubprops(text[], text) IS 'Given an array of FlyBase pub IDs and a type pattern, returns each ID with a count of its matching pubprops.';
+
+CREATE OR REPLACE FUNCTION flybase.get_grpmemberprops(grpmember_ids integer[], type text)
+    RETURNS SETOF grpmemberprop AS
+$$
+SELECT gmp.*
+FROM grpmemberprop gmp
+WHERE gmp.grpmember_id = ANY ($1)
+  AND gmp.type_id = ANY (flybase.prop_type_ids($2))
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.get_grpmemberprops(integer[], text) IS 'Given an array of grpmember_ids and a type pattern, returns the matching grpmemberprops.';
+
+CREATE OR REPLACE FUNCTION flybase.count_grpmemberprops(grpmember_ids integer[], type text)
+    RETURNS TABLE (grpmember_id integer, prop_count bigint) AS
+$$
+SELECT i.grpmember_id, count(gmp.grpmemberprop_id)
+FROM (SELECT DISTINCT unnest($1) AS grpmember_id) i
+         LEFT JOIN flybase.get_grpmemberprops($1, $2) gmp ON i.grpmember_id = gmp.grpmember_id
+WHERE i.grpmember_id IS NOT NULL
+GROUP BY i.grpmember_id
+    ;
+$$ LANGUAGE SQL STABLE;
+COMMENT ON FUNCTION flybase.count_grpmemberprops(integer[], text) IS 'Given an array of grpmember_ids and a type pattern, returns each grpmember_id with a count of its matching grpmemberprops.';
@@ -98,3 +98,115 @@ begin
 end
 $$ language plpgsql stable;
 comment on function flybase.current_fullname(text) is 'Given a feature.uniquename, this function returns a single current fullname or null if none exists.';
+
+/**
+Set based version of flybase.current_synonym for an array of FlyBase IDs.
+
+The IDs are grouped by data class and the synonyms for each class are resolved
+with a single join instead of one dynamic query per ID.  Returns one row per
+distinct input ID with the current synonym of the given type or null.
+
+e.g.
+select * from flybase.current_synonyms(array['FBgn0000490','FBgg0000275'], 'symbol');
+*/
+create or replace function flybase.current_synonyms(ids text[], synonym_type text)
+    returns table (id text, synonym varchar(255)) as
+$$
+with input as (
+    select distinct i.id, upper(substring(i.id from 1 for 4)) as data_class
+        from unnest(ids) as i(id)
+        where i.id is not null
+),
+resolved as (
+    -- Stocks use genotype instead of the synonym table.
+    select st.uniquename::text as id, g.uniquename::varchar(255) as synonym
+        from input join stock st on input.id = st.uniquename
+                   join stock_genotype stg on st.stock_id = stg.stock_id
+                   join genotype g on stg.genotype_id = g.genotype_id
+        where input.data_class = 'FBST'
+          and upper(synonym_type) = 'SYMBOL'
+          and st.is_obsolete = false
+    union all
+    select obj.uniquename::text, s.synonym_sgml
+        from input join grp obj on input.id = obj.uniquename
+                   join grp_synonym linker on obj.grp_id = linker.grp_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class = 'FBGG'
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+    union all
+    select obj.uniquename::text, s.synonym_sgml
+        from input join strain obj on input.id = obj.uniquename
+                   join strain_synonym linker on obj.strain_id = linker.strain_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class = 'FBSN'
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+    union all
+    select obj.uniquename::text, s.synonym_sgml
+        from input join cell_line obj on input.id = obj.uniquename
+                   join cell_line_synonym linker on obj.cell_line_id = linker.cell_line_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class = 'FBTC'
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+    union all
+    select obj.uniquename::text, s.synonym_sgml
+        from input join humanhealth obj on input.id = obj.uniquename
+                   join humanhealth_synonym linker on obj.humanhealth_id = linker.humanhealth_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class = 'FBHH'
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+    union all
+    select obj.uniquename::text, s.synonym_sgml
+        from input join library obj on input.id = obj.uniquename
+                   join library_synonym linker on obj.library_id = linker.library_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class = 'FBLC'
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+    union all
+    -- All other data classes, including stocks when a non symbol type is requested.
+    select obj.uniquename::text, s.synonym_sgml
+        from input join feature obj on input.id = obj.uniquename
+                   join feature_synonym linker on obj.feature_id = linker.feature_id
+                   join synonym s on linker.synonym_id = s.synonym_id
+                   join cvterm cvt on s.type_id = cvt.cvterm_id
+        where input.data_class not in ('FBGG', 'FBSN', 'FBTC', 'FBHH', 'FBLC')
+          and (input.data_class != 'FBST' or upper(synonym_type) != 'SYMBOL')
+          and obj.is_obsolete = false
+          and linker.is_current = true and linker.is_internal = false
+          and cvt.name = synonym_type
+)
+select distinct on (input.id) input.id, resolved.synonym
+    from input left join resolved on input.id = resolved.id
+    order by input.id
+$$ language sql stable;
+comment on function flybase.current_synonyms(text[], text) is 'Given an array of FlyBase IDs and a synonym type, returns each ID with a single current synonym of that type or null.';
+
+-- Function to fetch the current symbols for an array of IDs.
+create or replace function flybase.current_symbols(ids text[])
+    returns table (id text, symbol varchar(255)) as
+$$
+select * from flybase.current_synonyms(ids, 'symbol');
+$$ language sql stable;
+comment on function flybase.current_symbols(text[]) is 'Given an array of FlyBase IDs, returns each ID with a single current symbol or null if none exists.';
+
+-- Function to fetch the current fullnames for an array of IDs.
+create or replace function flybase.current_fullnames(ids text[])
+    returns table (id text, fullname varchar(255)) as
+$$
+select * from flybase.current_synonyms(ids, 'fullname');
+$$ language sql stable;
+comment on function flybase.current_fullnames(text[]) is 'Given an array of FlyBase IDs, returns each ID with a single current fullname or null if none exists.';
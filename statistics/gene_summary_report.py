@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Program: gene_summary_report.py
+
+Description:
+
+Produces the merged gene summary report in a single pass, replacing the two stage
+
+psql -f gene_summary_stats.sql ... > gene_summary_chado_stats.tsv
+python3 merge_chado_alliance_gene_summary_counts.py gene_summary_chado_stats.tsv alliance_summaries.tsv
+
+The query in gene_summary_stats.sql is run with COPY ... TO STDOUT (FORMAT binary) and the rows
+are decoded as they arrive (see chadolib.binary_copy) and handed to the merge step of
+merge_chado_alliance_gene_summary_counts.py in chunks.  No intermediate file is written and
+the counts are never formatted as text and parsed again.  The output is the same as the
+output of the two stage process.
+
+With --format parquet or --format arrow the merged report is written to a zstd compressed
+Parquet or Arrow IPC file with integer count columns instead (requires pyarrow).
+
+Usage:
+python3 gene_summary_report.py --host chado.flybase.org -U flybase -d flybase alliance_summaries.tsv > gene_summary_report.tsv
+
+# Compare all selection policies and write the number of genes per summary.
+python3 gene_summary_report.py --policy all --counts policy_counts.tsv alliance_summaries.tsv > gene_summary_report.tsv
+
+# Write the report as Parquet.
+python3 gene_summary_report.py --format parquet -o gene_summary_report.parquet alliance_summaries.tsv
+"""
+import argparse
+import os
+import re
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chadolib import columnar, profiling  # noqa: E402
+from chadolib.binary_copy import column_decoders, stream_copy  # noqa: E402
+from chadolib.query import close_connections, get_connection  # noqa: E402
+from merge_chado_alliance_gene_summary_counts import (CHADO_STATS_COLUMNS, DEFAULT_POLICY, POLICIES,  # noqa: E402
+                                                      get_genes_with_summaries_vectorized, merge_summary_chunks,
+                                                      write_policy_counts)
+
+GENE_SUMMARY_STATS_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gene_summary_stats.sql')
+# psql writes nulls as \N in the text COPY format used by gene_summary_stats.sql.
+COPY_TEXT_NULL = '\\N'
+
+copy_statement_re = re.compile(r'^\s*copy\s*\((.*)\)\s*to\s+stdout\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+
+
+def read_stats_query(sql_file: str = GENE_SUMMARY_STATS_SQL):
+    """
+    Reads the gene summary counts query from the copy statement of gene_summary_stats.sql.
+
+    :param sql_file: Path to gene_summary_stats.sql.
+    :return: The query inside the copy statement.
+    """
+    with open(sql_file, 'r') as sql_fh:
+        sql = sql_fh.read()
+    # Drop the leading block comment.
+    sql = re.sub(r'^\s*/\*.*?\*/', '', sql, count=1, flags=re.DOTALL)
+    match = copy_statement_re.match(sql)
+    if match is None:
+        raise ValueError(f"No 'copy (...) to stdout' statement found in {sql_file}.")
+    return match.group(1).strip()
+
+
+def stream_chado_summary_stats(conn, query: str, chunksize: int = 100000):
+    """
+    Runs the gene summary counts query and yields the rows as DataFrames in the format read
+    from the file produced by gene_summary_stats.sql.
+
+    :param conn: psycopg2 connection to the Chado database.
+    :param query: The gene summary counts query.
+    :param chunksize: The number of genes per DataFrame.
+    :return: Generator of DataFrames with the CHADO_STATS_COLUMNS.
+    """
+    columns, decoders = column_decoders(conn, query)
+    if len(columns) != len(CHADO_STATS_COLUMNS):
+        raise ValueError(f"Expected {len(CHADO_STATS_COLUMNS)} columns from the gene summary query, got {len(columns)}.")
+    for values in stream_copy(conn, query, chunk_size=chunksize, decoders=decoders, columns=True):
+        chunk = pd.DataFrame(dict(zip(CHADO_STATS_COLUMNS, values)), columns=CHADO_STATS_COLUMNS)
+        chunk['symbol'] = chunk['symbol'].fillna(COPY_TEXT_NULL)
+        yield chunk
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate the merged gene summary report from Chado.')
+    parser.add_argument('alliance_summaries', help='Alliance gene descriptions TSV')
+    parser.add_argument('-o', '--output', help='Output file. default: STDOUT')
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help='Number of genes per chunk. default: 100000')
+    parser.add_argument('--policy', action='append', choices=list(POLICIES) + ['all'],
+                        help=f'Summary selection policy, may be repeated. default: {DEFAULT_POLICY}')
+    parser.add_argument('--counts', metavar='FILE',
+                        help='Write the number of genes selected for each summary by each policy to FILE.')
+    parser.add_argument('--sql', default=GENE_SUMMARY_STATS_SQL,
+                        help='SQL file with the gene summary counts copy statement. default: gene_summary_stats.sql')
+    parser.add_argument("--host", help="Chado database hostname.", default="chado.flybase.org")
+    parser.add_argument("-U", "--username", help="Chado database username.", default="flybase")
+    parser.add_argument("-W", "--password", help="Chado database password.")
+    parser.add_argument("-d", "--dbname", help="Chado database name.", default="flybase")
+    parser.add_argument("-p", "--port", help="Chado database port.", default=5432, type=int)
+    columnar.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.output_format != 'tsv':
+        if not args.output:
+            parser.error(f'--format {args.output_format} requires --output')
+        columnar.import_pyarrow()
+
+    policies = args.policy or [DEFAULT_POLICY]
+    if 'all' in policies:
+        policies = list(POLICIES)
+    policies = list(dict.fromkeys(policies))
+
+    profiling.start_from_args(args, host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                              port=args.port)
+    with profiling.phase('read Alliance summaries'):
+        alliance_summaries = get_genes_with_summaries_vectorized(args.alliance_summaries, args.chunksize)
+    conn = get_connection(host=args.host, user=args.username, password=args.password, dbname=args.dbname,
+                          port=args.port)
+    if args.output_format != 'tsv':
+        out = columnar.TableWriter(args.output, args.output_format)
+    else:
+        out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        with profiling.phase('merge summary counts'):
+            chunks = stream_chado_summary_stats(conn, read_stats_query(args.sql), args.chunksize)
+            policy_counts = merge_summary_chunks(chunks, alliance_summaries, out, policies)
+        if args.counts:
+            with open(args.counts, 'w') as counts_fh:
+                write_policy_counts(policy_counts, counts_fh)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        close_connections()
+        profiling.finish()
+    sys.exit(0)
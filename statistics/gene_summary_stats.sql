@@ -5,76 +5,75 @@
   psql -f gene_summary_stats.sql -h chado.flybase.org -U flybase flybase > gene_summary_chado_stats.tsv
 
   This file is then consumed by merge_chado_alliance_gene_summary_counts.py to produce the final file.
+  gene_summary_report.py runs the query inside the copy statement below and merges the rows directly.
+
+  Each summary source is counted for all genes with a single grouped join.
  */
 copy (
+with genes as (
+  select feature_id, uniquename
+    from feature
+    where is_obsolete = false
+      and is_analysis = false
+      and uniquename ~ '^FBgn\d+$'
+),
+gene_snapshots as (
+  select id, prop_count as gene_snapshot
+    from flybase.count_featureprops(array(select uniquename from genes), 'gene_summary_text')
+),
+uniprot_functions as (
+  select fdbx.feature_id, count(*) as uniprot_function
+    from genes g join feature_dbxref fdbx on g.feature_id = fdbx.feature_id
+                 join dbxref dbx on fdbx.dbxref_id = dbx.dbxref_id
+                 join dbxrefprop dbxp on dbx.dbxref_id = dbxp.dbxref_id
+                 join db on dbx.db_id = db.db_id
+                 join cvterm dbxpt on dbxp.type_id = dbxpt.cvterm_id
+    where lower(dbxpt.name) = 'uniprot_function_comment'
+      and lower(db.name) = 'uniprot/swiss-prot'
+    group by fdbx.feature_id
+),
+-- Pathways (FBcv:0007034) and all other gene groups are counted in the same pass.
+gene_groups as (
+  select fgm.feature_id,
+         count(*) filter (where dbx.accession = '0007034') as flybase_pathway,
+         count(*) filter (where dbx.accession != '0007034') as flybase_group
+    from genes g join feature_grpmember fgm on g.feature_id = fgm.feature_id
+                 join grpmember gm on fgm.grpmember_id = gm.grpmember_id
+                 join cvterm gmt on gm.type_id = gmt.cvterm_id
+                 join grp on gm.grp_id = grp.grp_id
+                 join grp_cvterm g_cvt on grp.grp_id = g_cvt.grp_id
+                 join cvterm gt on g_cvt.cvterm_id = gt.cvterm_id
+                 join dbxref dbx on gt.dbxref_id = dbx.dbxref_id
+                 join db on dbx.db_id = db.db_id
+    where gmt.name = 'grpmember_feature'
+      and db.name = 'FBcv'
+    group by fgm.feature_id
+),
+interactive_fly_summaries as (
+  select fdbx.feature_id, count(*) as interactive_fly
+    from genes g join feature_dbxref fdbx on g.feature_id = fdbx.feature_id
+                 join dbxref dbx on fdbx.dbxref_id = dbx.dbxref_id
+                 join dbxrefprop dbxp on dbx.dbxref_id = dbxp.dbxref_id
+                 join db on dbx.db_id = db.db_id
+                 join cvterm dbxpt on dbxp.type_id = dbxpt.cvterm_id
+    where lower(dbxpt.name) = 'if_summary'
+      and lower(db.name) = 'interactivefly'
+      and dbxp.value is not null
+    group by fdbx.feature_id
+)
 select
   f.uniquename,
-  flybase.current_symbol(f.uniquename),
-  gene_snapshot,
-  uniprot_function,
-  flybase_pathway,
-  flybase_group,
-  interactive_fly
-  from feature f
-    left join lateral (
-      select count(*) as gene_snapshot
-      from flybase.get_featureprop(f.uniquename,'gene_summary_text')
-    ) gs on true
-
-    left join lateral (
-      select count(*) as uniprot_function
-      from feature_dbxref fdbx join dbxref dbx on fdbx.dbxref_id = dbx.dbxref_id
-                               join dbxrefprop dbxp on dbx.dbxref_id = dbxp.dbxref_id
-                               join db on dbx.db_id = db.db_id
-                               join cvterm dbxpt on dbxp.type_id = dbxpt.cvterm_id
-      where f.feature_id = fdbx.feature_id 
-        and lower(dbxpt.name) = 'uniprot_function_comment'
-        and lower(db.name) = 'uniprot/swiss-prot'
-    ) us on true
-
-    left join lateral (
-      select count(*) as flybase_pathway
-      from feature_grpmember fgm join grpmember gm on fgm.grpmember_id = gm.grpmember_id
-                                 join cvterm gmt on gm.type_id = gmt.cvterm_id
-                                 join grp on gm.grp_id = grp.grp_id
-                                 join grp_cvterm g_cvt on grp.grp_id = g_cvt.grp_id
-                                 join cvterm gt on g_cvt.cvterm_id = gt.cvterm_id
-                                 join dbxref dbx on gt.dbxref_id = dbx.dbxref_id
-                                 join db on dbx.db_id = db.db_id
-      where f.feature_id = fgm.feature_id 
-        and gmt.name = 'grpmember_feature'
-        and db.name = 'FBcv'
-        and dbx.accession = '0007034'
-    ) fbpath on true
-
-    left join lateral (
-      select count(*) as flybase_group
-      from feature_grpmember fgm join grpmember gm on fgm.grpmember_id = gm.grpmember_id
-                                 join cvterm gmt on gm.type_id = gmt.cvterm_id
-                                 join grp on gm.grp_id = grp.grp_id
-                                 join grp_cvterm g_cvt on grp.grp_id = g_cvt.grp_id
-                                 join cvterm gt on g_cvt.cvterm_id = gt.cvterm_id
-                                 join dbxref dbx on gt.dbxref_id = dbx.dbxref_id
-                                 join db on dbx.db_id = db.db_id
-      where f.feature_id = fgm.feature_id 
-        and gmt.name = 'grpmember_feature'
-        and db.name = 'FBcv'
-        and dbx.accession != '0007034'
-    ) fbgroup on true
-
-    left join lateral (
-      select count(*) as interactive_fly
-      from feature_dbxref fdbx join dbxref dbx on fdbx.dbxref_id = dbx.dbxref_id
-                               join dbxrefprop dbxp on dbx.dbxref_id = dbxp.dbxref_id
-                               join db on dbx.db_id = db.db_id
-                               join cvterm dbxpt on dbxp.type_id = dbxpt.cvterm_id
-      where f.feature_id = fdbx.feature_id 
-        and lower(dbxpt.name) = 'if_summary'
-        and lower(db.name) = 'interactivefly'
-        and dbxp.value is not null
-    ) if on true
-
-  where f.is_obsolete = false
-    and f.is_analysis = false
-    and f.uniquename ~ '^FBgn\d+$'
+  sym.symbol,
+  coalesce(gs.gene_snapshot, 0) as gene_snapshot,
+  coalesce(us.uniprot_function, 0) as uniprot_function,
+  coalesce(gg.flybase_pathway, 0) as flybase_pathway,
+  coalesce(gg.flybase_group, 0) as flybase_group,
+  coalesce(if.interactive_fly, 0) as interactive_fly
+  from genes f
+    -- Resolve the symbols of all genes in one call.
+    left join flybase.current_symbols(array(select uniquename from genes)) sym on f.uniquename = sym.id
+    left join gene_snapshots gs on f.uniquename = gs.id
+    left join uniprot_functions us on f.feature_id = us.feature_id
+    left join gene_groups gg on f.feature_id = gg.feature_id
+    left join interactive_fly_summaries if on f.feature_id = if.feature_id
 ) to stdout;
@@ -1,6 +1,77 @@
 #!/usr/bin/env python3
+import argparse
+import contextlib
+import operator
+import os
 import sys
 import csv
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chadolib import columnar  # noqa: E402
+
+# Header of the merged output.
+MERGED_HEADER = (
+    "#FBgn\tSymbol\tGene_Snapshot\tUniProt_Function\tFlyBase_Pathway\tFlyBase_Gene_Group\tInteractive_"
+    "Fly\tAlliance_Gene_Description\tSelected"
+)
+# Columns of the Chado summary stats file.
+CHADO_STATS_COLUMNS = ['fbgn', 'symbol', 'gene_snapshot', 'uniprot_function', 'flybase_pathway',
+                       'flybase_gene_group', 'interactive_fly']
+# Summary count columns that selection policies can test, in input order.
+SUMMARY_COUNT_COLUMNS = ['gene_snapshot', 'uniprot_function', 'flybase_pathway', 'flybase_gene_group',
+                         'interactive_fly', 'alliance_gene_description']
+DEFAULT_SUMMARY = "Automatic summary"
+DEFAULT_POLICY = 'current'
+
+# Comparison operators allowed in policy rules.
+RULE_OPERATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '==': operator.eq,
+}
+
+# Registry of summary selection policies.  Each policy is an ordered list of rules of the
+# form (count column, operator, value, selected summary).  The first rule that matches a gene
+# selects its summary and genes matching no rule get the DEFAULT_SUMMARY.
+# 'current' is the algorithm used for the gene report (see selected_summary).
+POLICIES = {
+    'current': [
+        ('gene_snapshot', '>=', 1, "Gene Snapshot"),
+        ('uniprot_function', '>=', 1, "UniProt Function"),
+        ('interactive_fly', '>=', 1, "Interactive Fly"),
+        ('alliance_gene_description', '>=', 1, "Alliance Gene Description"),
+    ],
+    'pathway': [
+        ('gene_snapshot', '>=', 1, "Gene Snapshot"),
+        ('uniprot_function', '>=', 1, "UniProt Function"),
+        ('flybase_pathway', '==', 1, "FlyBase Pathway"),
+        ('flybase_pathway', '>', 1, "FlyBase Pathway (multiple)"),
+        ('interactive_fly', '>=', 1, "Interactive Fly"),
+        ('alliance_gene_description', '>=', 1, "Alliance Gene Description"),
+    ],
+    'gene_group': [
+        ('gene_snapshot', '>=', 1, "Gene Snapshot"),
+        ('uniprot_function', '>=', 1, "UniProt Function"),
+        ('flybase_gene_group', '==', 1, "FlyBase Gene Group"),
+        ('flybase_gene_group', '>', 1, "FlyBase Gene Group (multiple)"),
+        ('interactive_fly', '>=', 1, "Interactive Fly"),
+        ('alliance_gene_description', '>=', 1, "Alliance Gene Description"),
+    ],
+    'pathway_gene_group': [
+        ('gene_snapshot', '>=', 1, "Gene Snapshot"),
+        ('uniprot_function', '>=', 1, "UniProt Function"),
+        ('flybase_pathway', '==', 1, "FlyBase Pathway"),
+        ('flybase_pathway', '>', 1, "FlyBase Pathway (multiple)"),
+        ('flybase_gene_group', '==', 1, "FlyBase Gene Group"),
+        ('flybase_gene_group', '>', 1, "FlyBase Gene Group (multiple)"),
+        ('interactive_fly', '>=', 1, "Interactive Fly"),
+        ('alliance_gene_description', '>=', 1, "Alliance Gene Description"),
+    ],
+}
 
 
 def get_genes_with_summaries(alliance_gs_file: str):
@@ -37,10 +108,7 @@ def merge_summary_stats(chado_summary_stats_file: str, alliance_summaries: set =
     with open(chado_summary_stats_file, 'r') as chado_stats_fh:
         reader = csv.reader(chado_stats_fh, delimiter='\t')
 
-        print(
-            "#FBgn\tSymbol\tGene_Snapshot\tUniProt_Function\tFlyBase_Pathway\tFlyBase_Gene_Group\tInteractive_"
-            "Fly\tAlliance_Gene_Description\tSelected"
-        )
+        print(MERGED_HEADER)
 
         for row in reader:
             # Append a 1 or 0 if this gene has an alliance gene summary/description.
@@ -85,6 +153,234 @@ def selected_summary(summaries: list = []):
     return selected
 
 
+class _CommentFilter:
+    """
+    Read only file wrapper that drops lines starting with '#', so the remaining lines
+    can be handed to pandas without loading the whole file.
+    """
+
+    def __init__(self, fh):
+        self._lines = (line for line in fh if line[0] != '#')
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def get_genes_with_summaries_vectorized(alliance_gs_file: str, chunksize: int = 100000):
+    """
+    Same as get_genes_with_summaries, but parses the Alliance file in chunks with pandas
+    and filters each chunk with column operations.
+
+    :param alliance_gs_file: Path to file containing the Alliance gene summaries/descriptions.
+    :param chunksize: The number of lines to parse at a time.
+    :return: set containing all FlyBase (FBgn) IDs with descriptions.
+    """
+    summaries = set()
+    with open(alliance_gs_file, 'r') as alliance_fh:
+        reader = pd.read_csv(_CommentFilter(alliance_fh), sep='\t', header=None, names=['fbgn', 'symbol', 'summary'],
+                             usecols=[0, 1, 2], dtype=str, na_filter=False, chunksize=chunksize)
+        for chunk in reader:
+            has_summary = chunk['summary'].str.lower() != 'no description available'
+            summaries.update(chunk.loc[has_summary, 'fbgn'].str.replace('FB:', '', n=1, regex=False))
+    return summaries
+
+
+def merge_summary_frame(chado_stats: pd.DataFrame, alliance_summaries=frozenset(), policies: list = None):
+    """
+    Adds the Alliance gene description flag and the selected summary of each policy to a DataFrame
+    of Chado summary stats.  With the default policy this gives the same values as merge_summary_stats
+    for every row.
+
+    :param chado_stats: DataFrame with the CHADO_STATS_COLUMNS as strings.
+    :param alliance_summaries: Collection of FlyBase (FBgn) IDs with Alliance descriptions.
+    :param policies: List of policy names from POLICIES. default: [DEFAULT_POLICY]
+    :return: DataFrame with the added alliance_gene_description column and one selected column per policy.
+    """
+    policies = policies or [DEFAULT_POLICY]
+    merged = chado_stats.copy()
+    fbgn = merged['fbgn']
+    has_alliance = fbgn.str.startswith('FBgn') & fbgn.isin(alliance_summaries)
+    merged['alliance_gene_description'] = np.where(has_alliance, '1', '0')
+
+    # Convert the count columns once and share them across all policies.
+    counts = {column: merged[column].astype(int).to_numpy() for column in SUMMARY_COUNT_COLUMNS}
+    conditions = {}
+    for policy in policies:
+        merged[selected_column(policy, policies)] = selected_summary_vectorized(counts, POLICIES[policy], conditions)
+    return merged
+
+
+def selected_column(policy: str, policies: list):
+    """
+    :param policy: The policy name.
+    :param policies: All policies being evaluated.
+    :return: The name of the selected summary column for the policy.
+    """
+    return 'selected' if len(policies) == 1 else f'selected_{policy}'
+
+
+def selected_header(policies: list):
+    """
+    :param policies: The policies being evaluated.
+    :return: The header of the merged output for the given policies.
+    """
+    if len(policies) == 1:
+        return MERGED_HEADER
+    base = MERGED_HEADER[:-len('Selected')]
+    return base + '\t'.join(f'Selected_{policy}' for policy in policies)
+
+
+def selected_summary_vectorized(counts: dict, rules: list = None, conditions: dict = None):
+    """
+    Column wise version of selected_summary for an ordered list of policy rules.
+
+    :param counts: Dictionary of count column name to a numpy array of integer counts.
+    :param rules: Ordered list of (column, operator, value, summary) rules. default: POLICIES[DEFAULT_POLICY]
+    :param conditions: Optional dictionary used to share evaluated rule conditions between policies.
+    :return: numpy array with the name of the selected summary for each row.
+    """
+    rules = rules or POLICIES[DEFAULT_POLICY]
+    conditions = {} if conditions is None else conditions
+    masks = []
+    for column, op, value, _ in rules:
+        key = (column, op, value)
+        if key not in conditions:
+            conditions[key] = RULE_OPERATORS[op](counts[column], value)
+        masks.append(conditions[key])
+    return np.select(masks, [rule[3] for rule in rules], default=DEFAULT_SUMMARY)
+
+
+def validate_policies(policies: list):
+    """
+    Checks that all policies are registered and that their rules are well formed.
+
+    :param policies: List of policy names.
+    :return:
+    """
+    for policy in policies:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown summary policy '{policy}', choose from {', '.join(POLICIES)}.")
+        for column, op, value, summary in POLICIES[policy]:
+            if column not in SUMMARY_COUNT_COLUMNS or op not in RULE_OPERATORS:
+                raise ValueError(f"Invalid rule ({column}, {op}, {value}, {summary}) in policy '{policy}'.")
+
+
+def format_rows(df: pd.DataFrame):
+    """
+    Joins the columns of each row with tabs.
+
+    :param df: DataFrame of strings.
+    :return: A single string with one line per row.
+    """
+    if df.empty:
+        return ''
+    lines = df.iloc[:, 0].str.cat(df.iloc[:, 1:].astype(str), sep='\t')
+    return '\n'.join(lines) + '\n'
+
+
+def typed_summary_frame(merged: pd.DataFrame):
+    """
+    Converts a DataFrame returned by merge_summary_frame to typed columns for the Parquet and Arrow
+    output.  The counts and the Alliance description flag become integers and missing symbols
+    (\\N in the text format) become nulls.
+
+    :param merged: DataFrame returned by merge_summary_frame.
+    :return: DataFrame with typed columns.
+    """
+    typed = merged.copy()
+    for column in SUMMARY_COUNT_COLUMNS:
+        typed[column] = typed[column].astype('int32')
+    typed['symbol'] = typed['symbol'].where(typed['symbol'] != '\\N')
+    return typed
+
+
+def read_chado_summary_stats(chado_summary_stats_file: str, chunksize: int = 100000):
+    """
+    Reads the Chado summary stats TSV in chunks.
+
+    :param chado_summary_stats_file: Path to the file produced by gene_summary_stats.sql.
+    :param chunksize: The number of lines to parse at a time.
+    :return: Iterator of DataFrames with the CHADO_STATS_COLUMNS as strings.
+    """
+    try:
+        return pd.read_csv(chado_summary_stats_file, sep='\t', header=None, names=CHADO_STATS_COLUMNS, dtype=str,
+                           na_filter=False, chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        return iter(())
+
+
+def merge_summary_stats_vectorized(chado_summary_stats_file: str, alliance_summaries=frozenset(),
+                                   out=sys.stdout, chunksize: int = 100000, policies: list = None):
+    """
+    Vectorized version of merge_summary_stats.  The Chado summary stats file is processed in
+    chunks and each chunk is written to out with a single write call.  All policies are
+    evaluated in the same pass over the file.
+
+    :param chado_summary_stats_file: Path to the file produced by gene_summary_stats.sql.
+    :param alliance_summaries: Collection of FlyBase (FBgn) IDs with Alliance descriptions.
+    :param out: File handle to write the merged TSV to, or a chadolib.columnar.TableWriter. default: STDOUT
+    :param chunksize: The number of lines to process at a time.
+    :param policies: List of policy names from POLICIES. default: [DEFAULT_POLICY]
+    :return: Dictionary of policy name to a Counter of the selected summaries.
+    """
+    chunks = read_chado_summary_stats(chado_summary_stats_file, chunksize)
+    return merge_summary_chunks(chunks, alliance_summaries, out, policies)
+
+
+def merge_summary_chunks(chunks, alliance_summaries=frozenset(), out=sys.stdout, policies: list = None):
+    """
+    Merges an iterable of Chado summary stats DataFrames with the Alliance summaries and writes
+    the merged TSV to out.  If out is a chadolib.columnar.TableWriter the merged chunks are
+    written to it with typed columns (see typed_summary_frame) instead.
+
+    :param chunks: Iterable of DataFrames with the CHADO_STATS_COLUMNS as strings.
+    :param alliance_summaries: Collection of FlyBase (FBgn) IDs with Alliance descriptions.
+    :param out: File handle to write the merged TSV to, or a chadolib.columnar.TableWriter. default: STDOUT
+    :param policies: List of policy names from POLICIES. default: [DEFAULT_POLICY]
+    :return: Dictionary of policy name to a Counter of the selected summaries.
+    """
+    policies = policies or [DEFAULT_POLICY]
+    validate_policies(policies)
+    policy_counts = {policy: Counter() for policy in policies}
+
+    table_out = isinstance(out, columnar.TableWriter)
+    if not table_out:
+        out.write(selected_header(policies) + '\n')
+    for chunk in chunks:
+        merged = merge_summary_frame(chunk, alliance_summaries, policies)
+        if table_out:
+            out.write(typed_summary_frame(merged))
+        else:
+            out.write(format_rows(merged))
+        for policy in policies:
+            policy_counts[policy].update(merged[selected_column(policy, policies)].value_counts().to_dict())
+    return policy_counts
+
+
+def write_policy_counts(policy_counts: dict, out):
+    """
+    Writes the number of genes assigned to each summary by each policy.
+
+    :param policy_counts: Dictionary of policy name to a Counter of the selected summaries.
+    :param out: File handle to write the counts TSV to.
+    :return:
+    """
+    out.write("#Policy\tSelected\tGenes\n")
+    for policy, counts in policy_counts.items():
+        for summary, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            out.write(f"{policy}\t{summary}\t{count}\n")
+    return None
+
+
 if __name__ == '__main__':
     """
     Description:
@@ -96,10 +392,67 @@ if __name__ == '__main__':
     Usage:
     python3 ./merge_chado_alliance_gene_summary_counts.py chado_summary_counts.tsv alliance_summaries.tsv
     
+    # Compare several selection policies in one pass and write the number of genes per summary.
+    python3 ./merge_chado_alliance_gene_summary_counts.py --policy current --policy pathway_gene_group \\
+        --counts policy_counts.tsv chado_summary_counts.tsv alliance_summaries.tsv
+    
+    # Use the original row by row implementation.
+    python3 ./merge_chado_alliance_gene_summary_counts.py --engine row chado_summary_counts.tsv alliance_summaries.tsv
+    
+    # Write a zstd compressed Parquet file with typed columns instead of TSV (requires pyarrow).
+    python3 ./merge_chado_alliance_gene_summary_counts.py --format parquet -o gene_summary_merged.parquet \\
+        chado_summary_counts.tsv alliance_summaries.tsv
+    
     Result:
     A TSV sent to STDOUT showing counts of summaries for each gene in FlyBase and the summary that would
     be promoted to the top of the gene report.
     """
-    alliance_summaries = get_genes_with_summaries(sys.argv[2])
-    merge_summary_stats(sys.argv[1], alliance_summaries)
+    parser = argparse.ArgumentParser(description='Merge Chado and Alliance gene summary counts.')
+    parser.add_argument('chado_summary_counts', help='TSV produced by gene_summary_stats.sql')
+    parser.add_argument('alliance_summaries', help='Alliance gene descriptions TSV')
+    parser.add_argument('--engine', choices=['vectorized', 'row'], default='vectorized',
+                        help='Process the files in vectorized chunks or one row at a time. default: vectorized')
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help='Number of lines per chunk for the vectorized engine. default: 100000')
+    parser.add_argument('--policy', action='append', choices=list(POLICIES) + ['all'],
+                        help=f'Summary selection policy, may be repeated. default: {DEFAULT_POLICY}')
+    parser.add_argument('--counts', metavar='FILE',
+                        help='Write the number of genes selected for each summary by each policy to FILE.')
+    parser.add_argument('-o', '--output', help='Output file. default: STDOUT')
+    columnar.add_arguments(parser)
+    args = parser.parse_args()
+    if args.output_format != 'tsv':
+        if not args.output:
+            parser.error(f'--format {args.output_format} requires --output')
+        if args.engine == 'row':
+            parser.error('--format requires the vectorized engine.')
+
+    policies = args.policy or [DEFAULT_POLICY]
+    if 'all' in policies:
+        policies = list(POLICIES)
+    # Keep the order given on the command line but drop repeats.
+    policies = list(dict.fromkeys(policies))
+
+    if args.engine == 'row':
+        if policies != [DEFAULT_POLICY] or args.counts:
+            parser.error('--policy and --counts require the vectorized engine.')
+        alliance_summaries = get_genes_with_summaries(args.alliance_summaries)
+        with open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout) as out, \
+                contextlib.redirect_stdout(out):
+            merge_summary_stats(args.chado_summary_counts, alliance_summaries)
+    else:
+        alliance_summaries = get_genes_with_summaries_vectorized(args.alliance_summaries, args.chunksize)
+        if args.output_format != 'tsv':
+            out = columnar.TableWriter(args.output, args.output_format)
+        else:
+            out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            policy_counts = merge_summary_stats_vectorized(args.chado_summary_counts, alliance_summaries, out=out,
+                                                           chunksize=args.chunksize, policies=policies)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if args.counts:
+            with open(args.counts, 'w') as counts_fh:
+                write_policy_counts(policy_counts, counts_fh)
     exit(0)
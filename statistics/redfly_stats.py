@@ -1,15 +1,39 @@
 #!/usr/bin/env python3
-import sys
+import argparse
 import csv
+import glob
+import mmap
+import os
 import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+fbsf_re = re.compile(r'FBsf\d+')
+# Matches the first FBsf ID in the first column of each CSV line in the raw file buffer.
+# The first column may be quoted, GA exports do not contain multi-line fields.
+fbsf_first_field_re = re.compile(rb'^(?:"[^"\n]*?|[^",\n]*?)(FBsf\d+)', re.MULTILINE)
 
 
-def process_stat_files(ga_stats_file: str, redfly_file: str):
-    fbsf_re = re.compile(r'FBsf\d+')
+def read_redfly_ids(redfly_file: str):
+    """
+    Reads the RedFly feature IDs, one per line.
 
+    :param redfly_file: Path to the file of RedFly FBsf IDs.
+    :return: List of FBsf IDs in file order.
+    """
     with open(redfly_file, 'r') as redfly_fh:
-        redfly_counts = dict.fromkeys(redfly_fh.read().splitlines(), 0)
+        return list(dict.fromkeys(redfly_fh.read().splitlines()))
 
+
+def count_fbsf_csv(ga_stats_file: str):
+    """
+    Counts the FBsf IDs in the first column of a Google Analytics CSV file.
+
+    :param ga_stats_file: Path to the Google Analytics CSV export.
+    :return: Counter of FBsf IDs.
+    """
+    counts = Counter()
     with open(ga_stats_file, newline='') as csv_fh:
         ga_reader = csv.reader(csv_fh)
         for row in ga_reader:
@@ -17,18 +41,113 @@ def process_stat_files(ga_stats_file: str, redfly_file: str):
                 if 'FBsf' in row[0]:
                     match = fbsf_re.search(row[0])
                     if match:
-                        fbsf = match.group(0)
-                        if fbsf in redfly_counts:
-                            redfly_counts[fbsf] += 1
+                        counts[match.group(0)] += 1
 
             except IndexError:
                 pass
 
+    return counts
+
+
+def count_fbsf_mmap(ga_stats_file: str):
+    """
+    Counts the FBsf IDs in the first column of a Google Analytics CSV file by running a
+    bytes regex over the memory-mapped file instead of parsing CSV rows.
+
+    :param ga_stats_file: Path to the Google Analytics CSV export.
+    :return: Counter of FBsf IDs.
+    """
+    if os.path.getsize(ga_stats_file) == 0:
+        return Counter()
+    with open(ga_stats_file, 'rb') as ga_fh:
+        with mmap.mmap(ga_fh.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            counts = Counter(match.decode('ascii') for match in fbsf_first_field_re.findall(buffer))
+    return counts
+
+
+def expand_files(patterns: list):
+    """
+    Expands file names and glob patterns into a list of files.
+
+    :param patterns: List of file names or glob patterns.
+    :return: List of file names in the order given, with each glob sorted.
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError(f"No files match '{pattern}'.")
+        files.extend(matches)
+    return list(dict.fromkeys(files))
+
+
+def process_stat_files(ga_stats_files, redfly_file: str, workers: int = None, use_mmap: bool = False):
+    """
+    Counts the Google Analytics hits for each RedFly feature.
+
+    Each file is scanned in a separate worker process and the per file counts are summed.
+
+    :param ga_stats_files: Google Analytics CSV file or list of files.
+    :param redfly_file: Path to the file of RedFly FBsf IDs.
+    :param workers: Number of worker processes. default: number of CPUs
+    :param use_mmap: Scan the memory-mapped files with a bytes regex instead of parsing CSV rows.
+    :return: Dictionary of FBsf ID to number of hits in RedFly file order.
+    """
+    if isinstance(ga_stats_files, str):
+        ga_stats_files = [ga_stats_files]
+    redfly_counts = dict.fromkeys(read_redfly_ids(redfly_file), 0)
+    count_fbsf = count_fbsf_mmap if use_mmap else count_fbsf_csv
+
+    totals = Counter()
+    if len(ga_stats_files) == 1 or workers == 1:
+        for ga_stats_file in ga_stats_files:
+            totals.update(count_fbsf(ga_stats_file))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for counts in executor.map(count_fbsf, ga_stats_files):
+                totals.update(counts)
+
+    for fbsf in redfly_counts:
+        redfly_counts[fbsf] = totals[fbsf]
     return redfly_counts
 
 
 if __name__ == '__main__':
-    counts = process_stat_files(sys.argv[1], sys.argv[2])
+    """
+    Usage:
+    python3 ./redfly_stats.py ga_stats.csv redfly_ids.txt
+
+    # A year of daily exports on 8 cores.
+    python3 ./redfly_stats.py --workers 8 --mmap -r redfly_ids.txt 'ga_exports/2023-*.csv'
+
+    Result:
+    A TSV sent to STDOUT of each RedFly FBsf ID with hits and the number of hits.
+    """
+    parser = argparse.ArgumentParser(description='Count Google Analytics hits for RedFly features.')
+    parser.add_argument('files', nargs='+',
+                        help='Google Analytics CSV files or globs. The last file is the RedFly ID file '
+                             'unless -r is given.')
+    parser.add_argument('-r', '--redfly', help='File of RedFly FBsf IDs, one per line.')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes. default: number of CPUs')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Scan memory-mapped files with a bytes regex instead of parsing CSV rows.')
+    args = parser.parse_args()
+
+    ga_patterns = args.files
+    redfly_file = args.redfly
+    if redfly_file is None:
+        if len(ga_patterns) < 2:
+            parser.error('A Google Analytics file and a RedFly ID file are required.')
+        ga_patterns, redfly_file = ga_patterns[:-1], ga_patterns[-1]
+
+    try:
+        ga_files = expand_files(ga_patterns)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+    counts = process_stat_files(ga_files, redfly_file, workers=args.workers, use_mmap=args.mmap)
     for key, value in counts.items():
         if value > 0:
             print(f'{key}\t{value}')